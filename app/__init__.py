@@ -0,0 +1,4 @@
+import time
+
+# first code executed on `import app.main`: startup timings are measured from here
+started_at = time.perf_counter()
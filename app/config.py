@@ -13,8 +13,29 @@ class _CronJob(BaseModel):
     refresh_tickers: list[str] = []
 
 
+class _Indicator(BaseModel):
+    name: str  # ema, rsi, atr, vwap
+    period: int = 14
+    tickers: list[str] = []  # empty: every ticker
+
+
+class _Retention(BaseModel):
+    keep_days: int  # candles older than this leave the table
+    action: str = "archive"  # archive (parquet files, still queryable), downsample (to `to`), drop
+    to: str | None = None  # downsample target interval, e.g. "h1"
+
+
 class Config(BaseModel):
     cronjob: _CronJob = _CronJob(refresh_tickers=[])
+    # higher timeframes built from a stored interval, e.g. {"h1": ["h4", "d1"]}. the derived series only goes
+    # as far back as its base one: yahoo serves about 730 days of h1, so d1 built from h1 is shorter than downloaded d1
+    timeframes: dict[str, list[str]] = {}
+    # indicators kept up to date per interval, e.g. {"h1": [{"name": "ema", "period": 20}]}
+    indicators: dict[str, list[_Indicator]] = {}
+    # retention per stored interval, e.g. {"m1": {"keep_days": 30, "action": "downsample", "to": "h1"}}
+    retention: dict[str, _Retention] = {}
+    # trading calendar per ticker for gap detection, e.g. {"AAPL": "XNYS"} (others: GAP_DEFAULT_CALENDAR)
+    calendars: dict[str, str] = {}
 
 
 # ---------------------------------------------------------
@@ -38,5 +59,33 @@ def load_configuration(file_path: str) -> Config | None:
         return None
 
 
+class _LazyConfig:
+    """
+    the configuration file is read and validated on first use, not at import time
+    (a missing or invalid file makes the config falsy, like load_configuration returning None)
+    """
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._config = None
+        self._loaded = False
+
+    def _get(self):
+        if not self._loaded:
+            self._config = load_configuration(self._file_path)
+            self._loaded = True
+        return self._config
+
+    def reload(self):
+        self._loaded = False
+        return self._get()
+
+    def __bool__(self):
+        return self._get() is not None
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
 configuration_file = "app/configuration.json"
-config = load_configuration(configuration_file)
+config = _LazyConfig(configuration_file)
@@ -1,23 +1,83 @@
 import asyncio
+import random
 from datetime import UTC, datetime, timezone
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-
 from app.config import config
-from app.database import db
-from app.lib.utils import Notifier
+from app.database import analyze_db, checkpoint_db, db
+from app.lib.executor import Executor
+from app.lib.leader import LeaderLease
+from app.lib.metrics import Metrics
+from app.lib.notifier import Notifier
+from app.lib.workqueue import WorkQueue
 from app.settings import logger, settings
-from app.tasks.refresh_ticker import refresh_ticker_by_interval
+from app.tasks.alerts import run_alerts
+from app.tasks.gaps import fill_all_gaps
+from app.tasks.refresh_ticker import refresh_tickers_by_interval
+from app.tasks.resample import base_interval
+from app.tasks.retention import apply_retention
+
+cron_job_seconds = Metrics.histogram("cron_job_seconds", "cronjob runs", ["job", "outcome"])
+cron_jobs_skipped = Metrics.counter(
+    "cron_jobs_skipped_total", "runs skipped: previous run still going, or missed", ["job", "reason"]
+)
+
+# ---------------------------------------------------------
+# Work queue: every tick fans out into (interval, ticker) refresh
+# items, batched again per interval for the provider
+# ---------------------------------------------------------
+
+# lower runs first: the hourly refresh is the fresher data
+PRIORITY = {"1h": 0, "1d": 1}
+
+
+def refresh_batch(interval, tickers):
+    """
+    WorkQueue handler: {ticker: result}, tickers of a failed provider chunk are left out (and retried)
+    """
+    return refresh_tickers_by_interval(tickers, interval=interval)
+
+
+refresh_queue = WorkQueue(
+    "refresh",
+    refresh_batch,
+    concurrency=max(1, settings.refresh_max_workers),
+    batch_size=max(1, settings.refresh_chunk_size),
+    max_retries=settings.scheduler_max_retries,
+    retry_delay=settings.scheduler_retry_delay,
+)
+
+
+async def refresh_tickers(tickers, interval, deadline):
+    """
+    queue one refresh item per ticker, returns {ticker: result} of the items that completed.
+    one jitter delay for the whole tick spreads the provider load of several processes
+    without splitting the batched downloads
+    """
+    delay = random.uniform(0, settings.scheduler_jitter) if settings.scheduler_jitter > 0 else 0.0
+    futures = [
+        refresh_queue.submit(interval, ticker, priority=PRIORITY.get(interval, 9), deadline=deadline, delay=delay)
+        for ticker in tickers
+    ]
+    outcomes = await asyncio.gather(*futures, return_exceptions=True)
+
+    results = {}
+    for ticker, outcome in zip(tickers, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.warning(f"refresh {ticker} {interval}: {type(outcome).__name__}: {outcome}")
+        else:
+            results[ticker] = outcome
+    return results
+
 
 # ---------------------------------------------------------
 # Cronjob: 1 minute
 # ---------------------------------------------------------
 
 
+@Metrics.timed(cron_job_seconds, job="m1")
 async def cron_1minute():
     logger.info("executing cronjob 1minute")
-    asyncio.create_task(Notifier.send_telegram_message_async("executing cronjob: 1hour"))
+    await Notifier.send_telegram_message_async("executing cronjob: 1minute")
 
 
 # ---------------------------------------------------------
@@ -25,16 +85,16 @@ async def cron_1minute():
 # ---------------------------------------------------------
 
 
+@Metrics.timed(cron_job_seconds, job="m10")
 async def cron_10minutes():
     logger.info("executing cronjob: cron_10minutes")
     logger.info(f"tickers: {config.cronjob.refresh_tickers}")
     now_utc = datetime.now(timezone.utc)
-    db.settings.set("cronjob_m10_updated_at", now_utc.strftime("%Y-%m-%d %H:%M:%S"))
+    await Executor.run_io(db.settings.set, "cronjob_m10_updated_at", now_utc.strftime("%Y-%m-%d %H:%M:%S"))
 
-    for ticker in config.cronjob.refresh_tickers:
-        refresh_ticker_by_interval(ticker=ticker, interval="1h")
+    await refresh_tickers(config.cronjob.refresh_tickers, "1h", deadline=600)
 
-    asyncio.create_task(Notifier.send_telegram_message_async("executed cronjob: 10minutes"))
+    await Notifier.send_telegram_message_async("executed cronjob: 10minutes")
 
 
 # ---------------------------------------------------------
@@ -42,19 +102,23 @@ async def cron_10minutes():
 # ---------------------------------------------------------
 
 
+@Metrics.timed(cron_job_seconds, job="h1")
 async def cron_h1():
     logger.info("executing cronjob: H1")
     logger.info(f"tickers: {config.cronjob.refresh_tickers}")
     now_utc = datetime.now(timezone.utc)
-    db.settings.set("cronjob_h1_updated_at", now_utc.strftime("%Y-%m-%d %H:%M:%S"))
+    await Executor.run_io(db.settings.set, "cronjob_h1_updated_at", now_utc.strftime("%Y-%m-%d %H:%M:%S"))
+
+    # items not started before the next tick are stale: the next tick refreshes them anyway
+    results = await refresh_tickers(config.cronjob.refresh_tickers, "1h", deadline=3600)
+    await run_alerts("h1")
 
     msg = "----HOURLY---"
-    for ticker in config.cronjob.refresh_tickers:
-        result = refresh_ticker_by_interval(ticker=ticker, interval="1h", return_dataframe=True)
-        last_candle = result.iloc[-1]
-        msg += f"\n{ticker.replace('-USD', '')}: ${float(last_candle['close']):.2f}"
+    for ticker, result in results.items():
+        if result["close"] is not None:
+            msg += f"\n{ticker.replace('-USD', '')}: ${result['close']:.2f}"
 
-    asyncio.create_task(Notifier.send_telegram_message_async(msg))
+    await Notifier.send_telegram_message_async(msg)
 
 
 # ---------------------------------------------------------
@@ -62,30 +126,102 @@ async def cron_h1():
 # ---------------------------------------------------------
 
 
+@Metrics.timed(cron_job_seconds, job="d1")
 async def cron_d1():
     logger.info("executing cronjob: D1")
     now_utc = datetime.now(timezone.utc)
-    db.settings.set("cronjob_d1_updated_at", now_utc.strftime("%Y-%m-%d %H:%M:%S"))
+    await Executor.run_io(db.settings.set, "cronjob_d1_updated_at", now_utc.strftime("%Y-%m-%d %H:%M:%S"))
+
+    if base_interval("d1"):
+        # daily candles are built from the hourly ones (already refreshed by cron_h1)
+        closes = await Executor.run_io(db.ohlc.last_closes, config.cronjob.refresh_tickers, "d1")
+    else:
+        results = await refresh_tickers(config.cronjob.refresh_tickers, "1d", deadline=86400)
+        await run_alerts("d1")
+        closes = {ticker: result["close"] for ticker, result in results.items()}
 
     msg = "----DAILY---"
-    for ticker in config.cronjob.refresh_tickers:
-        result = refresh_ticker_by_interval(ticker=ticker, interval="1d")
-        last_candle = result.iloc[-1]
-        msg += f"\n{ticker.replace('-USD', '')}: ${float(last_candle[-1]['close']):.2f}"
+    for ticker, close in closes.items():
+        if close is not None:
+            msg += f"\n{ticker.replace('-USD', '')}: ${close:.2f}"
 
-    asyncio.create_task(Notifier.send_telegram_message_async(msg))
+    await Notifier.send_telegram_message_async(msg)
+
+
+# ---------------------------------------------------------
+# Cronjob: database maintenance
+# ---------------------------------------------------------
+
+
+@Metrics.timed(cron_job_seconds, job="db_checkpoint")
+async def cron_db_checkpoint():
+    result = await Executor.run_io(checkpoint_db)
+    logger.debug(f"wal checkpoint: {result}")
+
+
+@Metrics.timed(cron_job_seconds, job="db_analyze")
+async def cron_db_analyze():
+    await Executor.run_io(analyze_db)
+    logger.info("executed cronjob: analyze")
+
+
+@Metrics.timed(cron_job_seconds, job="retention")
+async def cron_retention():
+    logger.info("executing cronjob: retention")
+    summary = await Executor.run_io(apply_retention)
+    logger.info(f"executed cronjob: retention {summary}")
+    return summary
+
+
+@Metrics.timed(cron_job_seconds, job="gaps")
+async def cron_gaps():
+    logger.info("executing cronjob: gaps")
+    summary = await Executor.run_io(fill_all_gaps, config.cronjob.refresh_tickers)
+    logger.info(f"executed cronjob: gaps {summary}")
+    return summary
 
 
 # ---------------------------------------------------------
 # Cronjob: initialize
 # ---------------------------------------------------------
 
-scheduler = AsyncIOScheduler(timezone=UTC)
+# created by cron_initialize (apscheduler is only imported when the cron is enabled)
+scheduler = None
+
+# with several workers or replicas on the same database, only the lease holder runs the scheduled jobs
+leader = LeaderLease("scheduler", ttl=settings.leader_lease_ttl, heartbeat_interval=settings.leader_heartbeat_interval)
+skipped_jobs = {}
+
+
+def on_job_skipped(event):
+    """
+    a run was dropped: the previous one overran (max_instances) or the process missed the time
+    """
+    from apscheduler.events import EVENT_JOB_MAX_INSTANCES
+
+    reason = "overrun" if event.code == EVENT_JOB_MAX_INSTANCES else "missed"
+    skipped_jobs[(event.job_id, reason)] = skipped_jobs.get((event.job_id, reason), 0) + 1
+    cron_jobs_skipped.inc(job=event.job_id, reason=reason)
+    logger.warning(f"cronjob {event.job_id}: run skipped ({reason})")
 
 
 def cron_initialize():
+    global scheduler
     if settings.enabled_cron:
+        from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+        from apscheduler.triggers.cron import CronTrigger
+        from apscheduler.triggers.interval import IntervalTrigger
+
         logger.info(f"cronjob is enabled at {datetime.now(UTC)}")
+        # one run per job at a time; runs missed while busy or asleep collapse into one
+        job_defaults = {"max_instances": 1, "coalesce": True, "misfire_grace_time": settings.scheduler_misfire_grace_time}
+        scheduler = AsyncIOScheduler(timezone=UTC, job_defaults=job_defaults)
+        scheduler.add_listener(on_job_skipped, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+
+        scheduled = leader.leader_only if settings.leader_election_enabled else lambda job: job
+        if settings.leader_election_enabled:
+            leader.start()
 
         # Every 1 minutes
         # scheduler.add_job(cron_1minute, CronTrigger(day="*", hour="*", minute="*", timezone="UTC"))
@@ -94,16 +230,43 @@ def cron_initialize():
         # scheduler.add_job(cron_10minutes, CronTrigger(day="*", hour="*", minute="*/10", second="5", timezone="UTC"))
 
         # Every 1 hours (with 30s delay)
-        scheduler.add_job(cron_h1, CronTrigger(day="*", hour="*/1", minute="0", second="20", timezone="UTC"))
+        scheduler.add_job(scheduled(cron_h1), CronTrigger(day="*", hour="*/1", minute="0", second="20", timezone="UTC"), id="h1")
 
         # Every 1 day (with 1min delay)
-        scheduler.add_job(cron_d1, CronTrigger(day="*", hour="0", minute="1", timezone="UTC"))
+        scheduler.add_job(scheduled(cron_d1), CronTrigger(day="*", hour="0", minute="1", timezone="UTC"), id="d1")
+
+        # one process maintains the shared database file
+        if settings.sqlite_wal and settings.sqlite_checkpoint_interval > 0:
+            scheduler.add_job(
+                scheduled(cron_db_checkpoint), IntervalTrigger(seconds=settings.sqlite_checkpoint_interval), id="db_checkpoint"
+            )
+        if config and config.retention:
+            scheduler.add_job(scheduled(cron_retention), CronTrigger(hour="2", minute="30", timezone="UTC"), id="retention")
+        if settings.gap_fill_enabled:
+            scheduler.add_job(scheduled(cron_gaps), CronTrigger(hour="3", minute="15", timezone="UTC"), id="gaps")
+        if settings.sqlite_analyze_interval > 0:
+            scheduler.add_job(
+                scheduled(cron_db_analyze), IntervalTrigger(seconds=settings.sqlite_analyze_interval), id="db_analyze"
+            )
 
         scheduler.start()
     else:
         logger.info("cronjob is disabled")
 
 
-def cron_shutdown():
-    if settings.enabled_cron:
+async def cron_shutdown():
+    if scheduler is not None:
         scheduler.shutdown()
+    await leader.stop()
+    await refresh_queue.shutdown()
+
+
+def cron_stats():
+    return {
+        "leader": leader.stats() if settings.enabled_cron and settings.leader_election_enabled else None,
+        "refresh_queue": refresh_queue.stats(),
+        "skipped_jobs": [{"job": job, "reason": reason, "count": count} for (job, reason), count in skipped_jobs.items()],
+    }
+
+
+Metrics.on_collect(refresh_queue.stats)
@@ -1,11 +1,22 @@
-from datetime import datetime
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
 
-import pandas as pd
-from sqlalchemy import UniqueConstraint, select
+from sqlalchemy import UniqueConstraint, delete, event, make_url, select
 from sqlalchemy.dialects.sqlite import insert
 from sqlmodel import Field, Session, SQLModel, create_engine
 
-from app.settings import settings
+from app.lib.archive import ARCHIVE_COLUMNS, Archive
+from app.lib.cache import LRUCache
+from app.lib.lazy import lazy_import
+from app.lib.metrics import Metrics
+from app.settings import logger, settings
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 # ---------------------------------------------------------
 # Models
@@ -23,118 +34,1221 @@ class OHLC(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
     ticker: str = Field(index=True)
     interval: str
-    date: datetime
-    open: str
-    high: str
-    low: str
-    close: str
+    date: int  # epoch seconds (UTC), candle open time
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float = 0.0
     __table_args__ = (UniqueConstraint("ticker", "interval", "date", name="unique_ticker_interval_date"),)
 
 
+class Indicator(SQLModel, table=True):
+    __tablename__ = "indicator"
+    id: int | None = Field(default=None, primary_key=True)
+    ticker: str
+    interval: str
+    name: str  # e.g. "ema20"
+    date: int  # epoch seconds (UTC) of the candle
+    value: float | None
+    __table_args__ = (UniqueConstraint("ticker", "interval", "name", "date", name="unique_indicator_ticker_interval_name_date"),)
+
+
+class IndicatorState(SQLModel, table=True):
+    __tablename__ = "indicator_state"
+    ticker: str = Field(primary_key=True)
+    interval: str = Field(primary_key=True)
+    name: str = Field(primary_key=True)
+    date: int  # candle the state was computed up to (included)
+    state: str  # JSON
+
+
+class Lease(SQLModel, table=True):
+    __tablename__ = "lease"
+    name: str = Field(primary_key=True)  # e.g. "scheduler"
+    owner: str  # host:pid:id of the holding process
+    expires_at: float  # epoch seconds, renewed by the holder's heartbeats
+    acquired_at: float
+
+
+class Coverage(SQLModel, table=True):
+    __tablename__ = "coverage"
+    ticker: str = Field(primary_key=True)
+    interval: str = Field(primary_key=True)
+    calendar: str  # e.g. "24/7", "XNYS"
+    first_date: int | None  # epoch of the first stored candle
+    last_date: int | None
+    expected: int  # candles the calendar expects from first_date up to scanned_until
+    missing: int
+    scanned_until: int  # epoch (exclusive): the candle open at scan time is not expected yet
+    scanned_at: float
+    gaps: str  # JSON [[start, end, candles]], end exclusive
+    empty: str  # JSON [[start, end]]: windows fetched again that the provider had no candles for
+
+
+class AlertRule(SQLModel, table=True):
+    __tablename__ = "alert_rule"
+    id: int | None = Field(default=None, primary_key=True)
+    ticker: str
+    interval: str = Field(index=True)
+    field: str = "close"  # candle column, or a stored indicator (e.g. "rsi14")
+    condition: str  # above, below, cross_above, cross_below, pct_change
+    value: float | None = None  # threshold (pct_change: percent, negative for a drop)
+    reference: str | None = None  # compared with this series (e.g. "ema20") instead of value
+    period: int = 1  # pct_change: candles back
+    cooldown: float  # seconds between two alerts of the rule
+    note: str = ""
+    enabled: bool = True
+    active: bool = False  # the condition held at the last evaluation: alerts fire when it starts holding
+    triggered_at: float | None = None
+    triggers: int = 0
+    created_at: float
+    updated_at: float  # by the API (the evaluation only changes active / triggered_at / triggers)
+
+
+class ChangeLog(SQLModel, table=True):
+    __tablename__ = "change_log"
+    id: int | None = Field(default=None, primary_key=True)
+    writer: str  # host:pid of the writing process
+    kind: str  # upsert, delete (candles) or settings
+    ticker: str | None = None
+    interval: str | None = None
+    first_date: int | None = None  # epoch of the first/last written candle
+    last_date: int | None = None
+
+
 # ---------------------------------------------------------
 # Methods
 # ---------------------------------------------------------
 
+db_call_seconds = Metrics.histogram("db_call_seconds", "database calls", ["call", "outcome"])
+
+# rows kept in the change log: a process that falls further behind drops all its caches instead
+CHANGE_LOG_ROWS = 10000
+CHANGE_LOG_INSERT_SQL = """
+    INSERT INTO change_log (writer, kind, ticker, interval, first_date, last_date) VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+class change_methods:
+    """
+    writes of the processes sharing the database (workers, replicas): each write of candles or settings
+    appends a change_log row in its own transaction; `sync` applies the rows of the other processes
+    to the caches of this one. called before every cache read, it costs one pragma while nothing changed
+    """
+
+    writer = f"{socket.gethostname()}:{os.getpid()}"
+    _enabled = None  # file databases only: an in-memory one is not shared
+    _connection = None
+    _version = None  # PRAGMA data_version at the last sync: changes with every commit of another connection
+    _seen = None  # id of the last applied row
+    _lock = threading.Lock()
+    _listeners = []
+
+    def record(conn, kind, series=()):
+        """
+        in the transaction of the write: series is [(ticker, interval, first_date, last_date)]
+        """
+        rows = [(change_methods.writer, kind, *values) for values in series or [(None, None, None, None)]]
+        conn.exec_driver_sql(CHANGE_LOG_INSERT_SQL, rows)
+        conn.exec_driver_sql("DELETE FROM change_log WHERE id <= last_insert_rowid() - ?", (CHANGE_LOG_ROWS,))
+
+    def on_remote_upsert(listener):
+        """
+        register listener(ticker, interval, start, end), called by `sync` for the candles written by another process
+        """
+        if listener not in change_methods._listeners:
+            change_methods._listeners.append(listener)
+        return listener
+
+    def _changes():
+        """
+        the rows written by the other processes since the last call, or None when some were pruned before being read
+        """
+        with change_methods._lock:
+            if change_methods._connection is None:
+                change_methods._connection = sqlite3.connect(
+                    make_url(settings.database_path).database, timeout=settings.sqlite_busy_timeout, check_same_thread=False
+                )
+                change_methods._connection.execute("PRAGMA query_only = 1")
+
+            cursor = change_methods._connection.cursor()
+            version = cursor.execute("PRAGMA data_version").fetchone()[0]
+            if version == change_methods._version:
+                return []
+            change_methods._version = version
+
+            if change_methods._seen is None:
+                change_methods._seen = cursor.execute("SELECT IFNULL(MAX(id), 0) FROM change_log").fetchone()[0]
+                return []
+            sql = "SELECT id, writer, kind, ticker, interval, first_date, last_date FROM change_log WHERE id > ? ORDER BY id"
+            rows = cursor.execute(sql, (change_methods._seen,)).fetchall()
+            if not rows:
+                return []
+            missed = rows[0][0] > change_methods._seen + 1
+            change_methods._seen = rows[-1][0]
+        return None if missed else [row[2:] for row in rows if row[1] != change_methods.writer]
+
+    def sync():
+        """
+        apply the writes of the other processes: drop the cached series and settings they changed and
+        call the remote upsert listeners (outside the lock: the listeners read the database)
+        """
+        if change_methods._enabled is None:
+            change_methods._enabled = _is_file_database(settings.database_path)
+        if not change_methods._enabled:
+            return
+
+        changes = change_methods._changes()
+        if changes is None:
+            logger.warning("change log: fell behind the other processes, dropping every cache")
+            ohlc_cache.clear()
+            settings_methods.invalidate()
+            return
+
+        for kind, ticker, interval, start, end in changes:
+            if kind == "settings":
+                settings_methods.invalidate()
+                continue
+            ohlc_cache.invalidate(ticker, interval)
+            if kind != "upsert":
+                continue
+            for listener in change_methods._listeners:
+                try:
+                    listener(ticker, interval, start, end)
+                except Exception as e:
+                    logger.error(f"change listener {listener.__name__} failed for {ticker} {interval}: {e}")
+
+    def _after_fork():
+        """
+        a worker forked after the app was imported (gunicorn --preload) is another writer:
+        it gets its own id and change log connection
+        """
+        change_methods.writer = f"{socket.gethostname()}:{os.getpid()}"
+        change_methods._connection = None
+        change_methods._version = None
+        change_methods._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=change_methods._after_fork)
+
 
 class settings_methods:
-    def all():
-        with Session(engine) as session:
-            stmt = select(Settings)
-            rows = session.scalars(stmt).all()
-            if rows:
-                result_dict = {row.key: row.value for row in rows}
-                return result_dict
+    """
+    write-through cache over the settings table: the table is read once,
+    reads are served from memory and every write is persisted before the cache is updated.
+    a write of another process (change log) drops the cache
+    """
 
-            return {}
+    _values = None
+    _lock = threading.RLock()
+
+    def _load():
+        change_methods.sync()
+        with settings_methods._lock:
+            if settings_methods._values is None:
+                with Session(read_engine) as session:
+                    rows = session.scalars(select(Settings)).all()
+                    settings_methods._values = {row.key: row.value for row in rows}
+            return settings_methods._values
+
+    def invalidate():
+        with settings_methods._lock:
+            settings_methods._values = None
+
+    @Metrics.timed(db_call_seconds, call="settings.reload")
+    def reload():
+        with settings_methods._lock:
+            settings_methods._values = None
+            return settings_methods._load()
+
+    def all():
+        return dict(settings_methods._load())
 
     def get(key):
-        with Session(engine) as session:
-            stmt = select(Settings).where(Settings.key == key)
-            row = session.scalars(stmt).first()
-            if row:
-                return row.value
-            return None
+        return settings_methods._load().get(key)
+
+    def get_many(keys):
+        values = settings_methods._load()
+        return {key: values.get(key) for key in keys}
 
     def set(key, value):
-        with Session(engine) as session:
-            stmt = select(Settings).where(Settings.key == key)
-            setting = session.scalars(stmt).first()
-            if setting:
-                setting.value = value  # update
-            else:
-                setting = Settings(key=key, value=value)  # create
-            session.add(setting)
-            session.commit()
-            session.refresh(setting)
+        settings_methods.set_many({key: value})
+
+    @Metrics.timed(db_call_seconds, call="settings.set_many")
+    def set_many(values):
+        """
+        insert or update many keys in one statement and one transaction
+        """
+        if not values:
+            return {}
 
+        with settings_methods._lock:
+            cache = settings_methods._load()
+            with Session(engine) as session:
+                stmt = insert(Settings).values([{"key": key, "value": value} for key, value in values.items()])
+                stmt = stmt.on_conflict_do_update(index_elements=["key"], set_={"value": stmt.excluded.value})
+                session.exec(stmt)
+                change_methods.record(session.connection(), "settings")
+                session.commit()
+            cache.update(values)
+        return values
+
+    @Metrics.timed(db_call_seconds, call="settings.delete")
     def delete(key):
-        with Session(engine) as session:
-            stmt = select(Settings).where(Settings.key == key)
-            setting = session.scalars(stmt).first()
-            if setting:
-                session.delete(setting)
+        with settings_methods._lock:
+            cache = settings_methods._load()
+            with Session(engine) as session:
+                session.exec(delete(Settings).where(Settings.key == key))
+                change_methods.record(session.connection(), "settings")
                 session.commit()
-            return True
+            cache.pop(key, None)
+        return True
+
+
+OHLC_COLUMNS = ["ticker", "interval", "date", "open", "high", "low", "close", "volume"]
+OHLC_DTYPE = [("ticker", "O"), ("interval", "O"), ("date", "i8"), ("open", "f8"), ("high", "f8"), ("low", "f8"), ("close", "f8"), ("volume", "f8")]  # fmt: off
+
+
+# candle columns a panel can hold
+PANEL_FIELDS = ["open", "high", "low", "close", "volume"]
+
+OHLC_UPSERT_SQL = f"""
+    INSERT INTO ohlc ({", ".join(OHLC_COLUMNS)}) VALUES ({", ".join("?" * len(OHLC_COLUMNS))})
+    ON CONFLICT (ticker, interval, date) DO UPDATE SET
+    open = excluded.open, high = excluded.high, low = excluded.low, close = excluded.close, volume = excluded.volume
+"""
+
+# read-through cache of series queries, invalidated by `ohlc_methods.upsert` (and by `change_methods.sync`
+# for the writes of other processes)
+ohlc_cache = LRUCache(max_bytes=settings.ohlc_cache_max_bytes, max_entry_bytes=settings.ohlc_cache_max_entry_bytes)
 
 
 class ohlc_methods:
-    def get_all(ticker=None, interval=None, return_dataframe=True):
-        records = []
-        with Session(engine) as session:
-            if ticker:
-                stmt = select(OHLC).where(OHLC.ticker == ticker)
-            if ticker and interval:
-                stmt = select(OHLC).where(OHLC.ticker == ticker, OHLC.interval == interval)
-            else:
+    @Metrics.timed(db_call_seconds, call="ohlc.get_all")
+    def get_all(ticker=None, interval=None, return_dataframe=True, start=None, end=None):
+        """
+        start/end are epoch seconds (inclusive)
+        """
+        if not return_dataframe:
+            with Session(read_engine) as session:
                 stmt = select(OHLC)
+                if ticker:
+                    stmt = stmt.where(OHLC.ticker == ticker)
+                if interval:
+                    stmt = stmt.where(OHLC.interval == interval)
+                if start is not None:
+                    stmt = stmt.where(OHLC.date >= start)
+                if end is not None:
+                    stmt = stmt.where(OHLC.date <= end)
+                return session.scalars(stmt.order_by(OHLC.date)).all()
+
+        key = (ticker, interval, start, end, "dataframe")
+        change_methods.sync()
+        df = ohlc_cache.get(key)
+        if df is not None:
+            return df.copy()
+        generation = ohlc_cache.generation(key)
+
+        # fast path: load the cursor straight into numpy columns (no ORM objects)
+        where, params = ohlc_methods._where(ticker, interval, start, end)
+        sql = f"SELECT {', '.join(OHLC_COLUMNS)} FROM ohlc {where} ORDER BY ticker, interval, date"
+
+        connection = read_engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            data = np.fromiter(cursor, dtype=OHLC_DTYPE)
+        finally:
+            connection.close()
+
+        data = ohlc_methods._merge_archive(data, ticker, interval, start, end)
+        df = ohlc_methods.to_dataframe(data)
+        if ohlc_cache.put(key, df, generation):
+            return df.copy()
+        return df
+
+    @Metrics.timed(db_call_seconds, call="ohlc.get_panel")
+    def get_panel(tickers, interval, start=None, end=None, fields=("close",), ffill=False):
+        """
+        date-aligned candles of many tickers: a DataFrame indexed by date with (field, ticker) columns,
+        NaN where a ticker has no candle (the previous value of the ticker with ffill).
+        one query for every ticker, then one vectorized pivot
+        """
+        tickers, fields = list(dict.fromkeys(tickers)), list(dict.fromkeys(fields))
+        unknown = [field for field in fields if field not in PANEL_FIELDS]
+        if unknown:
+            raise ValueError(f"unknown fields {', '.join(unknown)}, available: {', '.join(PANEL_FIELDS)}")
+
+        # every write of the interval invalidates it (the series part of the key is (None, interval))
+        key = (None, interval, tuple(tickers), start, end, tuple(fields), ffill, "panel")
+        change_methods.sync()
+        df = ohlc_cache.get(key)
+        if df is not None:
+            return df.copy()
+        generation = ohlc_cache.generation(key)
+
+        # the ticker comes back as its position in `tickers`: no string per row, and no lookup to pivot
+        where, params = ohlc_methods._where(None, interval, start, end)
+        positions = ", ".join("(?, ?)" for _ in tickers)
+        sql = f"""
+            WITH panel (position, ticker) AS (VALUES {positions})
+            SELECT panel.position, date, {", ".join(fields)} FROM panel JOIN ohlc ON ohlc.ticker = panel.ticker {where}
+        """
+
+        connection = read_engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql, [value for position, ticker in enumerate(tickers) for value in (position, ticker)] + params)
+            rows = np.fromiter(cursor, dtype=[("position", "i8"), ("date", "i8")] + [(field, "f8") for field in fields])
+        finally:
+            connection.close()
+        columns = {name: rows[name] for name in rows.dtype.names}
+
+        archived = []
+        for position, ticker in enumerate(tickers):
+            if Archive.years(ticker, interval):
+                candles = ohlc_methods._archived(ticker, interval, start, end)
+                archived.append(
+                    {"position": np.full(len(candles), position), **{name: candles[name] for name in ["date", *fields]}}
+                )
+        if archived:
+            columns = {name: np.concatenate([*(part[name] for part in archived), values]) for name, values in columns.items()}
+
+        dates, date_index = np.unique(columns["date"], return_inverse=True)
+        cells = date_index * len(tickers) + columns["position"]
+        if archived:
+            # a candle both archived and in the table: keep the table one (the last occurrence)
+            _, last = np.unique(cells[::-1], return_index=True)
+            keep = len(cells) - 1 - last
+            cells, columns = cells[keep], {name: values[keep] for name, values in columns.items()}
+
+        matrix = np.full((len(fields), len(dates) * len(tickers)), np.nan)
+        for i, field in enumerate(fields):
+            matrix[i, cells] = columns[field]
+
+        # one row per date, (field, ticker) columns; sized explicitly, a panel without candles has no rows
+        values = matrix.reshape(len(fields), len(dates), len(tickers)).transpose(1, 0, 2)
+        df = pd.DataFrame(
+            values.reshape(len(dates), len(fields) * len(tickers)),
+            index=pd.to_datetime(dates, unit="s").rename("date"),
+            columns=pd.MultiIndex.from_product([fields, tickers], names=["field", "ticker"]),
+        )
+        if ffill:
+            df = df.ffill()
+
+        if ohlc_cache.put(key, df, generation):
+            return df.copy()
+        return df
+
+    @Metrics.timed(db_call_seconds, call="ohlc.iter_batches")
+    def iter_batches(ticker, interval, start=None, end=None, after=None, limit=None, batch_size=5000):
+        """
+        stream a series as numpy structured arrays of at most batch_size candles, so memory does not grow
+        with the size of the series. one keyset query per batch: the pooled reader goes back between two
+        batches, a slow client does not hold it for the whole response.
+        after: keyset cursor (epoch of the last candle already returned)
+        """
+        key = (ticker, interval, start, end, after, limit, "batches")
+        change_methods.sync()
+        cached = ohlc_cache.get(key)
+        if cached is not None:
+            for i in range(0, len(cached), batch_size):
+                yield cached[i : i + batch_size]
+            return
+        generation = ohlc_cache.generation(key)
+
+        # keep the batches while they fit in one cache entry
+        kept, kept_bytes = [], 0
+
+        def keep(batch):
+            nonlocal kept, kept_bytes
+            if kept is not None:
+                kept.append(batch)
+                kept_bytes += batch.nbytes
+                kept = kept if kept_bytes <= ohlc_cache.max_entry_bytes else None
+            return batch
+
+        # archived candles come first (they are older than the rows still in the table)
+        remaining = limit or None
+        for columns in ohlc_methods._archived_batches(ticker, interval, start, end, after, batch_size):
+            batch = ohlc_methods._archive_array(ticker, interval, columns)[:remaining]
+            yield keep(batch)
+            if remaining is not None:
+                remaining -= len(batch)
+                if remaining <= 0:
+                    break
+
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            where, params = ohlc_methods._where(ticker, interval, start, end, after)
+            connection = read_engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                cursor.execute(f"SELECT {', '.join(OHLC_COLUMNS)} FROM ohlc {where} ORDER BY date LIMIT {int(size)}", params)
+                rows = cursor.fetchall()
+            finally:
+                connection.close()
+
+            batch = np.array(rows, dtype=OHLC_DTYPE)
+            if len(batch):
+                yield keep(batch)
+            if len(batch) < size:
+                break
+            after = int(batch["date"][-1])
+            remaining = remaining - len(rows) if remaining is not None else None
+
+        if kept is not None:
+            ohlc_cache.put(key, np.concatenate(kept) if kept else np.empty(0, dtype=OHLC_DTYPE), generation)
+
+    @Metrics.timed(db_call_seconds, call="ohlc.next_cursor")
+    def next_cursor(ticker, interval, start=None, end=None, after=None, limit=None):
+        """
+        keyset cursor for the page after `limit` candles, or None if it is the last page
+        """
+        if not limit:
+            return None
+
+        # the archived part of the page: its dates only, one batch at a time
+        archived, last_archived = 0, None
+        for columns in ohlc_methods._archived_batches(ticker, interval, start, end, after, columns=["date"]):
+            if archived == limit:
+                return last_archived
+            if archived + len(columns["date"]) > limit:
+                return int(columns["date"][limit - archived - 1])
+            archived, last_archived = archived + len(columns["date"]), int(columns["date"][-1])
+
+        # the rest of the page (and the candle after it) is in the table
+        where, params = ohlc_methods._where(ticker, interval, start, end, after)
+        offset = int(limit) - archived - 1
+        sql = f"SELECT date FROM ohlc {where} ORDER BY date LIMIT 2 OFFSET {max(offset, 0)}"
+        with read_engine.connect() as conn:
+            rows = conn.exec_driver_sql(sql, tuple(params)).all()
+        if offset < 0:
+            return last_archived if rows else None
+        return rows[0][0] if len(rows) == 2 else None
+
+    def _where(ticker=None, interval=None, start=None, end=None, after=None):
+        where, params = [], []
+        if ticker:
+            where.append("ticker = ?")
+            params.append(ticker)
+        if interval:
+            where.append("interval = ?")
+            params.append(interval)
+        if start is not None:
+            where.append("date >= ?")
+            params.append(int(start))
+        if end is not None:
+            where.append("date <= ?")
+            params.append(int(end))
+        if after is not None:
+            where.append("date > ?")
+            params.append(int(after))
+
+        if not where:
+            return "", params
+        return "WHERE " + " AND ".join(where), params
+
+    def _archived(ticker=None, interval=None, start=None, end=None, after=None):
+        """
+        archived candles of the matching series as a numpy structured array (sorted by ticker, interval, date)
+        """
+        arrays = []
+        for archived_ticker, archived_interval in Archive.series(ticker, interval):
+            columns = Archive.read(archived_ticker, archived_interval, start, end, after)
+            if columns is not None:
+                arrays.append(ohlc_methods._archive_array(archived_ticker, archived_interval, columns))
+        return np.concatenate(arrays) if arrays else np.empty(0, dtype=OHLC_DTYPE)
+
+    def _archive_array(ticker, interval, columns):
+        array = np.empty(len(columns["date"]), dtype=OHLC_DTYPE)
+        array["ticker"], array["interval"] = ticker, interval
+        for name, values in columns.items():
+            array[name] = values
+        return array
+
+    def _archived_batches(ticker, interval, start=None, end=None, after=None, batch_size=5000, columns=ARCHIVE_COLUMNS):
+        """
+        archived candles of a series older than its first row in the table (the table wins where both have candles),
+        as the {column: numpy array} batches of `Archive.iter_batches`
+        """
+        if not Archive.years(ticker, interval):
+            return
+
+        where, params = ohlc_methods._where(ticker, interval, start, end, after)
+        with read_engine.connect() as conn:
+            first = conn.exec_driver_sql(f"SELECT MIN(date) FROM ohlc {where}", tuple(params)).scalar()
+        if first is not None:
+            end = first - 1 if end is None else min(end, first - 1)
+        yield from Archive.iter_batches(ticker, interval, start, end, after, batch_size, columns)
+
+    def _merge_archive(data, ticker, interval, start, end):
+        """
+        table rows (sorted by ticker, interval, date) completed with the archived candles of the range
+        """
+        archived = ohlc_methods._archived(ticker, interval, start, end)
+        if len(archived) == 0:
+            return data
+
+        merged = pd.DataFrame({name: np.concatenate([archived[name], data[name]]) for name in OHLC_COLUMNS})
+        merged = merged.drop_duplicates(["ticker", "interval", "date"], keep="last").sort_values(
+            ["ticker", "interval", "date"], kind="stable"
+        )
+        result = np.empty(len(merged), dtype=OHLC_DTYPE)
+        for name in OHLC_COLUMNS:
+            result[name] = merged[name].to_numpy()
+        return result
+
+    @Metrics.timed(db_call_seconds, call="ohlc.first_date")
+    def first_date(ticker, interval):
+        """
+        epoch of the first stored candle of a series (archived ones first), or None
+        """
+        archived = Archive.first_date(ticker, interval)
+        if archived is not None:
+            return archived
+        with read_engine.connect() as conn:
+            sql = "SELECT MIN(date) FROM ohlc WHERE ticker = ? AND interval = ?"
+            return conn.exec_driver_sql(sql, (ticker, interval)).scalar()
+
+    @Metrics.timed(db_call_seconds, call="ohlc.last_date")
+    def last_date(ticker, interval):
+        """
+        high-water mark of a series: epoch of the last stored candle (or None)
+        """
+        with read_engine.connect() as conn:
+            sql = "SELECT MAX(date) FROM ohlc WHERE ticker = ? AND interval = ?"
+            last = conn.exec_driver_sql(sql, (ticker, interval)).scalar()
+        return last if last is not None else Archive.last_date(ticker, interval)
+
+    @Metrics.timed(db_call_seconds, call="ohlc.dates")
+    def dates(ticker, interval, start=None, end=None):
+        """
+        sorted epoch dates of the stored candles of a series (table and archive) as an int64 array
+        """
+        where, params = ohlc_methods._where(ticker, interval, start, end)
+        connection = read_engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"SELECT date FROM ohlc {where} ORDER BY date", params)
+            dates = np.fromiter((row[0] for row in cursor), dtype="int64")
+        finally:
+            connection.close()
+
+        archived = Archive.read(ticker, interval, start, end)
+        if archived is not None:
+            dates = np.union1d(archived["date"].astype("int64"), dates)
+        return dates
+
+    @Metrics.timed(db_call_seconds, call="ohlc.last_closes")
+    def last_closes(tickers, interval):
+        """
+        {ticker: close of the last stored candle}
+        """
+        if not tickers:
+            return {}
+        sql = f"""
+            SELECT o.ticker, o.close FROM ohlc o
+            JOIN (SELECT ticker, MAX(date) AS date FROM ohlc WHERE interval = ? AND ticker IN ({", ".join("?" * len(tickers))}) GROUP BY ticker) last
+            ON o.ticker = last.ticker AND o.date = last.date AND o.interval = ?
+        """
+        with read_engine.connect() as conn:
+            return dict(conn.exec_driver_sql(sql, (interval, *tickers, interval)).all())
+
+    def latest(ticker, interval, start, end, limit):
+        """
+        the last `limit` candles with start <= date <= end as a numpy structured array (not cached: for changes)
+        """
+        where, params = ohlc_methods._where(ticker, interval, start, end)
+        sql = f"SELECT {', '.join(OHLC_COLUMNS)} FROM ohlc {where} ORDER BY date DESC LIMIT {int(limit)}"
+
+        connection = read_engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            return np.fromiter(cursor, dtype=OHLC_DTYPE)[::-1]
+        finally:
+            connection.close()
+
+    @Metrics.timed(db_call_seconds, call="ohlc.tails")
+    def tails(tickers, interval, depths, fields=PANEL_FIELDS):
+        """
+        the last candles of every ticker (depths: how many, one number or one per ticker) as a numpy
+        structured array: position of the ticker in `tickers`, lag (0: the last candle), date and `fields`.
+        one index seek per ticker, one query per distinct depth
+        """
+        dtype = [("position", "i8"), ("lag", "i8"), ("date", "i8")] + [(field, "f8") for field in fields]
+        depths = [depths] * len(tickers) if isinstance(depths, int) else depths
+        groups = {}
+        for position, (ticker, depth) in enumerate(zip(tickers, depths)):
+            groups.setdefault(int(depth), []).extend((position, ticker))
+
+        connection = read_engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            parts = [np.empty(0, dtype=dtype)]
+            for depth, params in groups.items():
+                sql = f"""
+                    WITH tail (position, ticker) AS (VALUES {", ".join("(?, ?)" for _ in range(len(params) // 2))})
+                    SELECT {", ".join(["position", "ROW_NUMBER() OVER (PARTITION BY position ORDER BY date DESC) - 1", "date", *fields])}
+                    FROM (
+                        SELECT tail.position, ohlc.* FROM tail JOIN ohlc ON ohlc.ticker = tail.ticker AND ohlc.interval = ?
+                        AND ohlc.date >= COALESCE(
+                            (SELECT date FROM ohlc WHERE ticker = tail.ticker AND interval = ? ORDER BY date DESC LIMIT 1 OFFSET ?), 0
+                        )
+                    )
+                """
+                cursor.execute(sql, [*params, interval, interval, depth - 1])
+                parts.append(np.fromiter(cursor, dtype=dtype))
+            return np.concatenate(parts)
+        finally:
+            connection.close()
+
+    def cold_tickers(interval, before):
+        """
+        tickers of `interval` with candles older than `before`
+        """
+        with read_engine.connect() as conn:
+            sql = "SELECT DISTINCT ticker FROM ohlc WHERE interval = ? AND date < ?"
+            return [row[0] for row in conn.exec_driver_sql(sql, (interval, int(before)))]
+
+    def cold_candles(ticker, interval, before):
+        """
+        candles older than `before` still in the table, as a numpy structured array (not cached)
+        """
+        where, params = ohlc_methods._where(ticker, interval, end=int(before) - 1)
+        connection = read_engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"SELECT {', '.join(OHLC_COLUMNS)} FROM ohlc {where} ORDER BY date", params)
+            return np.fromiter(cursor, dtype=OHLC_DTYPE)
+        finally:
+            connection.close()
+
+    @Metrics.timed(db_call_seconds, call="ohlc.delete_range")
+    def delete_range(ticker, interval, start, end):
+        """
+        delete the candles with start <= date <= end, returns the number of deleted rows
+        """
+        with engine.begin() as conn:
+            sql = "DELETE FROM ohlc WHERE ticker = ? AND interval = ? AND date >= ? AND date <= ?"
+            deleted = conn.exec_driver_sql(sql, (ticker, interval, int(start), int(end))).rowcount
+            change_methods.record(conn, "delete", [(ticker, interval, int(start), int(end))])
+        ohlc_cache.invalidate(ticker, interval)
+        return deleted
+
+    def to_dataframe(data):
+        """
+        build the OHLC DataFrame (indexed by date) from a numpy structured array
+        """
+        df = pd.DataFrame({name: data[name] for name in OHLC_COLUMNS})
+        df["date"] = pd.to_datetime(df["date"], unit="s")
+        return df.set_index("date", drop=False)
+
+    @Metrics.timed(db_call_seconds, call="ohlc.upsert")
+    def upsert(values, chunk_size=10000):
+        """
+        insert or update candles (a list of dicts or a candles DataFrame) with chunked
+        executemany statements, all committed in a single transaction
+        """
+        if len(values) == 0:
+            return values
+
+        if isinstance(values, pd.DataFrame):
+            columns = [values[column].tolist() for column in OHLC_COLUMNS]
+        else:
+            columns = [[value.get(column, 0.0 if column == "volume" else None) for value in values] for column in OHLC_COLUMNS]
+        rows = list(zip(*columns))
+        series = pd.DataFrame({"ticker": columns[0], "interval": columns[1], "date": columns[2]})
+        series = [
+            (ticker, interval, int(start), int(end))
+            for (ticker, interval), (start, end) in series.groupby(["ticker", "interval"])["date"].agg(["min", "max"]).iterrows()
+        ]
 
-            records = session.scalars(stmt).all()
+        with engine.begin() as conn:
+            for i in range(0, len(rows), chunk_size):
+                conn.exec_driver_sql(OHLC_UPSERT_SQL, rows[i : i + chunk_size])
+            change_methods.record(conn, "upsert", series)
 
-        if return_dataframe:
-            list_records = (row.model_dump() for row in records)
-            df = pd.DataFrame(list_records)
-            df = df.set_index("date")
-            df = df.sort_index()
-            df["date"] = df.index
-            return df
+        for ticker, interval, start, end in series:
+            ohlc_cache.invalidate(ticker, interval)
+            for listener in ohlc_methods._listeners:
+                try:
+                    listener(ticker, interval, start, end)
+                except Exception as e:
+                    logger.error(f"ohlc listener {listener.__name__} failed for {ticker} {interval}: {e}")
+        return values
 
-        return records
+    _listeners = []
 
-    def upsert(values):
+    def on_upsert(listener):
+        """
+        register listener(ticker, interval, start, end), called after each upsert
+        for every written series (start/end: epoch of the first/last written candle)
+        """
+        if listener not in ohlc_methods._listeners:
+            ohlc_methods._listeners.append(listener)
+        return listener
+
+
+class indicator_methods:
+    def get_all(ticker, interval, names=None, start=None, end=None):
+        """
+        indicator values as a DataFrame indexed by date, one column per indicator
+        """
+        where, params = ohlc_methods._where(ticker, interval, start, end)
+        if names:
+            where += f" AND name IN ({', '.join('?' * len(names))})"
+            params += list(names)
+
+        with read_engine.connect() as conn:
+            rows = conn.exec_driver_sql(f"SELECT date, name, value FROM indicator {where} ORDER BY date", tuple(params)).all()
+
+        df = pd.DataFrame(rows, columns=["date", "name", "value"])
+        df = df.pivot(index="date", columns="name", values="value").rename_axis(columns=None)
+        df.index = pd.to_datetime(df.index.astype("int64"), unit="s").rename("date")
+        return df
+
+    def upsert(ticker, interval, name, dates, values, chunk_size=10000):
+        rows = [(ticker, interval, name, date, None if value != value else value) for date, value in zip(dates, values)]
+        sql = """
+            INSERT INTO indicator (ticker, interval, name, date, value) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (ticker, interval, name, date) DO UPDATE SET value = excluded.value
+        """
+        with engine.begin() as conn:
+            for i in range(0, len(rows), chunk_size):
+                conn.exec_driver_sql(sql, rows[i : i + chunk_size])
+
+    @Metrics.timed(db_call_seconds, call="indicators.tails")
+    def tails(series, interval, depths):
+        """
+        the last values of every (ticker, name) series (depths: how many, one number or one per series)
+        as a numpy structured array: position in `series`, lag (0: the last value), value (NaN when missing)
+        """
+        dtype = [("position", "i8"), ("lag", "i8"), ("value", "f8")]
+        depths = [depths] * len(series) if isinstance(depths, int) else depths
+        groups = {}
+        for position, ((ticker, name), depth) in enumerate(zip(series, depths)):
+            groups.setdefault(int(depth), []).extend((position, ticker, name))
+
+        connection = read_engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            parts = [np.empty(0, dtype=dtype)]
+            for depth, params in groups.items():
+                sql = f"""
+                    WITH tail (position, ticker, name) AS (VALUES {", ".join("(?, ?, ?)" for _ in range(len(params) // 3))})
+                    SELECT position, ROW_NUMBER() OVER (PARTITION BY position ORDER BY date DESC) - 1, value
+                    FROM (
+                        SELECT tail.position, indicator.date, indicator.value FROM tail JOIN indicator
+                        ON indicator.ticker = tail.ticker AND indicator.interval = ? AND indicator.name = tail.name
+                        AND indicator.date >= COALESCE(
+                            (SELECT date FROM indicator WHERE ticker = tail.ticker AND interval = ? AND name = tail.name
+                             ORDER BY date DESC LIMIT 1 OFFSET ?), 0
+                        )
+                    )
+                """
+                cursor.execute(sql, [*params, interval, interval, depth - 1])
+                rows = ((position, lag, np.nan if value is None else value) for position, lag, value in cursor)
+                parts.append(np.fromiter(rows, dtype=dtype))
+            return np.concatenate(parts)
+        finally:
+            connection.close()
+
+    def get_state(ticker, interval, name):
+        """
+        (date, state JSON) of the last checkpoint, or None
+        """
+        with Session(read_engine) as session:
+            row = session.get(IndicatorState, (ticker, interval, name))
+            return (row.date, row.state) if row else None
+
+    def set_state(ticker, interval, name, date, state):
         with Session(engine) as session:
-            stmt = insert(OHLC).values(values)
-            upsert_stmt = stmt.on_conflict_do_update(
-                # Column(s) used to detect conflicts
-                index_elements=["ticker", "interval", "date"],
-                # Values to update if conflict occurs
-                set_={
-                    "open": stmt.excluded.open,
-                    "high": stmt.excluded.high,
-                    "low": stmt.excluded.low,
-                    "close": stmt.excluded.close,
-                },
+            stmt = insert(IndicatorState).values(ticker=ticker, interval=interval, name=name, date=date, state=state)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["ticker", "interval", "name"], set_={"date": stmt.excluded.date, "state": stmt.excluded.state}
             )
-            session.exec(upsert_stmt)
+            session.exec(stmt)
             session.commit()
-            return values
-        return []
+
+
+# taken when free or expired, renewed by its owner; the WHERE clause makes it a compare-and-set
+LEASE_ACQUIRE_SQL = """
+    INSERT INTO lease (name, owner, expires_at, acquired_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (name) DO UPDATE SET
+        owner = excluded.owner,
+        expires_at = excluded.expires_at,
+        acquired_at = CASE WHEN lease.owner = excluded.owner THEN lease.acquired_at ELSE excluded.acquired_at END
+    WHERE lease.owner = excluded.owner OR lease.expires_at < excluded.acquired_at
+"""
+
+
+class lease_methods:
+    @Metrics.timed(db_call_seconds, call="lease.acquire")
+    def acquire(name, owner, ttl):
+        """
+        take or renew the lease `name` for ttl seconds (only when it is free, expired or already held by owner),
+        returns the holder afterwards: (owner, expires_at)
+        """
+        now = time.time()
+        with engine.begin() as conn:
+            conn.exec_driver_sql(LEASE_ACQUIRE_SQL, (name, owner, now + ttl, now))
+            row = conn.exec_driver_sql("SELECT owner, expires_at FROM lease WHERE name = ?", (name,)).one()
+        return row.owner, row.expires_at
+
+    def release(name, owner):
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM lease WHERE name = ? AND owner = ?", (name, owner))
+
+    def get(name):
+        """
+        (owner, expires_at) of the lease, or None
+        """
+        with read_engine.connect() as conn:
+            row = conn.exec_driver_sql("SELECT owner, expires_at FROM lease WHERE name = ?", (name,)).first()
+        return (row.owner, row.expires_at) if row else None
+
+
+class coverage_methods:
+    def get(ticker, interval):
+        """
+        the coverage row of a series as a dict (gaps and empty windows decoded), or None
+        """
+        with Session(read_engine) as session:
+            row = session.get(Coverage, (ticker, interval))
+            if row is None:
+                return None
+            coverage = row.model_dump()
+        coverage["gaps"], coverage["empty"] = json.loads(coverage["gaps"]), json.loads(coverage["empty"])
+        return coverage
+
+    @Metrics.timed(db_call_seconds, call="coverage.set")
+    def set(ticker, interval, **values):
+        values = {**values, "gaps": json.dumps(values["gaps"]), "empty": json.dumps(values["empty"])}
+        with Session(engine) as session:
+            stmt = insert(Coverage).values(ticker=ticker, interval=interval, **values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["ticker", "interval"], set_={name: getattr(stmt.excluded, name) for name in values}
+            )
+            session.exec(stmt)
+            session.commit()
+
+
+# columns of the rules handed to the evaluation (alert_methods.for_evaluation)
+ALERT_RULE_DTYPE = [
+    ("id", "i8"), ("ticker", "O"), ("field", "O"), ("condition", "O"), ("value", "f8"), ("reference", "O"),
+    ("period", "i8"), ("cooldown", "f8"), ("note", "O"), ("active", "?"), ("triggered_at", "f8"),
+]  # fmt: off
+
+
+class alert_methods:
+    def all(ticker=None, interval=None):
+        with Session(read_engine) as session:
+            stmt = select(AlertRule)
+            if ticker:
+                stmt = stmt.where(AlertRule.ticker == ticker)
+            if interval:
+                stmt = stmt.where(AlertRule.interval == interval)
+            return [rule.model_dump() for rule in session.scalars(stmt.order_by(AlertRule.id)).all()]
+
+    def get(rule_id):
+        with Session(read_engine) as session:
+            rule = session.get(AlertRule, rule_id)
+            return rule.model_dump() if rule else None
+
+    def create(values):
+        with Session(engine) as session:
+            rule = AlertRule(**values, created_at=time.time(), updated_at=time.time())
+            session.add(rule)
+            session.commit()
+            session.refresh(rule)
+            return rule.model_dump()
+
+    def update(rule_id, values):
+        """
+        the updated rule, or None when it does not exist
+        """
+        with Session(engine) as session:
+            rule = session.get(AlertRule, rule_id)
+            if rule is None:
+                return None
+            for name, value in values.items():
+                setattr(rule, name, value)
+            rule.updated_at = time.time()
+            session.add(rule)
+            session.commit()
+            session.refresh(rule)
+            return rule.model_dump()
+
+    def delete(rule_id):
+        with engine.begin() as conn:
+            return conn.exec_driver_sql("DELETE FROM alert_rule WHERE id = ?", (rule_id,)).rowcount > 0
+
+    @Metrics.timed(db_call_seconds, call="alerts.for_evaluation")
+    def for_evaluation(interval):
+        """
+        the enabled rules of `interval` as a numpy structured array (ALERT_RULE_DTYPE, by id),
+        NaN for a missing value, triggered_at 0 for never
+        """
+        columns = ", ".join("IFNULL(triggered_at, 0)" if name == "triggered_at" else name for name, _ in ALERT_RULE_DTYPE)
+        with read_engine.connect() as conn:
+            sql = f"SELECT {columns} FROM alert_rule WHERE interval = ? AND enabled ORDER BY id"
+            rows = conn.exec_driver_sql(sql, (interval,)).all()
+
+        rules = np.empty(len(rows), dtype=ALERT_RULE_DTYPE)
+        for (name, _), values in zip(ALERT_RULE_DTYPE, zip(*rows)):
+            rules[name] = values
+        return rules
+
+    def signature(interval):
+        """
+        changes whenever a rule of `interval` is created, updated or deleted through the API
+        """
+        with read_engine.connect() as conn:
+            sql = "SELECT COUNT(*), MAX(updated_at) FROM alert_rule WHERE interval = ?"
+            return tuple(conn.exec_driver_sql(sql, (interval,)).one())
+
+    def states(interval):
+        """
+        (active, triggered_at) of the enabled rules of `interval`, in the order of for_evaluation
+        """
+        connection = read_engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT active, IFNULL(triggered_at, 0) FROM alert_rule WHERE interval = ? AND enabled ORDER BY id", (interval,)
+            )
+            return np.fromiter(cursor, dtype=[("active", "?"), ("triggered_at", "f8")])
+        finally:
+            connection.close()
+
+    @Metrics.timed(db_call_seconds, call="alerts.record")
+    def record(changes, triggered_at):
+        """
+        save an evaluation: changes is [(rule id, active, triggered)], in one transaction
+        """
+        if not changes:
+            return
+        sql = """
+            UPDATE alert_rule SET active = ?, triggered_at = CASE WHEN ? THEN ? ELSE triggered_at END, triggers = triggers + ?
+            WHERE id = ?
+        """
+        rows = [
+            (bool(active), bool(triggered), triggered_at, int(triggered), int(rule_id)) for rule_id, active, triggered in changes
+        ]
+        with engine.begin() as conn:
+            conn.exec_driver_sql(sql, rows)
 
 
 class db:
     settings = settings_methods
+    changes = change_methods
     ohlc = ohlc_methods
+    indicators = indicator_methods
+    leases = lease_methods
+    coverage = coverage_methods
+    alerts = alert_methods
 
 
 # ---------------------------------------------------------
-# Connection
+# Connection: one writer connection and a pool of readers;
+# in WAL mode reads never wait for a write in progress
 # ---------------------------------------------------------
 
-connect_args = {"check_same_thread": False}
-engine = create_engine(settings.database_path, connect_args=connect_args)
+# rows sampled per index by ANALYZE: keeps it cheap on large tables
+ANALYSIS_LIMIT = 1000
+
+
+def _is_file_database(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _create_engine(read_only=False):
+    """
+    writer: a single connection with WAL (SQLite runs one write at a time: waiting in the pool is cheaper than busy retries),
+    readers: a pool of query_only connections.
+    without WAL the writer engine also serves the reads: it keeps the default pool sizing
+    """
+    connect_args = {"check_same_thread": False, "timeout": settings.sqlite_busy_timeout}
+    if not _is_file_database(settings.database_path):
+        return create_engine(settings.database_path, connect_args=connect_args)
+
+    pool = {}
+    if read_only:
+        pool = {"pool_size": settings.sqlite_read_pool_size, "max_overflow": 0}
+    elif settings.sqlite_wal:
+        pool = {"pool_size": 1, "max_overflow": 0}
+    engine = create_engine(
+        settings.database_path,
+        connect_args=connect_args,
+        pool_timeout=settings.sqlite_pool_timeout,
+        **pool,
+    )
+
+    pragmas = {
+        "synchronous": settings.sqlite_synchronous,
+        "cache_size": -settings.sqlite_cache_size_kb,
+        "mmap_size": settings.sqlite_mmap_size,
+        "temp_store": settings.sqlite_temp_store,
+    }
+    if settings.sqlite_wal:
+        pragmas = {"journal_mode": "WAL", **pragmas}
+    if not read_only:
+        # before anything is written: it only applies to new databases (vacuum_db converts the others)
+        pragmas = {"auto_vacuum": "INCREMENTAL", **pragmas}
+    if read_only:
+        pragmas["query_only"] = 1
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
+
+
+engine = _create_engine()
+# without WAL a reader blocks the writer (and the other way round): share the writer then
+read_engine = _create_engine(read_only=True) if settings.sqlite_wal and _is_file_database(settings.database_path) else engine
+
+
+# bump when the schema changes (new tables included) and add the matching step to `migrate_db`
+SCHEMA_VERSION = 6
 
 
 def create_db_and_tables():
+    """
+    create the missing tables and migrate; skipped when the database is already at SCHEMA_VERSION,
+    so a boot costs one pragma instead of inspecting every table
+    """
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA user_version").scalar() == SCHEMA_VERSION:
+            return
+
     SQLModel.metadata.create_all(engine)
+    migrate_db()
+
+
+def migrate_db():
+    """
+    upgrade an existing database to SCHEMA_VERSION (tracked in `PRAGMA user_version`)
+    """
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        if version >= SCHEMA_VERSION:
+            return
+
+        # v0 -> v1: prices as REAL, volume column, epoch-integer dates
+        columns = {row[1]: row[2] for row in conn.exec_driver_sql("PRAGMA table_info(ohlc)")}
+        if "volume" not in columns:
+            logger.info("migrating ohlc table to schema v1")
+            conn.exec_driver_sql("DROP INDEX IF EXISTS ix_ohlc_ticker")
+            conn.exec_driver_sql("ALTER TABLE ohlc RENAME TO ohlc_v0")
+            OHLC.__table__.create(conn)
+            conn.exec_driver_sql(
+                """
+                INSERT INTO ohlc (ticker, interval, date, open, high, low, close, volume)
+                SELECT ticker, interval, CAST(strftime('%s', date) AS INTEGER),
+                       CAST(open AS REAL), CAST(high AS REAL), CAST(low AS REAL), CAST(close AS REAL), 0
+                FROM ohlc_v0
+                """
+            )
+            conn.exec_driver_sql("DROP TABLE ohlc_v0")
+
+        # v1 -> v2: indicator and indicatorstate tables (created by create_all)
+
+        # v2 -> v3: lease table (created by create_all)
+
+        # v3 -> v4: coverage table (created by create_all)
+
+        # v4 -> v5: alert_rule table (created by create_all)
+
+        # v5 -> v6: change_log table (created by create_all)
+
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+# ---------------------------------------------------------
+# Maintenance: planner statistics and WAL checkpoints
+# ---------------------------------------------------------
+
+sqlite_wal_frames = Metrics.gauge("sqlite_wal_frames", "frames in the WAL file, and how many were checkpointed", ["state"])
+
+
+@Metrics.timed(db_call_seconds, call="analyze")
+def analyze_db():
+    """
+    refresh the query planner statistics (sampled: ANALYSIS_LIMIT rows per index)
+    """
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.exec_driver_sql("ANALYZE")
+
+
+@Metrics.timed(db_call_seconds, call="vacuum")
+def vacuum_db(pages=0):
+    """
+    give free pages back to the file system (pages: at most that many, 0: all). a database created
+    before auto_vacuum = INCREMENTAL is converted first, with one full VACUUM. returns the pages released
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        cursor = conn.connection.cursor()
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.info("converting the database to incremental vacuum (one full VACUUM)")
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+            return 0
+
+        free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        # the pragma releases one page per step: fetch until done
+        cursor.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        return free_pages - cursor.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+@Metrics.timed(db_call_seconds, call="checkpoint")
+def checkpoint_db():
+    """
+    copy the WAL into the database file without waiting for readers or writers (PASSIVE),
+    so the WAL, and the reads that have to scan it, stay small. returns {busy, frames, checkpointed}
+    """
+    with engine.begin() as conn:
+        busy, frames, checkpointed = conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").one()
+    sqlite_wal_frames.set(frames, state="total")
+    sqlite_wal_frames.set(checkpointed, state="checkpointed")
+    return {"busy": busy, "frames": frames, "checkpointed": checkpointed}
+
+
+# ---------------------------------------------------------
+# Metrics: scraped gauges
+# ---------------------------------------------------------
+
+# counting the rows of every series walks the whole index: do it at most once a minute
+SERIES_ROWS_TTL = 60
+ohlc_rows = Metrics.gauge("ohlc_rows", "stored candles per series", ["ticker", "interval"])
+ohlc_cache_stats = Metrics.gauge("ohlc_cache", "ohlc query cache", ["stat"])
+_series_rows_at = 0.0
+
+
+@Metrics.on_collect
+def collect_database_metrics():
+    global _series_rows_at
+    for stat, value in ohlc_cache.stats().items():
+        ohlc_cache_stats.set(value, stat=stat)
+
+    if time.monotonic() - _series_rows_at < SERIES_ROWS_TTL:
+        return
+    _series_rows_at = time.monotonic()
+    with read_engine.connect() as conn:
+        rows = conn.exec_driver_sql("SELECT ticker, interval, COUNT(*) FROM ohlc GROUP BY ticker, interval").all()
+    ohlc_rows.clear()
+    for ticker, interval, count in rows:
+        ohlc_rows.set(count, ticker=ticker, interval=interval)
 
 
 def get_session():
@@ -0,0 +1,169 @@
+import functools
+import os
+
+from app.lib.lazy import lazy_import
+from app.lib.utils import IntervalHelper
+from app.settings import logger, settings
+
+np = lazy_import("numpy")
+
+ARCHIVE_COLUMNS = ["date", "open", "high", "low", "close", "volume"]
+# candles per parquet row group: a streamed read holds one group in memory, the others are skipped by their date range
+ARCHIVE_ROW_GROUP_SIZE = 10000
+
+# ---------------------------------------------------------
+# Archive: cold candles moved out of SQLite, one parquet file
+# per ticker / interval / year, read with memory mapping
+# ---------------------------------------------------------
+
+
+@functools.cache
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        logger.warning("archive: pyarrow is not installed, candles cannot be archived")
+        return None
+    return pyarrow
+
+
+def _year_start(year):
+    return int(np.datetime64(f"{year}-01-01", "s").astype("int64"))
+
+
+class Archive:
+    def available():
+        return _pyarrow() is not None
+
+    def directory(ticker, interval):
+        return os.path.join(settings.archive_dir, ticker, IntervalHelper.normalize(interval))
+
+    def years(ticker, interval):
+        directory = Archive.directory(ticker, interval)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(name.removesuffix(".parquet")) for name in os.listdir(directory) if name.endswith(".parquet"))
+
+    def series(ticker=None, interval=None):
+        """
+        [(ticker, interval)] of the archived series, optionally filtered
+        """
+        if not os.path.isdir(settings.archive_dir):
+            return []
+        tickers = [ticker] if ticker else sorted(os.listdir(settings.archive_dir))
+        return [
+            (name, archived_interval)
+            for name in tickers
+            if os.path.isdir(os.path.join(settings.archive_dir, name))
+            for archived_interval in sorted(os.listdir(os.path.join(settings.archive_dir, name)))
+            if not interval or archived_interval == IntervalHelper.normalize(interval)
+        ]
+
+    def _range(ticker, interval, start=None, end=None, after=None):
+        """
+        (low, years): the first date of start/after and the yearly files overlapping [low, end]
+        """
+        low = max(value for value in [start, None if after is None else after + 1, 0] if value is not None)
+        years = Archive.years(ticker, interval)
+        return low, [year for year in years if _year_start(year + 1) > low and (end is None or _year_start(year) <= end)]
+
+    def read(ticker, interval, start=None, end=None, after=None):
+        """
+        {column: numpy array} of the archived candles with start <= date <= end and date > after, sorted by date
+        (only the yearly files overlapping the range are opened); None when nothing is archived
+        """
+        low, years = Archive._range(ticker, interval, start, end, after)
+        if not years or _pyarrow() is None:
+            return None
+
+        pa = _pyarrow()
+        filters = [("date", ">=", int(low))] + ([("date", "<=", int(end))] if end is not None else [])
+        tables = [
+            pa.parquet.read_table(
+                os.path.join(Archive.directory(ticker, interval), f"{year}.parquet"), filters=filters, memory_map=True
+            )
+            for year in years
+        ]
+        table = pa.concat_tables(tables)
+        if table.num_rows == 0:
+            return None
+        return {column: table.column(column).to_numpy() for column in ARCHIVE_COLUMNS}
+
+    def iter_batches(ticker, interval, start=None, end=None, after=None, batch_size=5000, columns=ARCHIVE_COLUMNS):
+        """
+        the candles of `read` as {column: numpy array} batches of at most batch_size candles, sorted by date:
+        one row group of one yearly file is read at a time, the row groups outside the range are skipped
+        """
+        low, years = Archive._range(ticker, interval, start, end, after)
+        pa = _pyarrow()
+        if not years or pa is None:
+            return
+
+        for year in years:
+            parquet = pa.parquet.ParquetFile(
+                os.path.join(Archive.directory(ticker, interval), f"{year}.parquet"), memory_map=True
+            )
+            date_column = parquet.schema_arrow.names.index("date")
+            row_groups = []
+            for i in range(parquet.num_row_groups):
+                stats = parquet.metadata.row_group(i).column(date_column).statistics
+                if stats is not None and stats.has_min_max and (stats.max < low or (end is not None and stats.min > end)):
+                    continue
+                row_groups.append(i)
+            if not row_groups:
+                continue
+
+            for batch in parquet.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=list(columns)):
+                dates = batch.column("date").to_numpy()
+                keep = (dates >= low) & (dates <= end) if end is not None else dates >= low
+                if keep.any():
+                    yield {column: batch.column(column).to_numpy()[keep] for column in columns}
+
+    def first_date(ticker, interval):
+        years = Archive.years(ticker, interval)
+        if not years or _pyarrow() is None:
+            return None
+        table = _pyarrow().parquet.read_table(
+            os.path.join(Archive.directory(ticker, interval), f"{years[0]}.parquet"), columns=["date"], memory_map=True
+        )
+        return int(table.column("date").to_numpy().min()) if table.num_rows else None
+
+    def last_date(ticker, interval):
+        years = Archive.years(ticker, interval)
+        if not years or _pyarrow() is None:
+            return None
+        table = _pyarrow().parquet.read_table(
+            os.path.join(Archive.directory(ticker, interval), f"{years[-1]}.parquet"), columns=["date"], memory_map=True
+        )
+        return int(table.column("date").to_numpy().max()) if table.num_rows else None
+
+    def write(ticker, interval, columns):
+        """
+        add candles ({column: numpy array}, epoch dates) to the yearly files, merged with what is already archived
+        (the new candles win); each file is replaced atomically. returns the number of candles written
+        """
+        pa = _pyarrow()
+        dates = np.asarray(columns["date"], dtype="int64")
+        if pa is None or len(dates) == 0:
+            return 0
+
+        directory = Archive.directory(ticker, interval)
+        os.makedirs(directory, exist_ok=True)
+        years = (dates.astype("datetime64[s]").astype("datetime64[Y]").astype("int64") + 1970).astype("int64")
+
+        for year in np.unique(years):
+            mask = years == year
+            table = pa.table({column: np.asarray(columns[column])[mask] for column in ARCHIVE_COLUMNS})
+
+            path = os.path.join(directory, f"{year}.parquet")
+            if os.path.exists(path):
+                existing = pa.parquet.read_table(path)
+                kept = ~np.isin(existing.column("date").to_numpy(), table.column("date").to_numpy())
+                table = pa.concat_tables([existing.filter(pa.array(kept)), table.cast(existing.schema)])
+            table = table.sort_by("date")
+
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            pa.parquet.write_table(table, temp_path, row_group_size=ARCHIVE_ROW_GROUP_SIZE)
+            os.replace(temp_path, path)
+        return len(dates)
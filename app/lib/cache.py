@@ -0,0 +1,112 @@
+import threading
+from collections import OrderedDict
+
+# ---------------------------------------------------------
+# LRU Cache: memory bounded, invalidated per series
+# ---------------------------------------------------------
+
+
+def sizeof(value):
+    """
+    approximate size in bytes of a cached numpy array or DataFrame
+    """
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    return int(getattr(value, "nbytes", 0))
+
+
+class LRUCache:
+    """
+    Keys are tuples starting with (ticker, interval); None in either position means
+    "every ticker" / "every interval", so invalidating a series also drops those entries.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._series = {}  # (ticker, interval) -> set of keys
+        self._generations = {}  # (ticker, interval) -> number of invalidations
+        self._clears = 0
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self, key):
+        """
+        read before querying the database and pass it to `put`: a result read while
+        the series was being written is not cached
+        """
+        with self._lock:
+            return self._clears, self._generations.get(key[:2], 0)
+
+    def put(self, key, value, generation=None):
+        size = sizeof(value)
+        if self.max_bytes <= 0 or size > self.max_entry_bytes:
+            return False
+
+        with self._lock:
+            if generation is not None and generation != (self._clears, self._generations.get(key[:2], 0)):
+                return False
+
+            self._remove(key)
+            self._entries[key] = (value, size)
+            self._series.setdefault(key[:2], set()).add(key)
+            self.bytes += size
+
+            while self.bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, ticker, interval):
+        with self._lock:
+            for series in [(ticker, interval), (ticker, None), (None, interval), (None, None)]:
+                self._generations[series] = self._generations.get(series, 0) + 1
+                for key in list(self._series.get(series, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._clears += 1
+            self._entries.clear()
+            self._series.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry[1]
+        keys = self._series.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._series[key[:2]]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
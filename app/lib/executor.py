@@ -0,0 +1,152 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.lib.metrics import Metrics
+from app.settings import logger, settings
+
+# ---------------------------------------------------------
+# Pool: a bounded executor with queue-depth metrics
+# ---------------------------------------------------------
+
+
+class _Pool:
+    def __init__(self, name, factory, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self._factory = factory
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0  # submitted, waiting for a worker
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_pending = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._factory(max_workers=self.max_workers)
+            return self._executor
+
+    def _started(self, submitted_at):
+        with self._lock:
+            self.pending -= 1
+            self.running += 1
+            self.wait_seconds += time.perf_counter() - submitted_at
+
+    def _finished(self, started_at, ok):
+        with self._lock:
+            self.running -= 1
+            self.completed += 1
+            self.failed += 0 if ok else 1
+            self.run_seconds += time.perf_counter() - started_at
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            self.pending += 1
+            self.max_pending = max(self.max_pending, self.pending)
+
+        submitted_at = time.perf_counter()
+        call = functools.partial(fn, *args, **kwargs)
+
+        if self._factory is ProcessPoolExecutor:
+            # workers live in another process: account for the whole round trip here
+            self._started(submitted_at)
+            started_at = time.perf_counter()
+            ok = False
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(self.executor(), call)
+                ok = True
+                return result
+            finally:
+                self._finished(started_at, ok)
+
+        def tracked():
+            self._started(submitted_at)
+            started_at = time.perf_counter()
+            ok = False
+            try:
+                result = call()
+                ok = True
+                return result
+            finally:
+                self._finished(started_at, ok)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor(), tracked)
+
+    def stats(self):
+        with self._lock:
+            completed = max(1, self.completed)
+            return {
+                "max_workers": self.max_workers,
+                "pending": self.pending,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "max_pending": self.max_pending,
+                "avg_wait_ms": round(self.wait_seconds / completed * 1000, 3),
+                "avg_run_ms": round(self.run_seconds / completed * 1000, 3),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_io_pool = _Pool("io", ThreadPoolExecutor, max(1, settings.executor_io_workers))
+_cpu_pool = (
+    _Pool("cpu", ProcessPoolExecutor, settings.executor_process_workers) if settings.executor_process_workers > 0 else None
+)
+
+# ---------------------------------------------------------
+# Executor
+# ---------------------------------------------------------
+
+
+class Executor:
+    async def run_io(fn, *args, **kwargs):
+        """
+        Runs a blocking call (provider download, database access) on the I/O thread pool,
+        so the event loop keeps serving requests.
+
+        e.q: await Executor.run_io(db.settings.set, "key", "value")
+        """
+        return await _io_pool.run(fn, *args, **kwargs)
+
+    async def run_cpu(fn, *args, **kwargs):
+        """
+        Runs a CPU heavy call (pandas transforms) on the process pool when
+        EXECUTOR_PROCESS_WORKERS > 0, otherwise on the I/O thread pool.
+        fn and its arguments must be picklable.
+        """
+        pool = _cpu_pool or _io_pool
+        return await pool.run(fn, *args, **kwargs)
+
+    def stats():
+        values = {"io": _io_pool.stats()}
+        if _cpu_pool:
+            values["cpu"] = _cpu_pool.stats()
+        return values
+
+    def shutdown():
+        logger.info("executor: shutting down worker pools")
+        _io_pool.shutdown()
+        if _cpu_pool:
+            _cpu_pool.shutdown()
+
+
+executor_pool = Metrics.gauge("executor_pool", "worker pools (pending, running, completed, failed, ...)", ["pool", "stat"])
+
+
+@Metrics.on_collect
+def collect_executor_metrics():
+    for pool, values in Executor.stats().items():
+        for stat, value in values.items():
+            executor_pool.set(value, pool=pool, stat=stat)
@@ -0,0 +1,98 @@
+import io
+import json
+
+from app.lib.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+
+# ---------------------------------------------------------
+# OHLC Formats: encode candle batches while they are streamed
+# ---------------------------------------------------------
+
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+def _iso_dates(batch):
+    return np.datetime_as_string(batch["date"].astype("datetime64[s]"))
+
+
+def _json_rows(batch):
+    ticker = json.dumps(batch["ticker"][0]) if len(batch) else ""
+    interval = json.dumps(batch["interval"][0]) if len(batch) else ""
+    prices = [batch[column].tolist() for column in PRICE_COLUMNS]
+    for date, open_, high, low, close, volume in zip(_iso_dates(batch), *prices):
+        yield (
+            f'{{"ticker":{ticker},"interval":{interval},"date":"{date}",'
+            f'"open":{open_!r},"high":{high!r},"low":{low!r},"close":{close!r},"volume":{volume!r}}}'
+        )
+
+
+class OHLCFormats:
+    media_types = {
+        "json": "application/json",
+        "ndjson": "application/x-ndjson",
+        "csv": "text/csv",
+        "arrow": "application/vnd.apache.arrow.stream",
+    }
+
+    def encode(batches, format="json"):
+        encoders = {
+            "json": OHLCFormats.json,
+            "ndjson": OHLCFormats.ndjson,
+            "csv": OHLCFormats.csv,
+            "arrow": OHLCFormats.arrow,
+        }
+        return encoders[format](batches)
+
+    def json(batches):
+        """
+        a JSON array of records, written chunk by chunk
+        """
+        yield "["
+        separator = ""
+        for batch in batches:
+            yield separator + ",".join(_json_rows(batch))
+            separator = ","
+        yield "]"
+
+    def ndjson(batches):
+        for batch in batches:
+            yield "".join(row + "\n" for row in _json_rows(batch))
+
+    def csv(batches):
+        yield "date," + ",".join(PRICE_COLUMNS) + "\n"
+        for batch in batches:
+            prices = [batch[column].tolist() for column in PRICE_COLUMNS]
+            yield "".join(
+                f"{date},{open_!r},{high!r},{low!r},{close!r},{volume!r}\n"
+                for date, open_, high, low, close, volume in zip(_iso_dates(batch), *prices)
+            )
+
+    def arrow(batches):
+        """
+        Arrow IPC stream, one record batch per database batch (requires pyarrow)
+        """
+        import pyarrow as pa
+
+        schema = pa.schema([("date", pa.timestamp("s", tz="UTC"))] + [(column, pa.float64()) for column in PRICE_COLUMNS])
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            for batch in batches:
+                columns = [pa.array(batch["date"].astype("datetime64[s]"), type=schema.field("date").type)]
+                columns += [pa.array(batch[column]) for column in PRICE_COLUMNS]
+                writer.write_batch(pa.record_batch(columns, schema=schema))
+                yield sink.getvalue()
+                sink.seek(0)
+                sink.truncate()
+        yield sink.getvalue()
+
+    def available(format):
+        if format not in OHLCFormats.media_types:
+            return False
+        if format == "arrow":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                return False
+        return True
@@ -0,0 +1,31 @@
+import importlib
+import sys
+import types
+
+# ---------------------------------------------------------
+# Lazy imports: heavy modules (pandas, yfinance, ...) load on
+# first use instead of at startup
+# ---------------------------------------------------------
+
+
+class _LazyModule(types.ModuleType):
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_name"] = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._lazy_name)
+        # later lookups hit the copied attributes directly (__getattr__ only runs on misses)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+    the module if it is already imported, otherwise a placeholder importing it on first attribute access
+
+    e.q: pd = lazy_import("pandas")
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)
@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import os
+import socket
+import time
+import uuid
+
+from app.database import db
+from app.lib.executor import Executor
+from app.lib.metrics import Metrics
+from app.settings import logger
+
+leader_is_leader = Metrics.gauge("leader_is_leader", "1 while this process holds the lease", ["lease"])
+leader_changes = Metrics.counter("leader_changes_total", "lease gained or lost by this process", ["lease", "change"])
+
+# seconds a heartbeat may be late (busy database, event loop) before the leader is taken for dead,
+# at most half a heartbeat interval
+HEARTBEAT_GRACE = 2.0
+
+# ---------------------------------------------------------
+# LeaderLease: one process (among workers and replicas sharing
+# the database) holds the lease, renewed by heartbeats; another
+# one takes it over once it has not been renewed for ttl seconds
+# ---------------------------------------------------------
+
+
+class LeaderLease:
+    """
+    - start(): heartbeat every heartbeat_interval seconds, which renews the lease or takes it over when it expired
+    - leader_only(job): a job running only in the process holding the lease
+    - stop(): releases the lease, so another process takes over at its next heartbeat instead of after ttl
+    """
+
+    def __init__(self, name, ttl=30.0, heartbeat_interval=10.0):
+        self.name = name
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.expires_at = 0.0  # of our own lease (epoch), 0: not held
+        self.holder = None
+        self.holder_expires_at = 0.0
+        self.changes = 0
+        self._task = None
+
+    @property
+    def is_leader(self):
+        return time.time() < self.expires_at
+
+    async def acquire(self):
+        """
+        renew (or take) the lease, returns whether this process is the leader
+        """
+        was_leader = self.is_leader
+        try:
+            self.holder, self.holder_expires_at = await Executor.run_io(db.leases.acquire, self.name, self.owner, self.ttl)
+            self.expires_at = self.holder_expires_at if self.holder == self.owner else 0.0
+        except Exception as e:
+            # keep the current expiry: a leader that cannot renew steps down once it runs out
+            logger.warning(f"lease {self.name}: heartbeat failed: {e}")
+
+        is_leader = self.is_leader
+        if is_leader != was_leader:
+            self.changes += 1
+            leader_changes.inc(lease=self.name, change="gained" if is_leader else "lost")
+            logger.info(
+                f"lease {self.name}: {self.owner} {'is now the leader' if is_leader else f'lost the lead to {self.holder}'}"
+            )
+        leader_is_leader.set(int(is_leader), lease=self.name)
+        return is_leader
+
+    async def _heartbeat(self):
+        while True:
+            await self.acquire()
+            await asyncio.sleep(self.heartbeat_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._heartbeat(), name=f"lease-{self.name}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            try:
+                await Executor.run_io(db.leases.release, self.name, self.owner)
+            except Exception as e:
+                logger.warning(f"lease {self.name}: release failed: {e}")
+        self.expires_at = 0.0
+        leader_is_leader.set(0, lease=self.name)
+
+    async def wait_for_lead(self):
+        """
+        at a job time: renew, or take the lease over when the leader died just before (the tick would
+        otherwise be lost). a live leader renews every heartbeat_interval, so its lease has more than
+        ttl - heartbeat_interval left: the followers skip the job at once. less means it missed a heartbeat,
+        then the followers wait for the lease to run out
+        """
+        if await self.acquire():
+            return True
+        remaining = self.holder_expires_at - time.time()
+        grace = min(HEARTBEAT_GRACE, self.heartbeat_interval / 2)
+        if self.holder is None or remaining > self.ttl - self.heartbeat_interval - grace:
+            return False
+        await asyncio.sleep(max(remaining, 0.0) + 1.0)
+        return await self.acquire()
+
+    def leader_only(self, job):
+        @functools.wraps(job)
+        async def wrapper(*args, **kwargs):
+            if not await self.wait_for_lead():
+                logger.debug(f"lease {self.name}: {job.__name__} skipped, {self.holder} is the leader")
+                return None
+            return await job(*args, **kwargs)
+
+        return wrapper
+
+    def stats(self):
+        return {
+            "owner": self.owner,
+            "is_leader": self.is_leader,
+            "leader": self.holder,
+            "expires_in": round(max(0.0, self.holder_expires_at - time.time()), 3) if self.holder else None,
+            "changes": self.changes,
+        }
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import re
+from collections import deque
+from datetime import datetime
+
+from app.lib.lazy import lazy_import
+
+aiofiles = lazy_import("aiofiles")
+
+
+# log lines start with "%(asctime)s - %(levelname)s - " (see app/settings.py),
+# any other line (e.g. a traceback) belongs to the entry above it
+LOG_LINE = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d+ - ([A-Z]+) - ")
+
+# ---------------------------------------------------------
+# Log filter
+# ---------------------------------------------------------
+
+
+class LogFilter:
+    def __init__(self, level=None, contains=None, since=None, until=None):
+        self.level = logging.getLevelName(level.upper()) if level else None
+        if not isinstance(self.level, (int, type(None))):
+            raise ValueError(f"unknown log level '{level}'")
+        self.contains = contains or None
+        self.since = LogFilter._timestamp(since)
+        self.until = LogFilter._timestamp(until)
+
+    def _timestamp(value):
+        if not value:
+            return None
+        return datetime.fromisoformat(value).strftime("%Y-%m-%d %H:%M:%S")
+
+    def matches(self, entry):
+        """
+        entry: a log entry (header line plus continuation lines)
+        """
+        header = LOG_LINE.match(entry)
+        if header:
+            asctime, level = header.groups()
+            if self.level is not None and logging.getLevelName(level) < self.level:
+                return False
+            if self.since and asctime < self.since:
+                return False
+            if self.until and asctime > self.until:
+                return False
+        elif self.level is not None or self.since or self.until:
+            return False
+
+        return self.contains is None or self.contains in entry
+
+    def is_before_range(self, entry):
+        header = LOG_LINE.match(entry)
+        return bool(self.since and header and header.group(1) < self.since)
+
+
+# ---------------------------------------------------------
+# Tail: read the file backwards, block by block
+# ---------------------------------------------------------
+
+
+def read_lines_backwards(file_path, block_size=64 * 1024):
+    """
+    yields the lines of a file from the last one to the first one,
+    memory is bounded by block_size (plus the longest line)
+    """
+    with open(file_path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + remainder).split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode("utf-8", errors="replace")
+        yield remainder.decode("utf-8", errors="replace")
+
+
+def tail(file_path, lines=1000, log_filter=None):
+    """
+    last `lines` lines of the entries accepted by log_filter
+    """
+    log_filter = log_filter or LogFilter()
+    result = deque()
+    count = 0
+    entry = []
+
+    skip_last_newline = True
+    for line in read_lines_backwards(file_path):
+        if skip_last_newline:
+            skip_last_newline = False
+            if line == "":
+                continue
+
+        entry.insert(0, line)
+        if not LOG_LINE.match(line):
+            continue  # continuation line, the header is above
+
+        text = "\n".join(entry)
+        entry = []
+        if log_filter.is_before_range(text):
+            break
+        if log_filter.matches(text):
+            result.appendleft(text + "\n")
+            count += text.count("\n") + 1
+            if count >= lines:
+                break
+
+    # lines above the first header of the file
+    if entry and count < lines:
+        text = "\n".join(entry)
+        if log_filter.matches(text):
+            result.appendleft(text + "\n")
+
+    return "".join(result)
+
+
+# ---------------------------------------------------------
+# Follow: push new lines, survives the midnight rotation
+# ---------------------------------------------------------
+
+
+async def follow(file_path, log_filter=None, poll_interval=0.5):
+    """
+    yields the lines appended to file_path. TimedRotatingFileHandler renames the file
+    at midnight and creates a new one: the old file is drained, then the new one is
+    read from the beginning.
+    """
+    log_filter = log_filter or LogFilter()
+
+    while not os.path.exists(file_path):
+        await asyncio.sleep(poll_interval)
+
+    f = await aiofiles.open(file_path, mode="r", encoding="utf-8", errors="replace")
+    try:
+        await f.seek(0, os.SEEK_END)
+        inode = os.fstat(f.fileno()).st_ino
+        partial = ""
+        keep = False  # continuation lines follow the decision taken for their header
+
+        while True:
+            chunk = await f.read()
+            if chunk:
+                lines = (partial + chunk).split("\n")
+                partial = lines.pop()
+                for line in lines:
+                    keep = log_filter.matches(line) if LOG_LINE.match(line) else keep
+                    if keep:
+                        yield line + "\n"
+                continue
+
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                stat = None  # between the rename and the new file
+
+            if stat and (stat.st_ino != inode or stat.st_size < await f.tell()):
+                await f.close()
+                f = await aiofiles.open(file_path, mode="r", encoding="utf-8", errors="replace")
+                inode = os.fstat(f.fileno()).st_ino
+                partial = ""
+                continue
+
+            await asyncio.sleep(poll_interval)
+    finally:
+        await f.close()
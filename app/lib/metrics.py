@@ -0,0 +1,249 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+from app.settings import logger
+
+# seconds: from a cached read (~1ms) to a slow provider download
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# ---------------------------------------------------------
+# Metric types (Prometheus text format)
+# ---------------------------------------------------------
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + ([extra] if extra else [])
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            return [(f"{self.name}{_format_labels(self.labels, key)}", value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name} {value!r}" for name, value in self.samples()]
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, f'le="{bound}"')} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+_collectors = []
+
+
+def _get_or_create(factory, name, help, labels, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = factory(name, help, labels, **kwargs)
+        return metric
+
+
+# ---------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------
+
+
+class Metrics:
+    def counter(name, help, labels=()):
+        return _get_or_create(Counter, name, help, labels)
+
+    def gauge(name, help, labels=()):
+        return _get_or_create(Gauge, name, help, labels)
+
+    def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return _get_or_create(Histogram, name, help, labels, buckets=buckets)
+
+    def timed(histogram, **labels):
+        """
+        Decorator recording the duration of every call in `histogram`, with an "outcome" label (ok / error).
+        Works with functions, coroutines and generators (timed until exhausted).
+
+        e.q: @Metrics.timed(db_call_seconds, call="ohlc.get_all")
+        """
+
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+
+                @functools.wraps(fn)
+                async def wrapper(*args, **kwargs):
+                    started, outcome = time.perf_counter(), "error"
+                    try:
+                        result = await fn(*args, **kwargs)
+                        outcome = "ok"
+                        return result
+                    finally:
+                        histogram.observe(time.perf_counter() - started, outcome=outcome, **labels)
+
+            elif inspect.isgeneratorfunction(fn):
+
+                @functools.wraps(fn)
+                def wrapper(*args, **kwargs):
+                    started, outcome = time.perf_counter(), "error"
+                    try:
+                        yield from fn(*args, **kwargs)
+                        outcome = "ok"
+                    finally:
+                        histogram.observe(time.perf_counter() - started, outcome=outcome, **labels)
+
+            else:
+
+                @functools.wraps(fn)
+                def wrapper(*args, **kwargs):
+                    started, outcome = time.perf_counter(), "error"
+                    try:
+                        result = fn(*args, **kwargs)
+                        outcome = "ok"
+                        return result
+                    finally:
+                        histogram.observe(time.perf_counter() - started, outcome=outcome, **labels)
+
+            return wrapper
+
+        return decorator
+
+    def on_collect(collector):
+        """
+        collector() runs before every scrape, to refresh gauges that are cheaper to read than to track
+        """
+        _collectors.append(collector)
+        return collector
+
+    def render():
+        for collector in _collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"metrics collector {collector.__name__} failed: {e}")
+
+        with _registry_lock:
+            metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+# ---------------------------------------------------------
+# ASGI middleware: latency per route
+# ---------------------------------------------------------
+
+http_request_seconds = Metrics.histogram(
+    "http_request_seconds", "HTTP requests, until the response headers are sent", ["method", "route", "status"]
+)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status, started
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # the route template (e.g. /ohlc/{ticker}/{interval}) keeps the number of series bounded
+                route = scope.get("route")
+                http_request_seconds.observe(
+                    time.perf_counter() - started,
+                    method=scope["method"],
+                    route=route.path if route else "unmatched",
+                    status=status,
+                )
+                started = None
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if started is not None:
+                route = scope.get("route")
+                http_request_seconds.observe(
+                    time.perf_counter() - started,
+                    method=scope["method"],
+                    route=route.path if route else "unmatched",
+                    status=status,
+                )
@@ -0,0 +1,281 @@
+import asyncio
+import time
+
+from app.lib.lazy import lazy_import
+from app.lib.metrics import Metrics
+from app.settings import logger, settings
+
+httpx = lazy_import("httpx")
+
+notifier_delivery_seconds = Metrics.histogram(
+    "notifier_delivery_seconds", "message deliveries, retries included", ["channel", "outcome"]
+)
+notifier_channel = Metrics.gauge("notifier_channel", "delivery queues (queue_depth, sent, failed, ...)", ["channel", "stat"])
+
+# ---------------------------------------------------------
+# Channel: one pooled client behind an async delivery queue
+# ---------------------------------------------------------
+
+
+class _Channel:
+    name = ""
+    max_length = 2000  # characters per message accepted by the service
+    min_interval = 1.0  # seconds between two messages
+
+    def __init__(self):
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._client = None
+        self._last_sent_at = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.latency_seconds = 0.0
+        self.last_latency = 0.0
+
+    def enabled(self):
+        raise NotImplementedError
+
+    def request(self, text):
+        """
+        returns (url, payload) of the message
+        """
+        raise NotImplementedError
+
+    def retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        return float(value) if value else None
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker and not self._worker.done():
+            return
+
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=settings.notifier_queue_size)
+        self._client = httpx.AsyncClient(timeout=10.0, limits=httpx.Limits(max_connections=2, max_keepalive_connections=2))
+        self._worker = loop.create_task(self._run(), name=f"notifier-{self.name}")
+
+    def enqueue(self, message_text):
+        self._start()
+        try:
+            self._queue.put_nowait((time.perf_counter(), message_text))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"{self.name}: queue is full, message dropped")
+            return False
+
+    async def _run(self):
+        while True:
+            items = [await self._queue.get()]
+            try:
+                # let a burst arrive, then coalesce it into as few messages as possible
+                await asyncio.sleep(settings.notifier_batch_window)
+                while not self._queue.empty():
+                    items.append(self._queue.get_nowait())
+
+                for text in self._coalesce([text for _, text in items]):
+                    await self._deliver(text)
+
+                latency = time.perf_counter() - items[0][0]
+                self.batches += 1
+                self.last_latency = latency
+                self.latency_seconds += latency
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"{self.name}: delivery error: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _coalesce(self, texts):
+        messages, current = [], ""
+        for text in texts:
+            for i in range(0, max(1, len(text)), self.max_length):
+                part = text[i : i + self.max_length]
+                if current and len(current) + 1 + len(part) <= self.max_length:
+                    current += "\n" + part
+                    self.coalesced += 1
+                else:
+                    if current:
+                        messages.append(current)
+                    current = part
+        if current:
+            messages.append(current)
+        return messages
+
+    async def _deliver(self, text):
+        started = time.perf_counter()
+        outcome = await self._send(text)
+        notifier_delivery_seconds.observe(time.perf_counter() - started, channel=self.name, outcome=outcome)
+        return outcome
+
+    async def _send(self, text):
+        url, payload = self.request(text)
+
+        for attempt in range(settings.notifier_max_retries + 1):
+            wait = self._last_sent_at + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            delay = min(60.0, 2.0**attempt)
+            try:
+                self._last_sent_at = time.monotonic()
+                response = await self._client.post(url, data=payload)
+                if response.status_code == 429:
+                    delay = self.retry_after(response) or delay
+                    logger.warning(f"{self.name}: rate limited, retrying in {delay:.1f}s")
+                elif response.status_code >= 500:
+                    logger.warning(f"{self.name}: server error {response.status_code}, retrying in {delay:.1f}s")
+                else:
+                    response.raise_for_status()
+                    self.sent += 1
+                    logger.info(f"{self.name}: message sent to chat")
+                    return "ok"
+            except httpx.HTTPStatusError as e:
+                logger.warning(f"{self.name}: delivery failed: {e.response.status_code} - {e.response.text}")
+                break
+            except httpx.RequestError as e:
+                logger.warning(f"{self.name}: network error: {e}, retrying in {delay:.1f}s")
+
+            if attempt < settings.notifier_max_retries:
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+        self.failed += 1
+        return "failed"
+
+    async def shutdown(self, timeout):
+        if self._worker is None or self._loop is not asyncio.get_running_loop():
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except TimeoutError:
+            logger.warning(f"{self.name}: {self._queue.qsize()} messages not delivered at shutdown")
+
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        await self._client.aclose()
+        self._worker = None
+
+    def stats(self):
+        batches = max(1, self.batches)
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "avg_latency_ms": round(self.latency_seconds / batches * 1000, 3),
+            "last_latency_ms": round(self.last_latency * 1000, 3),
+        }
+
+
+class _Telegram(_Channel):
+    name = "telegram"
+    max_length = 4096
+    min_interval = 1.0
+
+    def enabled(self):
+        if not settings.notifier_telegram_token:
+            return False
+
+        if not settings.notifier_telegram_chat_id:
+            logger.warning("telegram_chat_id is empty")
+            return False
+
+        return True
+
+    def request(self, text):
+        url = f"{settings.notifier_telegram_api_url}/bot{settings.notifier_telegram_token}/sendMessage"
+        payload = {"chat_id": settings.notifier_telegram_chat_id, "text": text, "parse_mode": "Markdown"}
+        return url, payload
+
+    def retry_after(self, response):
+        try:
+            return float(response.json()["parameters"]["retry_after"])
+        except Exception:
+            return super().retry_after(response)
+
+
+class _Discord(_Channel):
+    name = "discord"
+    max_length = 2000
+    min_interval = 0.5
+
+    def enabled(self):
+        return bool(settings.notifier_discord_webhook_url)
+
+    def request(self, text):
+        return f"{settings.notifier_discord_webhook_url}", {"content": text}
+
+    def retry_after(self, response):
+        try:
+            return float(response.json()["retry_after"])
+        except Exception:
+            return super().retry_after(response)
+
+
+_telegram = _Telegram()
+_discord = _Discord()
+
+# ---------------------------------------------------------
+# Notifier
+# ---------------------------------------------------------
+
+
+class Notifier:
+    async def send_telegram_message_async(message_text: str):
+        """
+        Queues a text message for telegram, it is delivered in the background
+        (bursts are coalesced, rate limits and retries are handled by the queue)
+
+        e.q: await Notifier.send_telegram_message_async("hello bot")
+        """
+        if not _telegram.enabled():
+            return
+
+        if not message_text:
+            logger.warning("telegram: message is empty")
+            return
+
+        return "queued" if _telegram.enqueue(message_text) else "failed"
+
+    async def send_discord_message_async(message_text: str):
+        """
+        Queues a text message for discord, it is delivered in the background
+
+        e.q: await Notifier.send_discord_message_async("hello bot")
+        """
+        if not _discord.enabled():
+            return
+
+        if not message_text:
+            logger.warning("discord: message is empty")
+            return
+
+        return "queued" if _discord.enqueue(message_text) else "failed"
+
+    def stats():
+        return {"telegram": _telegram.stats(), "discord": _discord.stats()}
+
+    async def shutdown(timeout=10.0):
+        """
+        deliver what is still queued (up to timeout seconds) and close the clients
+        """
+        await asyncio.gather(_telegram.shutdown(timeout), _discord.shutdown(timeout))
+
+
+@Metrics.on_collect
+def collect_notifier_metrics():
+    for channel, values in Notifier.stats().items():
+        for stat, value in values.items():
+            notifier_channel.set(value, channel=channel, stat=stat)
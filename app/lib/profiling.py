@@ -0,0 +1,156 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+
+from app.settings import logger, settings
+
+# ---------------------------------------------------------
+# Sampler: a statistical profiler over every thread
+# (the event loop and the executor workers alike)
+# ---------------------------------------------------------
+
+
+# leaf frames of a thread waiting for work: the idle event loop and idle pool workers
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("threading.py", "wait"),
+    ("threading.py", "join"),
+    ("threading.py", "_wait_for_tstate_lock"),
+}
+
+
+def _location(code):
+    return f"{code.co_filename}:{code.co_firstlineno}:{code.co_name}"
+
+
+class _Sampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = 0
+        self.own = Counter()  # function on top of the stack
+        self.total = Counter()  # function anywhere in the stack
+        self.stacks = Counter()  # collapsed stacks (flame graph input)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+
+                if (os.path.basename(codes[0].co_filename), codes[0].co_name) in IDLE_FRAMES:
+                    continue
+
+                self.samples += 1
+                self.own[_location(codes[0])] += 1
+                for location in {_location(code) for code in codes}:
+                    self.total[location] += 1
+                self.stacks[";".join(code.co_name for code in reversed(codes))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+# ---------------------------------------------------------
+# Profiler
+# ---------------------------------------------------------
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class Profiler:
+    async def run(name, action, top=25, save=False):
+        """
+        Runs `await action()` under the sampling profiler and tracemalloc, returns the report
+        (top functions by own / total samples, top allocation sites) and optionally saves it in profiling_dir.
+        Only one profile runs at a time (ProfilerBusy otherwise).
+
+        e.q: await Profiler.run("cron_h1", cron_h1)
+        """
+        if not _running.acquire(blocking=False):
+            raise ProfilerBusy("a profile is already running")
+
+        try:
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start(settings.profiling_traceback_frames)
+            before = tracemalloc.take_snapshot()
+
+            sampler = _Sampler(settings.profiling_sample_interval)
+            started = time.perf_counter()
+            sampler.start()
+            try:
+                await action()
+            finally:
+                sampler.stop()
+                seconds = time.perf_counter() - started
+                after = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                if not tracing:
+                    tracemalloc.stop()
+
+            report = Profiler.report(name, seconds, sampler, after.compare_to(before, "lineno"), top)
+            report["memory"] = {"traced_bytes": current, "peak_bytes": peak}
+            if save:
+                report["files"] = Profiler.save(name, report, sampler)
+            return report
+        finally:
+            _running.release()
+
+    def report(name, seconds, sampler, allocations, top):
+        samples = max(1, sampler.samples)
+
+        def functions(counter):
+            return [
+                {"function": location, "samples": count, "percent": round(count / samples * 100, 2)}
+                for location, count in counter.most_common(top)
+            ]
+
+        return {
+            "name": name,
+            "seconds": round(seconds, 3),
+            "samples": sampler.samples,
+            "sample_interval": sampler.interval,
+            "top_own": functions(sampler.own),
+            "top_total": functions(sampler.total),
+            "top_allocations": [
+                {"site": str(stat.traceback[0]), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in sorted(allocations, key=lambda stat: stat.size_diff, reverse=True)[:top]
+            ],
+        }
+
+    def save(name, report, sampler):
+        """
+        {profiling_dir}/{name}-{timestamp}.json (the report) and .collapsed (flame graph stacks)
+        """
+        os.makedirs(settings.profiling_dir, exist_ok=True)
+        prefix = os.path.join(settings.profiling_dir, f"{name}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}")
+
+        with open(f"{prefix}.json", "w") as f:
+            json.dump(report, f, indent=2)
+        with open(f"{prefix}.collapsed", "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in sampler.stacks.most_common())
+
+        logger.info(f"profile {name} saved to {prefix}.json")
+        return [f"{prefix}.json", f"{prefix}.collapsed"]
@@ -0,0 +1,313 @@
+import os
+from datetime import datetime, timezone
+
+from app.lib.lazy import lazy_import
+from app.lib.metrics import Metrics
+from app.lib.utils import IntervalHelper, Providers, provider_fetch_seconds
+from app.settings import logger, settings
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+CANDLE_COLUMNS = ["open", "high", "low", "close", "volume"]
+FRAME_COLUMNS = ["ticker", "interval", "date", *CANDLE_COLUMNS]
+# intervals (yahoo format) whose candles are dated by their calendar day
+DAILY_INTERVALS = ["1d", "5d", "1wk", "1mo", "3mo"]
+
+provider_cache_partitions = Metrics.counter(
+    "provider_cache_partitions_total", "partitions read from the provider cache", ["result"]
+)
+
+# ---------------------------------------------------------
+# Normalization: provider frames -> candles frames
+# ---------------------------------------------------------
+
+
+def empty_candles():
+    return pd.DataFrame({column: pd.Series(dtype="int64" if column == "date" else "float64") for column in FRAME_COLUMNS}).astype(
+        {"ticker": object, "interval": object}
+    )
+
+
+def frame_to_candles(ticker_data, ticker, interval):
+    """
+    convert a provider frame into a candles frame (epoch dates) ready for the database
+    """
+    frame = ticker_data.dropna(subset=["open", "high", "low", "close"])
+    dates = pd.DatetimeIndex(frame["date"])
+
+    # align to the candle open time (yahoo stamps the live candle with the last trade time)
+    if IntervalHelper.to_yahoo_format(interval) in DAILY_INTERVALS:
+        # the exchange-local calendar date: a Tokyo session opens the previous day in UTC
+        dates = (dates.tz_localize(None) if dates.tz is not None else dates).normalize()
+        epochs = dates.as_unit("s").asi8
+    else:
+        seconds = IntervalHelper.to_seconds(interval) or 60
+        if dates.tz is not None:
+            dates = dates.tz_convert("UTC").tz_localize(None)
+        epochs = dates.as_unit("s").asi8 // seconds * seconds
+
+    candles = pd.DataFrame(
+        {
+            "ticker": ticker,
+            "interval": IntervalHelper.normalize(interval),
+            "date": epochs,
+            **{column: frame[column].to_numpy(dtype="float64") for column in CANDLE_COLUMNS},
+        }
+    )
+    candles["volume"] = candles["volume"].fillna(0.0)
+
+    return candles.drop_duplicates(subset="date", keep="last").reset_index(drop=True)
+
+
+def split_candles(ticker_data, tickers, interval):
+    """
+    split a batched provider frame (columns grouped by ticker) into {ticker: candles frame},
+    tickers without data are left out
+    """
+    candles = {}
+    available = set(ticker_data.columns.get_level_values(0)) if len(ticker_data.columns) else set()
+    for ticker in tickers:
+        if ticker not in available:
+            continue
+        frame = ticker_data[ticker].copy()
+        frame["date"] = frame.index
+        candles[ticker] = frame_to_candles(frame, ticker, interval)
+    return candles
+
+
+def _epoch(value):
+    if value is None:
+        return int(datetime.now(timezone.utc).timestamp())
+    if isinstance(value, datetime):
+        return int((value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp())
+    return int(value)
+
+
+# ---------------------------------------------------------
+# Providers: fetch(tickers, interval, start, end) -> candles frame
+# ---------------------------------------------------------
+
+
+class BaseProvider:
+    name = ""
+
+    def fetch(self, tickers, interval, start, end=None):
+        """
+        candles of `tickers` with start <= date < end (end defaults to now), as one long frame:
+        ticker, interval, date (epoch seconds), open, high, low, close, volume.
+        tickers without data are left out
+        """
+        raise NotImplementedError
+
+
+class YahooProvider(BaseProvider):
+    name = "yahoo"
+
+    def fetch(self, tickers, interval, start, end=None):
+        tickers = list(tickers)
+        ticker_data = Providers.yahoofinance(
+            tickers,
+            datetime.fromtimestamp(_epoch(start), timezone.utc),
+            datetime.fromtimestamp(_epoch(end), timezone.utc) if end is not None else None,
+            interval=IntervalHelper.to_yahoo_format(interval),
+        )
+        start, end = _epoch(start), _epoch(end)
+
+        frames = [frame for frame in split_candles(ticker_data, tickers, interval).values() if len(frame) > 0]
+        if not frames:
+            return empty_candles()
+        candles = pd.concat(frames, ignore_index=True)
+        return candles[(candles["date"] >= start) & (candles["date"] < end)].reset_index(drop=True)
+
+
+class ReplayProvider(BaseProvider):
+    """
+    candles read from local files: {directory}/{interval}/{ticker}.parquet or .csv
+    with a date column (ISO or epoch seconds) and open, high, low, close, volume.
+    an offline source for development and benchmarks
+    """
+
+    name = "replay"
+
+    def __init__(self, directory=None):
+        self.directory = directory
+
+    def _read(self, ticker, interval):
+        folder = os.path.join(self.directory or settings.provider_replay_dir, IntervalHelper.normalize(interval))
+        for extension, reader in [(".parquet", pd.read_parquet), (".csv", pd.read_csv)]:
+            path = os.path.join(folder, f"{ticker}{extension}")
+            if os.path.exists(path):
+                return reader(path)
+        return None
+
+    @Metrics.timed(provider_fetch_seconds, provider="replay")
+    def fetch(self, tickers, interval, start, end=None):
+        start, end = _epoch(start), _epoch(end)
+
+        frames = []
+        for ticker in tickers:
+            data = self._read(ticker, interval)
+            if data is None or len(data) == 0:
+                continue
+            if pd.api.types.is_numeric_dtype(data["date"]):
+                data["date"] = pd.to_datetime(data["date"], unit="s", utc=True)
+            else:
+                data["date"] = pd.to_datetime(data["date"], utc=True)
+            candles = frame_to_candles(data, ticker, interval)
+            frames.append(candles[(candles["date"] >= start) & (candles["date"] < end)])
+
+        frames = [frame for frame in frames if len(frame) > 0]
+        return pd.concat(frames, ignore_index=True) if frames else empty_candles()
+
+
+# ---------------------------------------------------------
+# Cache: closed candles are kept on disk, one parquet file
+# per ticker / interval / month (intraday) or year
+# ---------------------------------------------------------
+
+
+class CachedProvider(BaseProvider):
+    """
+    wraps a provider: partitions that are closed (their last candle is over) and were
+    downloaded in full are written to {directory}/{provider}/{interval}/{ticker}/{partition}.parquet
+    and never downloaded again; only the uncached part of a request reaches the provider
+    """
+
+    def __init__(self, provider, directory=None):
+        self.provider = provider
+        self.name = provider.name
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def partitions(self, interval, start, end):
+        """
+        [(label, start, end)] of the partitions overlapping [start, end)
+        """
+        unit = "M" if (IntervalHelper.to_seconds(interval) or 86400) < 86400 else "Y"
+        first = np.datetime64(start, "s").astype(f"datetime64[{unit}]")
+        last = np.datetime64(end - 1, "s").astype(f"datetime64[{unit}]")
+        bounds = np.arange(first, last + 2).astype("datetime64[s]").astype("int64")
+        labels = np.arange(first, last + 1).astype(str)
+        return list(zip(labels, bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    def _path(self, ticker, interval, label):
+        folder = os.path.join(
+            self.directory or settings.provider_cache_dir, self.name, IntervalHelper.normalize(interval), ticker
+        )
+        return os.path.join(folder, f"{label}.parquet")
+
+    def _load(self, ticker, interval, label):
+        path = self._path(ticker, interval, label)
+        if not os.path.exists(path):
+            return None
+        try:
+            data = pd.read_parquet(path)
+        except Exception as e:
+            logger.warning(f"provider cache: unreadable {path}, downloading it again: {e}")
+            return None
+        data.insert(0, "interval", IntervalHelper.normalize(interval))
+        data.insert(0, "ticker", ticker)
+        return data
+
+    def _store(self, candles, ticker, interval, label):
+        path = self._path(ticker, interval, label)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        candles[["date", *CANDLE_COLUMNS]].to_parquet(temp_path, index=False)
+        os.replace(temp_path, path)
+
+    def fetch(self, tickers, interval, start, end=None):
+        start, end = _epoch(start), _epoch(end)
+        if start >= end:
+            return empty_candles()
+
+        # a partition can be cached once its last candle is closed
+        closed_before = _epoch(None) - (IntervalHelper.to_seconds(interval) or 86400)
+        partitions = self.partitions(interval, start, end)
+
+        frames, missing = [], {}
+        for ticker in tickers:
+            ranges = []
+            for label, partition_start, partition_end in partitions:
+                cached = self._load(ticker, interval, label) if partition_end <= closed_before else None
+                if cached is not None:
+                    self.hits += 1
+                    provider_cache_partitions.inc(result="hit")
+                    frames.append(cached)
+                    continue
+
+                self.misses += 1
+                provider_cache_partitions.inc(result="miss")
+                if ranges and ranges[-1][1] == partition_start:
+                    ranges[-1] = (ranges[-1][0], min(end, partition_end))
+                else:
+                    ranges.append((max(start, partition_start), min(end, partition_end)))
+
+            # one download per uncached run of partitions, shared by the tickers missing the same run
+            for download_range in ranges:
+                missing.setdefault(download_range, []).append(ticker)
+
+        for (download_start, download_end), pending in missing.items():
+            downloaded = self.provider.fetch(pending, interval, download_start, download_end)
+            frames.append(downloaded)
+
+            # only partitions downloaded from their first to their last candle are complete
+            for label, partition_start, partition_end in partitions:
+                if partition_start < download_start or partition_end > download_end or partition_end > closed_before:
+                    continue
+                rows = downloaded[(downloaded["date"] >= partition_start) & (downloaded["date"] < partition_end)]
+                for ticker, candles in rows.groupby("ticker", sort=False):
+                    self._store(candles, ticker, interval, label)
+
+        frames = [frame for frame in frames if len(frame) > 0]
+        if not frames:
+            return empty_candles()
+
+        candles = pd.concat(frames, ignore_index=True)
+        candles = candles[(candles["date"] >= start) & (candles["date"] < end)]
+        candles = candles.drop_duplicates(subset=["ticker", "date"], keep="last").sort_values(["ticker", "date"], kind="stable")
+        return candles[FRAME_COLUMNS].reset_index(drop=True)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+# ---------------------------------------------------------
+# Registry
+# ---------------------------------------------------------
+
+_providers = {"yahoo": YahooProvider(), "replay": ReplayProvider()}
+_cached = {}
+
+
+def register_provider(name, provider):
+    """
+    make a provider available to get_provider(name) (and to MARKET_DATA_PROVIDER)
+    """
+    _providers[name] = provider
+    _cached.pop(name, None)
+
+
+def get_provider(name=None):
+    """
+    the provider `name` (default: settings.market_data_provider),
+    wrapped in the on-disk cache when provider_cache_enabled is set
+    """
+    name = name or settings.market_data_provider
+    if name not in _providers:
+        raise ValueError(f"unknown market data provider '{name}', available: {', '.join(_providers)}")
+
+    if not settings.provider_cache_enabled:
+        return _providers[name]
+
+    if name not in _cached:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.warning("provider cache: pyarrow is not installed, the cache is disabled")
+            _cached[name] = _providers[name]
+        else:
+            _cached[name] = CachedProvider(_providers[name])
+    return _cached[name]
@@ -0,0 +1,120 @@
+import asyncio
+
+from app.lib.metrics import Metrics
+
+pubsub_messages = Metrics.counter("pubsub_messages_total", "messages published, delivered and dropped", ["bus", "outcome"])
+pubsub_subscribers = Metrics.gauge("pubsub_subscribers", "connected subscribers", ["bus"])
+
+
+class SlowConsumer(Exception):
+    """
+    the subscriber queue was full: the subscription was dropped
+    """
+
+
+# ---------------------------------------------------------
+# Subscription: a bounded queue per client
+# ---------------------------------------------------------
+
+
+class Subscription:
+    def __init__(self, bus, topic, queue_size):
+        self.bus = bus
+        self.topic = topic
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+    async def get(self):
+        """
+        the next message, raises SlowConsumer once the subscription was dropped
+        """
+        if self.dropped:
+            raise SlowConsumer(f"{self.bus.name}: {self.topic} subscriber fell {self.queue.maxsize} messages behind")
+        return await self.queue.get()
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ---------------------------------------------------------
+# PubSub: in-process fan-out of messages to the subscribers
+# of a topic; publishing never waits for a subscriber
+# ---------------------------------------------------------
+
+
+class PubSub:
+    """
+    - subscribe(topic): a Subscription (bounded queue), on the event loop
+    - publish(topic, message): from any thread; a subscriber whose queue is full is dropped
+      instead of slowing down the publisher or the other subscribers
+    """
+
+    def __init__(self, name, queue_size=100):
+        self.name = name
+        self.queue_size = queue_size
+        self._loop = None
+        self._topics = {}  # topic -> set of subscriptions
+        self.stats_values = {"published": 0, "delivered": 0, "dropped": 0}
+
+    def subscribe(self, topic):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._topics = loop, {}
+
+        subscription = Subscription(self, topic, self.queue_size)
+        self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscriptions = self._topics.get(subscription.topic)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._topics[subscription.topic]
+
+    def has_subscribers(self, topic):
+        return bool(self._topics.get(topic))
+
+    def publish(self, topic, message):
+        """
+        thread-safe: the fan-out runs on the event loop of the subscribers
+        """
+        loop = self._loop
+        if not self.has_subscribers(topic) or loop is None or loop.is_closed():
+            return
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fanout(topic, message)
+        else:
+            loop.call_soon_threadsafe(self._fanout, topic, message)
+
+    def _fanout(self, topic, message):
+        self._count("published")
+        for subscription in list(self._topics.get(topic, ())):
+            try:
+                subscription.queue.put_nowait(message)
+                self._count("delivered")
+            except asyncio.QueueFull:
+                subscription.dropped = True
+                self.unsubscribe(subscription)
+                self._count("dropped")
+
+    def _count(self, outcome):
+        self.stats_values[outcome] += 1
+        pubsub_messages.inc(bus=self.name, outcome=outcome)
+
+    def stats(self):
+        subscribers = sum(len(subscriptions) for subscriptions in self._topics.values())
+        pubsub_subscribers.set(subscribers, bus=self.name)
+        return {"topics": len(self._topics), "subscribers": subscribers, **self.stats_values}
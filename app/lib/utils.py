@@ -1,7 +1,10 @@
-import httpx
-import yfinance as yf
+from datetime import datetime, timezone
+
+from app.lib.lazy import lazy_import
+from app.lib.metrics import Metrics
+
+yf = lazy_import("yfinance")
 
-from app.settings import logger, settings
 
 # ---------------------------------------------------------
 # Interval Helper
@@ -14,6 +17,8 @@ class IntervalHelper:
     h1 = "h1"
     h4 = "h4"
     d1 = "d1"
+    w1 = "w1"
+    mn1 = "mn1"
 
     def normalize(value):
         """
@@ -21,11 +26,13 @@ class IntervalHelper:
         """
         v = IntervalHelper
         intervalDict = {
-            5: v.m5, "m5": v.m5, "5": v.m5, # m5
-            15: v.m15, "m15": v.m15, "15": v.m15, # m15
+            5: v.m5, "m5": v.m5, "5": v.m5, "5m": v.m5, # m5
+            15: v.m15, "m15": v.m15, "15": v.m15, "15m": v.m15, # m15
             60: v.h1, "1h": v.h1, "1H": v.h1, "h1": v.h1, "H1": v.h1, # h1
             240: v.h4, "4h": v.h4, "4H": v.h4, "h4": v.h4, "H4": v.h4, # h4
             "d1": v.d1, "1d": v.d1, "D1": v.d1, "1D": v.d1, "D": v.d1, # d1
+            "w1": v.w1, "1w": v.w1, "W1": v.w1, "1W": v.w1, "W": v.w1, "1wk": v.w1, # w1
+            "mn1": v.mn1, "MN1": v.mn1, "1M": v.mn1, "M": v.mn1, "1mo": v.mn1, # mn1
         }  # fmt: off
 
         return intervalDict.get(value, value)
@@ -36,16 +43,55 @@ class IntervalHelper:
             15: "15m", "m15": "15m", "15": "15m",  # 15m
             60: "1h", "1H": "1h", "h1": "1h", "H1": "1h", # 1h
             "d1": "1d", "1d": "1d", "D1": "1d", "1D": "1d", "D": "1d",  # 1d
+            "w1": "1wk", "1w": "1wk", "W1": "1wk", "1W": "1wk", "W": "1wk",  # 1wk
+            "mn1": "1mo", "MN1": "1mo", "1M": "1mo", "M": "1mo",  # 1mo
         }  # fmt: off
         return intervalDict.get(interval, interval)
 
+    # intervals the provider serves (yahoo format): the others are built by resampling
+    downloadable = ["1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h", "1d", "5d", "1wk", "1mo", "3mo"]
+
+    def to_seconds(interval):
+        """
+        duration of one candle, e.g. "1h" -> 3600
+        """
+        v = IntervalHelper
+        secondsDict = {v.m5: 300, v.m15: 900, v.h1: 3600, v.h4: 14400, v.d1: 86400, v.w1: 604800}
+        return secondsDict.get(IntervalHelper.normalize(interval))
+
+
+# ---------------------------------------------------------
+# Date Helper
+# ---------------------------------------------------------
+
+
+class DateHelper:
+    def to_epoch(value):
+        """
+        epoch seconds from an epoch number or an ISO date ("2025-01-31", "2025-01-31T10:00:00").
+        naive dates are UTC
+        """
+        if value is None or value == "":
+            return None
+        if isinstance(value, (int, float)) or str(value).lstrip("-").isdigit():
+            return int(value)
+
+        date = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        return int(date.timestamp())
+
 
 # ---------------------------------------------------------
 # Providers (yahoo-finance)
 # ---------------------------------------------------------
 
 
+provider_fetch_seconds = Metrics.histogram("provider_fetch_seconds", "market data downloads", ["provider", "outcome"])
+
+
 class Providers:
+    @Metrics.timed(provider_fetch_seconds, provider="yahoo")
     def yahoofinance(
         ticker,
         start=None,
@@ -79,77 +125,3 @@ class Providers:
             yf_data["date"] = yf_data.index
 
         return yf_data
-
-
-# ---------------------------------------------------------
-# Notifier
-# ---------------------------------------------------------
-
-
-class Notifier:
-    async def send_telegram_message_async(message_text: str):
-        """
-        Sends a text message asynchronously to telegram
-        This function will be run in the background.
-
-        e.q: asyncio.create_task(send_telegram_message_async("hello bot"))
-        """
-        if not settings.notifier_telegram_token:
-            return
-
-        if settings.notifier_telegram_token and not settings.notifier_telegram_chat_id:
-            logger.warning("telegram_chat_id is empty")
-            return
-
-        if not settings.notifier_telegram_chat_id:
-            return
-
-        if not message_text:
-            logger.warning("telegram: message is empty")
-            return
-
-        url = f"https://api.telegram.org/bot{settings.notifier_telegram_token}/sendMessage"
-        payload = {"chat_id": settings.notifier_telegram_chat_id, "text": message_text, "parse_mode": "Markdown"}
-
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(url, data=payload, timeout=10.0)
-                response.raise_for_status()
-                logger.info("telegram: message sent to chat")
-                return "ok"
-            except httpx.HTTPStatusError as e:
-                logger.warning(f"telegram: background task failed: {e.response.status_code} - {e.response.text}")
-                return "failed"
-            except httpx.RequestError as e:
-                logger.warning(f"telegram: background task network error: {e}")
-                return "failed"
-
-    async def send_discord_message_async(message_text: str):
-        """
-        Sends a text message asynchronously to discord
-        This function will be run in the background.
-
-        e.q: asyncio.create_task(send_discord_message_async("hello bot"))
-        """
-        if not settings.notifier_discord_webhook_url:
-            return
-
-        if not message_text:
-            logger.warning("discord: message is empty")
-            return
-
-        url = f"{settings.notifier_discord_webhook_url}"
-        payload = {"content": message_text}
-
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(url, data=payload, timeout=10.0)
-                response.raise_for_status()
-                logger.info("discord: message sent to chat")
-                return "ok"
-            except httpx.HTTPStatusError as e:
-                logger.warning(f"discrod: background task failed: {e.response.status_code} - {e.response.text}")
-                return "failed"
-            except httpx.RequestError as e:
-                logger.warning(f"discord: background task network error: {e}")
-                return "failed"
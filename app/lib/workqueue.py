@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import itertools
+
+from app.lib.executor import Executor
+from app.lib.metrics import Metrics
+from app.settings import logger
+
+work_items = Metrics.counter(
+    "work_items_total", "work items by outcome (done, failed, retried, stale, coalesced)", ["queue", "outcome"]
+)
+work_lag_seconds = Metrics.histogram("work_lag_seconds", "delay between an item being ready and starting", ["queue"])
+work_queue_depth = Metrics.gauge("work_queue_depth", "items waiting (ready or delayed)", ["queue"])
+
+
+class StaleWork(Exception):
+    """
+    the item missed its deadline before a worker could start it
+    """
+
+
+class _Item:
+    def __init__(self, group, key, priority, deadline, ready_at, future):
+        self.group = group
+        self.key = key
+        self.priority = priority
+        self.deadline = deadline  # loop time, None: no deadline
+        self.ready_at = ready_at
+        self.future = future
+        self.attempts = 0
+
+
+def _copy_result(source, target):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+# ---------------------------------------------------------
+# WorkQueue: per-key work items, batched per group, run on
+# a bounded number of workers
+# ---------------------------------------------------------
+
+
+class WorkQueue:
+    """
+    handler(group, keys) runs on the I/O executor and returns {key: result}; a key missing from the result
+    (or mapped to an exception) is retried. Items of the same group that are ready together are handed
+    to the handler in batches of at most batch_size (e.g. one provider download for many tickers).
+
+    - priority: lower runs first
+    - deadline: seconds from now; an item not started by then is skipped (its future raises StaleWork)
+    - delay: seconds before the item becomes ready (jitter)
+    - an item submitted while the same (group, key) is still waiting joins it instead of running twice
+    """
+
+    def __init__(self, name, handler, concurrency=2, batch_size=50, max_retries=2, retry_delay=30.0):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._loop = None
+        self._ready = []  # heap of (priority, ready_at, seq, item)
+        self._delayed = 0
+        self._waiting = {}  # (group, key) -> item not started yet
+        self._running = 0
+        self._wakeup = None  # set whenever an item becomes ready
+        self._workers = []
+        self._sequence = itertools.count()
+        self.stats_values = {"done": 0, "failed": 0, "retried": 0, "stale": 0, "coalesced": 0}
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._ready, self._delayed, self._waiting, self._running = [], 0, {}, 0
+        self._wakeup = asyncio.Event()
+        self._workers = [loop.create_task(self._run(), name=f"workqueue-{self.name}-{i}") for i in range(self.concurrency)]
+
+    def submit(self, group, key, priority=0, deadline=None, delay=0.0):
+        """
+        returns a future resolved with the handler result of `key`
+        """
+        self._start()
+        waiting = self._waiting.get((group, key))
+        if waiting is not None:
+            self._count("coalesced")
+            return waiting.future
+
+        now = self._loop.time()
+        item = _Item(group, key, priority, now + deadline if deadline else None, now + delay, self._loop.create_future())
+        self._waiting[(group, key)] = item
+        self._schedule(item, delay)
+        return item.future
+
+    def _schedule(self, item, delay):
+        if delay > 0:
+            self._delayed += 1
+            self._loop.call_later(delay, self._make_ready, item)
+        else:
+            self._make_ready(item, delayed=False)
+
+    def _make_ready(self, item, delayed=True):
+        self._delayed -= 1 if delayed else 0
+        item.ready_at = self._loop.time()
+        heapq.heappush(self._ready, (item.priority, item.ready_at, next(self._sequence), item))
+        self._wakeup.set()
+
+    def _pop_ready(self, now):
+        """
+        the next ready entry, items past their deadline are skipped on the way
+        """
+        while self._ready:
+            entry = heapq.heappop(self._ready)
+            item = entry[3]
+            if item.deadline is not None and now > item.deadline:
+                self._finish(item, exception=StaleWork(f"{self.name}: {item.key} missed its deadline"), outcome="stale")
+                continue
+            return entry
+        return None
+
+    def _next_batch(self):
+        """
+        the highest priority ready item, plus the ready items of the same group (up to batch_size)
+        """
+        now = self._loop.time()
+        first = self._pop_ready(now)
+        if first is None:
+            return []
+
+        batch, others = [first[3]], []
+        while len(batch) < self.batch_size and (entry := self._pop_ready(now)) is not None:
+            if entry[3].group == batch[0].group:
+                batch.append(entry[3])
+            else:
+                others.append(entry)
+        for entry in others:
+            heapq.heappush(self._ready, entry)
+        return batch
+
+    async def _run(self):
+        while True:
+            while not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            now = self._loop.time()
+            for item in batch:
+                self._waiting.pop((item.group, item.key), None)
+                lag = now - item.ready_at
+                self.last_lag, self.max_lag = lag, max(self.max_lag, lag)
+                work_lag_seconds.observe(lag, queue=self.name)
+
+            self._running += len(batch)
+            try:
+                results = await Executor.run_io(self.handler, batch[0].group, [item.key for item in batch])
+                error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                results, error = {}, e
+                logger.warning(f"{self.name}: batch of {len(batch)} {batch[0].group} items failed: {e}")
+            finally:
+                self._running -= len(batch)
+
+            for item in batch:
+                result = results.get(item.key, error or KeyError(item.key))
+                if isinstance(result, Exception):
+                    self._retry(item, result)
+                else:
+                    self._finish(item, result=result, outcome="done")
+
+    def _retry(self, item, error):
+        item.attempts += 1
+        delay = self.retry_delay * 2 ** (item.attempts - 1)
+        too_late = item.deadline is not None and self._loop.time() + delay > item.deadline
+        if item.attempts > self.max_retries or too_late:
+            logger.warning(f"{self.name}: {item.group} {item.key} failed after {item.attempts} attempts: {error}")
+            self._finish(item, exception=error, outcome="failed")
+            return
+
+        self._count("retried")
+        waiting = self._waiting.get((item.group, item.key))
+        if waiting is not None:
+            # submitted again while it was running: the waiting item answers both
+            waiting.future.add_done_callback(lambda future: _copy_result(future, item.future))
+            return
+        self._waiting[(item.group, item.key)] = item
+        self._schedule(item, delay)
+
+    def _finish(self, item, result=None, exception=None, outcome="done"):
+        self._count(outcome)
+        if self._waiting.get((item.group, item.key)) is item:
+            del self._waiting[(item.group, item.key)]
+        if item.future.done():
+            return
+        if exception is not None:
+            item.future.set_exception(exception)
+        else:
+            item.future.set_result(result)
+
+    def _count(self, outcome):
+        self.stats_values[outcome] += 1
+        work_items.inc(queue=self.name, outcome=outcome)
+
+    async def shutdown(self):
+        if self._loop is not asyncio.get_running_loop():
+            return
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        for _, _, _, item in self._ready:
+            if not item.future.done():
+                item.future.cancel()
+        self._workers, self._loop = [], None
+
+    def stats(self):
+        ready = len(self._ready)
+        work_queue_depth.set(ready + self._delayed, queue=self.name)
+        return {
+            "ready": ready,
+            "delayed": self._delayed,
+            "running": self._running,
+            **self.stats_values,
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+        }
@@ -1,19 +1,40 @@
 import asyncio
 import os
-from collections import deque
+import time
 from contextlib import asynccontextmanager
 from datetime import date, timedelta
 
-import aiofiles
-import pandas as pd
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import PlainTextResponse
-
-from app.cronjob import cron_d1, cron_h1, cron_initialize, cron_shutdown
-from app.database import create_db_and_tables, db
-from app.lib.utils import IntervalHelper, Notifier
-from app.settings import settings
+from fastapi import Body, FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from app import started_at
+from app.cronjob import cron_d1, cron_gaps, cron_h1, cron_initialize, cron_retention, cron_shutdown, cron_stats
+from app.database import PANEL_FIELDS, create_db_and_tables, db, ohlc_cache
+from app.lib.executor import Executor
+from app.lib.formats import OHLCFormats
+from app.lib.lazy import lazy_import
+from app.lib.logs import LogFilter, tail
+from app.lib.logs import follow as follow_log
+from app.lib.metrics import Metrics, MetricsMiddleware
+from app.lib.notifier import Notifier
+from app.lib.profiling import Profiler, ProfilerBusy
+from app.lib.pubsub import SlowConsumer
+from app.lib.utils import DateHelper, IntervalHelper
+from app.settings import logger, settings
+from app.tasks.alerts import run_alerts, validate_rule
+from app.tasks.backfill import backfill
+from app.tasks.gaps import fill_gaps, get_coverage
+from app.tasks.indicators import indicators_initialize
 from app.tasks.refresh_ticker import refresh_ticker_by_interval
+from app.tasks.resample import resample_initialize
+from app.tasks.stream import candle_bus, stream_initialize, stream_shutdown
+
+pd = lazy_import("pandas")
+
+# cold start: module imports, then lifespan initialization (seconds)
+startup_timings = {"imports": time.perf_counter() - started_at}
+startup_seconds = Metrics.gauge("startup_seconds", "cold start: module imports, then lifespan initialization", ["phase"])
 
 # ---------------------------------------------------------
 # Events: lifespan
@@ -23,11 +44,23 @@ from app.tasks.refresh_ticker import refresh_ticker_by_interval
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # startup...
-    cron_initialize()
+    initialize_started_at = time.perf_counter()
     create_db_and_tables()
+    cron_initialize()
+    resample_initialize()
+    indicators_initialize()
+    stream_initialize()
+    startup_timings["initialize"] = time.perf_counter() - initialize_started_at
+    startup_timings["total"] = time.perf_counter() - started_at
+    for phase, seconds in startup_timings.items():
+        startup_seconds.set(seconds, phase=phase)
+    logger.info(f"startup: {', '.join(f'{phase} {seconds * 1000:.0f}ms' for phase, seconds in startup_timings.items())}")
     yield
     # shutdown...
-    cron_shutdown()
+    await cron_shutdown()
+    await stream_shutdown()
+    await Notifier.shutdown()
+    Executor.shutdown()
 
 
 # ---------------------------------------------------------
@@ -35,6 +68,7 @@ async def lifespan(app: FastAPI):
 # ---------------------------------------------------------
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/")
@@ -70,7 +104,17 @@ def delete_settings(key: str):
 
 
 @app.post("/settings")
-def save_settings(key: str, value: str):
+def save_settings(key: str | None = None, value: str | None = None, values: dict[str, str] | None = Body(default=None)):
+    """
+    a single key (?key=...&value=...) or many keys as a JSON object, saved in one transaction
+    """
+    if values:
+        db.settings.set_many(values)
+        return {"settings": values}
+
+    if key is None or value is None:
+        raise HTTPException(status_code=422, detail="Send key and value, or a JSON object of settings.")
+
     db.settings.set(key, value)
     return {"key": key, "value": value}
 
@@ -81,7 +125,19 @@ def save_settings(key: str, value: str):
 
 
 @app.get("/logs", response_class=PlainTextResponse)
-async def show_logs(lines: int = 1000, prev: int = 0):
+async def show_logs(
+    lines: int = 1000,
+    prev: int = 0,
+    level: str | None = None,
+    contains: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    follow: bool = False,
+):
+    """
+    level: minimum level, contains: substring, since/until: ISO dates (server local time).
+    follow: keep the connection open and push new lines (server-sent events)
+    """
     log_file_path = f"data/{settings.log_file.replace('.log', '')}.log"
 
     if prev > 0:
@@ -92,30 +148,40 @@ async def show_logs(lines: int = 1000, prev: int = 0):
         raise HTTPException(status_code=404, detail=f"Log file '{log_file_path}' not found.")
 
     try:
-        async with aiofiles.open(log_file_path, mode="r", encoding="utf-8") as f:
-            # Read all lines, but deque only keeps the last X in memory
-            # This is efficient for large files as it avoids a full list in memory.
-            last_lines = deque(await f.readlines(), maxlen=max(10, lines))
-
-        content = "".join(last_lines)
+        log_filter = LogFilter(level=level, contains=contains, since=since, until=until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {str(e)}")
 
-        return PlainTextResponse(content=content, headers={"Content-Disposition": "inline; filename=app.log"})
+    try:
+        content = await Executor.run_io(tail, log_file_path, max(10, lines), log_filter)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading log file: {str(e)}")
 
+    if follow and prev == 0:
+
+        async def events():
+            for line in content.splitlines():
+                yield f"data: {line}\n\n"
+            async for line in follow_log(log_file_path, log_filter):
+                yield f"data: {line.rstrip()}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    return PlainTextResponse(content=content, headers={"Content-Disposition": "inline; filename=app.log"})
+
 
 # ---------------------------------------------------------
 # Routes: Cronjob
 # ---------------------------------------------------------
 
 
+cron_jobs = {"h1": cron_h1, "d1": cron_d1, "retention": cron_retention, "gaps": cron_gaps}
+
+
 @app.get("/cronjob/{interval}")
 async def cronjob_run(interval: str):
-    if interval == "h1":
-        await cron_h1()
-
-    if interval == "d1":
-        await cron_d1()
+    if interval in cron_jobs:
+        await cron_jobs[interval]()
 
     return {"interval": interval}
 
@@ -128,15 +194,15 @@ async def cronjob_run(interval: str):
 @app.get("/telegram")
 async def send_telegram(msg: str):
     message = msg or "hello from template-bot"
-    asyncio.create_task(Notifier.send_telegram_message_async(message))
-    return {"message": message}
+    status = await Notifier.send_telegram_message_async(message)
+    return {"message": message, "status": status}
 
 
 @app.get("/discord")
 async def send_discord(msg: str):
     message = msg or "hello from template-bot"
-    asyncio.create_task(Notifier.send_discord_message_async(message))
-    return {"message": message}
+    status = await Notifier.send_discord_message_async(message)
+    return {"message": message, "status": status}
 
 
 # ---------------------------------------------------------
@@ -145,20 +211,50 @@ async def send_discord(msg: str):
 
 
 @app.get("/ohlc/{ticker}/{interval}")
-def ohlc_all_by_ticker(ticker: str, interval: str):
-    interval = IntervalHelper.normalize(interval)
-    records = db.ohlc.get_all(ticker=ticker, interval=interval, return_dataframe=True)
-
-    if isinstance(records, pd.DataFrame):
-        return records.to_dict(orient="records")
+def ohlc_all_by_ticker(
+    ticker: str,
+    interval: str,
+    start: str | None = None,
+    end: str | None = None,
+    limit: int | None = Query(default=None, ge=1),
+    cursor: int | None = None,
+    format: str = "json",
+):
+    """
+    start/end: ISO date or epoch seconds (inclusive), cursor: value of the X-Next-Cursor header of the previous page.
+    format: json, ndjson, csv or arrow
+    """
+    if not OHLCFormats.available(format):
+        raise HTTPException(status_code=400, detail=f"Format '{format}' is not available.")
 
-    return records
+    try:
+        query = {
+            "ticker": ticker,
+            "interval": IntervalHelper.normalize(interval),
+            "start": DateHelper.to_epoch(start),
+            "end": DateHelper.to_epoch(end),
+            "after": cursor,
+            "limit": limit,
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {str(e)}")
+
+    headers = {}
+    next_cursor = db.ohlc.next_cursor(**query)
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+
+    batches = db.ohlc.iter_batches(**query)
+    return StreamingResponse(OHLCFormats.encode(batches, format), media_type=OHLCFormats.media_types[format], headers=headers)
 
 
 @app.get("/ohlc/{ticker}/{interval}/refresh")
 def ohlc_refresh(ticker: str, interval: str):
     interval = IntervalHelper.normalize(interval)
-    records = refresh_ticker_by_interval(ticker=ticker, interval=interval)
+    try:
+        records = refresh_ticker_by_interval(ticker=ticker, interval=interval)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     if isinstance(records, pd.DataFrame):
         return records.to_dict(orient="records")
@@ -166,6 +262,345 @@ def ohlc_refresh(ticker: str, interval: str):
     return records
 
 
+def iso_date(epoch):
+    return None if epoch is None else pd.Timestamp(epoch, unit="s").strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def coverage_report(coverage):
+    """
+    coverage row with ISO dates, the completeness ratio and the gaps as records
+    """
+    return {
+        "ticker": coverage["ticker"],
+        "interval": coverage["interval"],
+        "calendar": coverage["calendar"],
+        "first_date": iso_date(coverage["first_date"]),
+        "last_date": iso_date(coverage["last_date"]),
+        "scanned_until": iso_date(coverage["scanned_until"]),
+        "expected": coverage["expected"],
+        "missing": coverage["missing"],
+        "completeness": round(1 - coverage["missing"] / coverage["expected"], 6) if coverage["expected"] else None,
+        "gaps": [
+            {"start": iso_date(start), "end": iso_date(end), "candles": candles} for start, end, candles in coverage["gaps"]
+        ],
+        "empty_windows": len(coverage["empty"]),
+    }
+
+
+@app.get("/ohlc/{ticker}/{interval}/coverage")
+def ohlc_coverage(ticker: str, interval: str, scan: bool = False):
+    """
+    missing candles of the series against its trading calendar, from the coverage index
+    (scan: compare again now, otherwise only series never scanned are)
+    """
+    try:
+        return coverage_report(get_coverage(ticker, interval, scan=scan))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/ohlc/{ticker}/{interval}/coverage/fill")
+def ohlc_coverage_fill(
+    ticker: str, interval: str, max_fetches: int | None = Query(default=None, ge=1), retry_empty: bool = False
+):
+    """
+    fetch only the missing windows from the provider. retry_empty: fetch again the windows
+    the provider had no candles for (recorded as holidays or halts)
+    """
+    try:
+        result = fill_gaps(ticker, interval, max_fetches=max_fetches, retry_empty=retry_empty)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**{key: value for key, value in result.items() if key != "coverage"}, "coverage": coverage_report(result["coverage"])}
+
+
+# ---------------------------------------------------------
+# Routes: Panel (many tickers, aligned on date)
+# ---------------------------------------------------------
+
+
+def nullable(values):
+    """
+    a float array as a JSON list (NaN -> null)
+    """
+    values = values.astype(object)
+    values[pd.isna(values)] = None
+    return values.tolist()
+
+
+@app.get("/panel/{interval}")
+def ohlc_panel(
+    interval: str,
+    tickers: str,
+    start: str | None = None,
+    end: str | None = None,
+    fields: str = "close",
+    ffill: bool = False,
+    format: str = "columns",
+):
+    """
+    candles of many tickers aligned on date, from one query. tickers and fields are comma separated
+    (fields: open, high, low, close, volume); ffill: a missing candle takes the previous value of the ticker.
+    format: columns ({"date": [...], "values": {field: {ticker: [...]}}}) or records ([{"date", "close.BTC-USD", ...}])
+    """
+    ticker_list = list(dict.fromkeys(ticker.strip() for ticker in tickers.split(",") if ticker.strip()))
+    if not ticker_list or len(ticker_list) > settings.panel_max_tickers:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {settings.panel_max_tickers} tickers.")
+    if format not in ("columns", "records"):
+        raise HTTPException(status_code=400, detail=f"Format '{format}' is not available.")
+
+    try:
+        start, end = DateHelper.to_epoch(start), DateHelper.to_epoch(end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {str(e)}")
+
+    field_list = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    if not field_list:
+        raise HTTPException(status_code=400, detail=f"Send at least one field of {', '.join(PANEL_FIELDS)}.")
+    try:
+        df = db.ohlc.get_panel(ticker_list, IntervalHelper.normalize(interval), start, end, field_list, ffill)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    dates = df.index.strftime("%Y-%m-%dT%H:%M:%S").tolist()
+    if format == "records":
+        df = df.astype(object).where(df.notna(), None)
+        df.columns = [f"{field}.{ticker}" for field, ticker in df.columns]
+        return [{"date": date, **row} for date, row in zip(dates, df.to_dict(orient="records"))]
+
+    return {
+        "interval": IntervalHelper.normalize(interval),
+        "tickers": ticker_list,
+        "date": dates,
+        "values": {field: {ticker: nullable(df[(field, ticker)].to_numpy()) for ticker in ticker_list} for field in field_list},
+    }
+
+
+# ---------------------------------------------------------
+# Routes: Live candles (pushed on every write of the series)
+# ---------------------------------------------------------
+
+
+def subscribe_candles(ticker, interval):
+    if candle_bus.stats()["subscribers"] >= settings.stream_max_subscribers:
+        raise HTTPException(status_code=503, detail="Too many stream subscribers.")
+    return candle_bus.subscribe((ticker, IntervalHelper.normalize(interval)))
+
+
+async def next_message(subscription):
+    """
+    the next message, or None when the stream was idle for stream_heartbeat_interval seconds
+    """
+    try:
+        return await asyncio.wait_for(subscription.get(), settings.stream_heartbeat_interval)
+    except TimeoutError:
+        return None
+
+
+@app.get("/ohlc/{ticker}/{interval}/stream")
+async def ohlc_stream(ticker: str, interval: str):
+    """
+    server-sent events: a `candles` event (JSON) whenever candles of the series are written.
+    a client that falls stream_queue_size messages behind gets a `dropped` event and is disconnected
+    """
+    subscription = subscribe_candles(ticker, interval)
+
+    async def events():
+        with subscription:
+            while True:
+                try:
+                    message = await next_message(subscription)
+                except SlowConsumer:
+                    yield "event: dropped\ndata: slow consumer\n\n"
+                    return
+                yield ": keepalive\n\n" if message is None else f"event: candles\ndata: {message}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.websocket("/ohlc/{ticker}/{interval}/ws")
+async def ohlc_websocket(websocket: WebSocket, ticker: str, interval: str):
+    """
+    websocket: the same `candles` messages as the event stream, plus {"event":"heartbeat"} when idle.
+    a client that falls behind is closed with code 1013
+    """
+    await websocket.accept()
+    try:
+        subscription = subscribe_candles(ticker, interval)
+    except HTTPException as e:
+        await websocket.close(code=1013, reason=e.detail)
+        return
+
+    with subscription:
+        try:
+            while True:
+                try:
+                    message = await next_message(subscription)
+                except SlowConsumer:
+                    await websocket.close(code=1013, reason="slow consumer")
+                    return
+                await websocket.send_text('{"event":"heartbeat"}' if message is None else message)
+        except WebSocketDisconnect:
+            pass
+
+
+# ---------------------------------------------------------
+# Routes: Indicators
+# ---------------------------------------------------------
+
+
+@app.get("/indicators/{ticker}/{interval}")
+def indicators_by_ticker(ticker: str, interval: str, names: str | None = None, start: str | None = None, end: str | None = None):
+    """
+    names: comma separated (e.g. ema20,rsi14), default: every stored indicator
+    """
+    try:
+        start, end = DateHelper.to_epoch(start), DateHelper.to_epoch(end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {str(e)}")
+
+    name_list = [name.strip() for name in names.split(",")] if names else None
+    df = db.indicators.get_all(ticker, IntervalHelper.normalize(interval), name_list, start, end)
+    df = df.astype(object).where(df.notna(), None)
+    return df.reset_index().to_dict(orient="records")
+
+
+# ---------------------------------------------------------
+# Routes: Alerts (rules evaluated after every refresh)
+# ---------------------------------------------------------
+
+
+class AlertRuleUpdate(BaseModel):
+    ticker: str | None = None
+    interval: str | None = None
+    condition: str | None = None  # above, below, cross_above, cross_below, pct_change
+    field: str | None = None  # candle column or configured indicator (e.g. "rsi14"), default close
+    value: float | None = None  # threshold, percent for pct_change (negative: a drop)
+    reference: str | None = None  # compare with this series instead of value (e.g. "ema20")
+    period: int | None = None  # pct_change: candles back
+    cooldown: float | None = None  # seconds, default ALERT_COOLDOWN
+    note: str | None = None
+    enabled: bool | None = None
+
+
+class AlertRuleCreate(AlertRuleUpdate):
+    ticker: str
+    interval: str
+    condition: str
+
+
+ALERT_RULE_FIELDS = list(AlertRuleUpdate.model_fields)
+
+
+@app.get("/alerts")
+def alerts_all(ticker: str | None = None, interval: str | None = None):
+    return db.alerts.all(ticker, IntervalHelper.normalize(interval) if interval else None)
+
+
+@app.post("/alerts")
+def alerts_create(rule: AlertRuleCreate):
+    try:
+        return db.alerts.create(validate_rule(rule.model_dump()))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/alerts/{rule_id}")
+def alerts_get(rule_id: int):
+    rule = db.alerts.get(rule_id)
+    if rule is None:
+        raise HTTPException(status_code=404, detail=f"Alert rule {rule_id} not found.")
+    return rule
+
+
+@app.patch("/alerts/{rule_id}")
+def alerts_update(rule_id: int, update: AlertRuleUpdate):
+    """
+    the condition is evaluated afresh: a rule whose new condition already holds alerts at the next refresh
+    """
+    rule = alerts_get(rule_id)
+    values = {**{name: rule[name] for name in ALERT_RULE_FIELDS}, **update.model_dump(exclude_unset=True)}
+    try:
+        values = {"value": None, "reference": None, **validate_rule(values), "active": False}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return db.alerts.update(rule_id, values)
+
+
+@app.delete("/alerts/{rule_id}")
+def alerts_delete(rule_id: int):
+    if not db.alerts.delete(rule_id):
+        raise HTTPException(status_code=404, detail=f"Alert rule {rule_id} not found.")
+    return {"id": rule_id, "status": "deleted"}
+
+
+@app.post("/alerts/evaluate/{interval}")
+async def alerts_evaluate(interval: str):
+    """
+    evaluate the rules of the interval (and of the timeframes derived from it) now, the alerts are notified
+    """
+    return await run_alerts(interval)
+
+
+# ---------------------------------------------------------
+# Routes: Backfill
+# ---------------------------------------------------------
+
+# keep a reference to the running backfills (tasks without references can be garbage collected)
+backfill_tasks = set()
+
+
+@app.post("/backfill/{interval}")
+async def backfill_run(interval: str, tickers: str, start: str, end: str | None = None):
+    """
+    tickers: comma separated. Runs in the background; calling it again with the same start resumes it
+    """
+    ticker_list = [ticker.strip() for ticker in tickers.split(",") if ticker.strip()]
+    try:
+        for value in [start, end]:
+            DateHelper.to_epoch(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {str(e)}")
+
+    task = asyncio.create_task(Executor.run_io(backfill, ticker_list, interval, start, end))
+    backfill_tasks.add(task)
+    task.add_done_callback(backfill_tasks.discard)
+    return {"interval": interval, "tickers": ticker_list, "start": start, "end": end, "status": "started"}
+
+
+# ---------------------------------------------------------
+# Routes: Profiling (PROFILING_ENABLED=1)
+# ---------------------------------------------------------
+
+
+async def run_profile(name, action, top, save):
+    if not settings.profiling_enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (PROFILING_ENABLED=0).")
+    try:
+        return await Profiler.run(name, action, top=top, save=save)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/profile/cronjob/{interval}")
+async def profile_cronjob(interval: str, top: int = 25, save: bool = False):
+    """
+    run one cronjob execution under the profiler: top functions and allocation sites
+    """
+    if interval not in cron_jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown cronjob '{interval}', available: {', '.join(cron_jobs)}")
+    return await run_profile(f"cron_{interval}", cron_jobs[interval], top, save)
+
+
+@app.post("/profile/requests")
+async def profile_requests(seconds: float = 10.0, top: int = 25, save: bool = False):
+    """
+    sample everything the process does (live requests, cronjobs) for `seconds`
+    """
+    seconds = min(max(seconds, 0.1), settings.profiling_max_seconds)
+    return await run_profile("requests", lambda: asyncio.sleep(seconds), top, save)
+
+
 # ---------------------------------------------------------
 # Routes: Health
 # ---------------------------------------------------------
@@ -174,3 +609,53 @@ def ohlc_refresh(ticker: str, interval: str):
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
+
+
+@app.get("/health/executor")
+async def health_executor():
+    return Executor.stats()
+
+
+@app.get("/health/scheduler")
+async def health_scheduler():
+    """
+    leader lease (holder, expiry), refresh queue (ready, delayed, running, outcomes, lag)
+    and the cronjob runs skipped because they overran
+    """
+    return cron_stats()
+
+
+@app.get("/health/notifier")
+async def health_notifier():
+    return Notifier.stats()
+
+
+@app.get("/health/stream")
+async def health_stream():
+    return candle_bus.stats()
+
+
+@app.get("/health/startup")
+async def health_startup():
+    """
+    seconds spent importing the modules and initializing (database, listeners, scheduler)
+    """
+    return {phase: round(seconds, 4) for phase, seconds in startup_timings.items()}
+
+
+@app.get("/health/cache")
+async def health_cache():
+    return ohlc_cache.stats()
+
+
+# ---------------------------------------------------------
+# Routes: Metrics
+# ---------------------------------------------------------
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus text format: route latencies, provider, database, cronjob and notifier timings, series gauges
+    """
+    return PlainTextResponse(Metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -17,12 +17,98 @@ class AppSettings(BaseSettings):
     app_version: str = "2025.12.17"
     database_path: str = "sqlite:///data/development.db"
 
+    # sqlite storage: WAL lets API reads run while a cronjob writes; one writer connection, a pool of readers.
+    # cache_size in KiB per connection, mmap_size in bytes, analyze/checkpoint intervals in seconds (0: off)
+    sqlite_wal: bool = True
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_cache_size_kb: int = 65536
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_temp_store: str = "MEMORY"
+    sqlite_busy_timeout: float = 5.0
+    sqlite_read_pool_size: int = 8
+    sqlite_pool_timeout: float = 30.0
+    sqlite_analyze_interval: int = 6 * 3600
+    sqlite_checkpoint_interval: int = 300
+
+    # retention (configuration.json "retention"): archived candles are kept in archive_dir as
+    # {ticker}/{interval}/{year}.parquet; each run releases at most retention_vacuum_pages free pages (0: all)
+    archive_dir: str = "data/archive"
+    retention_vacuum_pages: int = 0
+
+    # gap detection: calendar of the tickers not listed in configuration.json "calendars" (24/7, 24/5, XNYS, ...),
+    # provider fetches per series and run at most
+    gap_fill_enabled: bool = True
+    gap_default_calendar: str = "24/7"
+    gap_max_fetches: int = 20
+
+    # alert rules (alert_rule table, /alerts): evaluated after every refresh; seconds between two alerts
+    # of a rule unless it sets its own cooldown, and the longest pct_change period (candles read per series)
+    alerts_enabled: bool = True
+    alert_cooldown: float = 3600.0
+    alert_max_period: int = 500
+
+    # tickers per batched provider download, and downloads running at the same time
+    refresh_chunk_size: int = 50
+    refresh_max_workers: int = 4
+
+    # scheduler: each tick queues one refresh item per ticker; a random delay up to jitter seconds
+    # spreads the provider load, failed items are retried after retry_delay (doubled each time)
+    scheduler_jitter: float = 10.0
+    scheduler_max_retries: int = 2
+    scheduler_retry_delay: float = 30.0
+    scheduler_misfire_grace_time: int = 60
+
+    # processes sharing the database elect one leader to run the cronjobs: the lease lasts ttl seconds
+    # and is renewed every heartbeat_interval; when the leader stops renewing, another one takes over
+    leader_election_enabled: bool = True
+    leader_lease_ttl: float = 30.0
+    leader_heartbeat_interval: float = 10.0
+
+    # market data provider (yahoo, replay or any registered one); closed candles are cached on disk
+    market_data_provider: str = "yahoo"
+    provider_cache_enabled: bool = True
+    provider_cache_dir: str = "data/provider_cache"
+    provider_replay_dir: str = "data/replay"
+
+    # blocking work called from async code: I/O threads, and optional processes for pandas transforms
+    executor_io_workers: int = 8
+    executor_process_workers: int = 0
+
+    # in-process cache of OHLC queries (0 disables it); bigger results are not cached
+    ohlc_cache_max_bytes: int = 64 * 1024 * 1024
+    ohlc_cache_max_entry_bytes: int = 8 * 1024 * 1024
+
+    # tickers per /panel request (one query with an IN list)
+    panel_max_tickers: int = 200
+
+    # live candle streams (websocket / server-sent events): messages buffered per client before it is dropped,
+    # candles per message at most, seconds between keepalives of an idle stream, seconds between two reads of
+    # the candles written by the other processes sharing the database (the scheduler leader)
+    stream_queue_size: int = 100
+    stream_max_candles: int = 500
+    stream_heartbeat_interval: float = 15.0
+    stream_poll_interval: float = 1.0
+    stream_max_subscribers: int = 1000
+
+    # admin profiling endpoints (/profile/...): sampling profiler + tracemalloc, reports saved in profiling_dir
+    profiling_enabled: bool = False
+    profiling_sample_interval: float = 0.005
+    profiling_traceback_frames: int = 1
+    profiling_max_seconds: int = 60
+    profiling_dir: str = "data/profiles"
+
     log_file: str = "development.log"
     log_level: str = "INFO"
 
     notifier_discord_webhook_url: str = ""
     notifier_telegram_token: str = ""
     notifier_telegram_chat_id: str = ""
+    notifier_telegram_api_url: str = "https://api.telegram.org"
+
+    # delivery queue: messages arriving within batch_window seconds are sent together
+    notifier_batch_window: float = 1.0
+    notifier_max_retries: int = 5
+    notifier_queue_size: int = 1000
 
     # 'model_config' is a reserved and required name that Pydantic V2
     # uses internally to find and interpret the configuration dictionary
@@ -48,7 +134,8 @@ settings = AppSettings()
 logging_filepath = f"data/{settings.log_file.replace('.log', '')}.log"
 
 # Configure a logger that rotates daily at midnight, keeping 7 days of backups
-handler = TimedRotatingFileHandler(logging_filepath, when="midnight", interval=1, backupCount=7, encoding="utf-8")
+# (delay: the file is opened by the first log record, not at import time)
+handler = TimedRotatingFileHandler(logging_filepath, when="midnight", interval=1, backupCount=7, encoding="utf-8", delay=True)
 
 
 logging.basicConfig(
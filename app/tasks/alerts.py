@@ -0,0 +1,251 @@
+import time
+
+from app.database import PANEL_FIELDS, db
+from app.lib.executor import Executor
+from app.lib.lazy import lazy_import
+from app.lib.metrics import Metrics
+from app.lib.notifier import Notifier
+from app.lib.utils import IntervalHelper
+from app.settings import logger, settings
+from app.tasks.indicators import configured_indicators, indicator_name
+from app.tasks.resample import derived_intervals
+
+np = lazy_import("numpy")
+
+alert_evaluation_seconds = Metrics.histogram(
+    "alert_evaluation_seconds", "vectorized pass over the rules of an interval", ["interval"]
+)
+alert_rules = Metrics.counter("alert_rules_total", "rules evaluated, and the ones that triggered", ["interval", "outcome"])
+
+# ---------------------------------------------------------
+# Rules: a condition on the last candles of a series, stored
+# in the alert_rule table and managed through the API
+# ---------------------------------------------------------
+
+CONDITIONS = ["above", "below", "cross_above", "cross_below", "pct_change"]
+
+
+def validate_rule(values):
+    """
+    the rule values ready to store, ValueError when they cannot be evaluated
+    """
+    values = {name: value for name, value in values.items() if value is not None}
+    values["interval"] = IntervalHelper.normalize(values["interval"])
+    values.setdefault("field", "close")
+    values.setdefault("cooldown", settings.alert_cooldown)
+
+    if values["condition"] not in CONDITIONS:
+        raise ValueError(f"unknown condition '{values['condition']}', available: {', '.join(CONDITIONS)}")
+
+    indicators = [indicator_name(spec) for spec in configured_indicators(values["ticker"], values["interval"])]
+    for series in [values["field"], values.get("reference")]:
+        if series is not None and series not in PANEL_FIELDS + indicators:
+            raise ValueError(f"unknown series '{series}', available: {', '.join(PANEL_FIELDS + indicators)}")
+
+    if values["condition"] == "pct_change":
+        if values.get("reference") is not None:
+            raise ValueError("pct_change compares a series with itself, it takes no reference")
+        if not 1 <= values.setdefault("period", 1) <= settings.alert_max_period:
+            raise ValueError(f"period must be between 1 and {settings.alert_max_period}")
+    if values.get("value") is None and values.get("reference") is None:
+        raise ValueError(f"{values['condition']} needs a value or a reference")
+    if values["cooldown"] < 0:
+        raise ValueError("cooldown must be positive")
+    return values
+
+
+# ---------------------------------------------------------
+# Evaluation: the last candles (and indicator values) of every
+# series in one matrix, then every rule in one numpy pass
+# ---------------------------------------------------------
+
+
+def series_matrix(rules, interval):
+    """
+    (values, field_rows, reference_rows, dates): values[row, lag] of every series the rules read
+    (lag 0: last candle, NaN when missing), the row of the field and of the reference of each rule
+    (-1: none) and the date of the last candle of each rule's ticker.
+    a series is read as far back as its rules need: two candles (crosses), period + 1 (pct_change)
+    """
+    tickers, ticker_rows = np.unique(rules["ticker"].astype(str), return_inverse=True)
+    has_reference = np.not_equal(rules["reference"], None)
+    names = np.unique(np.concatenate([rules["field"], rules["reference"][has_reference]]).astype(str))
+
+    # one row per (name, ticker)
+    field_rows = np.searchsorted(names, rules["field"].astype(str)) * len(tickers) + ticker_rows
+    reference_rows = np.full(len(rules), -1)
+    reference_rows[has_reference] = (
+        np.searchsorted(names, rules["reference"][has_reference].astype(str)) * len(tickers) + ticker_rows[has_reference]
+    )
+
+    needed = np.where(rules["condition"] == "pct_change", np.minimum(rules["period"], settings.alert_max_period) + 1, 2)
+    depths = np.zeros(len(names) * len(tickers), dtype="int64")
+    np.maximum.at(depths, field_rows, needed)
+    np.maximum.at(depths, reference_rows[has_reference], 2)
+    values = np.full((len(names) * len(tickers), int(depths.max())), np.nan)
+
+    is_candle = np.isin(names, PANEL_FIELDS)
+    candle_depths = np.maximum(depths.reshape(len(names), len(tickers))[is_candle].max(axis=0, initial=1), 1)
+    # close: the dates of the last candles are read even when the rules only read indicators
+    fields = list(dict.fromkeys([*names[is_candle].tolist(), "close"]))
+    candles = db.ohlc.tails(tickers.tolist(), interval, candle_depths.tolist(), fields)
+    for i in np.flatnonzero(is_candle):
+        values[i * len(tickers) + candles["position"], candles["lag"]] = candles[names[i]]
+
+    last = candles[candles["lag"] == 0]
+    dates = np.full(len(tickers), -1)
+    dates[last["position"]] = last["date"]
+
+    rows = np.flatnonzero(depths)
+    rows = rows[~is_candle[rows // len(tickers)]]
+    if len(rows):
+        series = [(tickers[row % len(tickers)], names[row // len(tickers)]) for row in rows]
+        indicators = db.indicators.tails(series, interval, depths[rows].tolist())
+        values[rows[indicators["position"]], indicators["lag"]] = indicators["value"]
+
+    return values, field_rows, reference_rows, dates[ticker_rows]
+
+
+def evaluate_rules(rules, values, field_rows, reference_rows):
+    """
+    (holds, current, threshold, change) per rule: whether the condition holds on the last candle,
+    the value of the series, the value it is compared with, and the percent change over the period.
+    values holds at least two lags (crosses compare with the previous candle)
+    """
+    series = values[field_rows]
+    thresholds = np.where((reference_rows >= 0)[:, None], values[np.maximum(reference_rows, 0)], rules["value"][:, None])
+
+    current, previous = series[:, 0], series[:, 1]
+    threshold, previous_threshold = thresholds[:, 0], thresholds[:, 1]
+    back = series[np.arange(len(rules)), np.minimum(rules["period"], values.shape[1] - 1)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = (current / back - 1) * 100
+
+    condition = rules["condition"]
+    holds = np.select(
+        [condition == name for name in CONDITIONS],
+        [
+            current > threshold,
+            current < threshold,
+            (previous <= previous_threshold) & (current > threshold),
+            (previous >= previous_threshold) & (current < threshold),
+            np.where(rules["value"] >= 0, change >= rules["value"], change <= rules["value"]),
+        ],
+        False,
+    )
+    return holds, current, threshold, change
+
+
+# interval -> (signature, rules): the definitions are read again only after a change through the API,
+# the state of the rules (active, triggered_at) at every evaluation
+_rules = {}
+
+
+def enabled_rules(interval):
+    signature = db.alerts.signature(interval)
+    cached = _rules.get(interval)
+    if cached is not None and cached[0] == signature:
+        rules, states = cached[1].copy(), db.alerts.states(interval)
+        if len(states) == len(rules):
+            rules["active"], rules["triggered_at"] = states["active"], states["triggered_at"]
+            return rules
+
+    rules = db.alerts.for_evaluation(interval)
+    _rules[interval] = (signature, rules)
+    return rules.copy()
+
+
+def evaluate_alerts(interval, now=None):
+    """
+    evaluate the enabled rules of `interval` and save their state. a rule triggers when its condition
+    starts holding (not on every tick while it holds) and its cooldown is over. returns the triggered alerts
+    """
+    interval = IntervalHelper.normalize(interval)
+    now = now or time.time()
+    rules = enabled_rules(interval)
+    if len(rules) == 0:
+        return []
+
+    started = time.perf_counter()
+    values, field_rows, reference_rows, dates = series_matrix(rules, interval)
+    holds, current, threshold, change = evaluate_rules(rules, values, field_rows, reference_rows)
+
+    cooled = now - rules["triggered_at"] >= rules["cooldown"]
+    triggered = holds & ~rules["active"] & cooled
+    changed = holds != rules["active"]
+    db.alerts.record(list(zip(rules["id"][changed], holds[changed], triggered[changed])), now)
+
+    alert_evaluation_seconds.observe(time.perf_counter() - started, interval=interval)
+    alert_rules.inc(len(rules), interval=interval, outcome="evaluated")
+    alert_rules.inc(int(triggered.sum()), interval=interval, outcome="triggered")
+
+    return [
+        {
+            "id": int(rules["id"][i]),
+            "ticker": rules["ticker"][i],
+            "interval": interval,
+            "field": rules["field"][i],
+            "condition": rules["condition"][i],
+            "reference": rules["reference"][i],
+            "period": int(rules["period"][i]),
+            "note": rules["note"][i],
+            "date": int(dates[i]),
+            "current": float(current[i]),
+            "threshold": float(threshold[i]),
+            "change": float(change[i]),
+        }
+        for i in np.flatnonzero(triggered)
+    ]
+
+
+# ---------------------------------------------------------
+# Delivery: the alerts of a tick go out through the Notifier
+# queues, where they are coalesced into as few messages as possible
+# ---------------------------------------------------------
+
+
+def alert_message(alert):
+    """
+    e.g. "ALERT BTC-USD h1: close crossed above ema20 (64210.5) - breakout"
+    """
+    ticker, interval, field = alert["ticker"], alert["interval"], alert["field"]
+    if alert["condition"] == "pct_change":
+        text = f"ALERT {ticker} {interval}: {field} {alert['change']:+.2f}% over {alert['period']} candles ({alert['current']:g})"
+    else:
+        verb = {"above": "is above", "below": "is below", "cross_above": "crossed above", "cross_below": "crossed below"}
+        compared = alert["reference"] or f"{alert['threshold']:g}"
+        text = f"ALERT {ticker} {interval}: {field} {verb[alert['condition']]} {compared} ({alert['current']:g})"
+    return f"{text} - {alert['note']}" if alert["note"] else text
+
+
+def alert_intervals(interval):
+    """
+    `interval` and the timeframes rebuilt from it (their last candle changes with every refresh of it)
+    """
+    intervals = [IntervalHelper.normalize(interval)]
+    for current in intervals:
+        intervals += [target for target in derived_intervals(current) if target not in intervals]
+    return intervals
+
+
+async def run_alerts(interval):
+    """
+    after a refresh of `interval`: evaluate its rules and those of the derived timeframes, notify the alerts.
+    rules with the same message (duplicates) are sent once
+    """
+    if not settings.alerts_enabled:
+        return []
+
+    alerts = []
+    for target in alert_intervals(interval):
+        try:
+            alerts += await Executor.run_io(evaluate_alerts, target)
+        except Exception as e:
+            logger.error(f"alerts {target}: evaluation failed: {e}")
+
+    messages = list(dict.fromkeys(alert_message(alert) for alert in alerts))
+    if messages:
+        logger.info(f"alerts {interval}: {len(alerts)} triggered")
+        await Notifier.send_telegram_message_async("\n".join(messages))
+        await Notifier.send_discord_message_async("\n".join(messages))
+    return alerts
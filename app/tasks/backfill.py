@@ -0,0 +1,126 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from app.database import create_db_and_tables, db
+from app.lib.providers import get_provider
+from app.lib.utils import DateHelper, IntervalHelper
+from app.settings import logger, settings
+from app.tasks.indicators import indicators_initialize
+from app.tasks.refresh_ticker import MAX_LOOKBACK_DAYS
+from app.tasks.resample import download_interval, resample_initialize
+
+# days of history requested per provider call
+WINDOW_DAYS = {"1m": 7, "2m": 59, "5m": 59, "15m": 59, "30m": 59, "60m": 365, "90m": 59, "1h": 365, "1d": 5 * 365}
+DEFAULT_WINDOW_DAYS = 10 * 365
+
+
+def backfill_windows(start, end, interval):
+    """
+    split [start, end) into provider-sized windows
+    """
+    size = timedelta(days=WINDOW_DAYS.get(interval, DEFAULT_WINDOW_DAYS))
+    windows = []
+    while start < end:
+        windows.append((start, min(start + size, end)))
+        start += size
+    return windows
+
+
+def checkpoint_key(ticker, interval, start):
+    return f"backfill:{IntervalHelper.normalize(interval)}:{ticker}:{start:%Y-%m-%d}"
+
+
+def _backfill_chunk(tickers, interval, start, end):
+    """
+    download a chunk of tickers window by window; every window is written in one
+    transaction and then the checkpoints of the tickers it returned candles for move to the end of the window.
+    the provider answers a failed download with no candles: a ticker without candles yet (not listed yet)
+    stays pending, its empty windows are done once a later one has candles; a ticker that already had
+    candles stops at its empty window, the next run retries from there
+    """
+    keys = {ticker: checkpoint_key(ticker, interval, start) for ticker in tickers}
+    stored = db.settings.get_many(keys.values())
+    checkpoints = {ticker: int(stored[keys[ticker]] or 0) for ticker in tickers}
+
+    rows = 0
+    stopped = set()
+    for window_start, window_end in backfill_windows(start, end, interval):
+        pending = [ticker for ticker in tickers if ticker not in stopped and checkpoints[ticker] < window_end.timestamp()]
+        if not pending:
+            continue
+
+        candles = get_provider().fetch(pending, interval, window_start, window_end)
+        returned = set(candles["ticker"]) if len(candles) > 0 else set()
+        if returned:
+            db.ohlc.upsert(candles)
+            rows += len(candles)
+
+        done = [ticker for ticker in pending if ticker in returned]
+        db.settings.set_many({keys[ticker]: str(int(window_end.timestamp())) for ticker in done})
+        for ticker in done:
+            checkpoints[ticker] = int(window_end.timestamp())
+
+        empty = [ticker for ticker in pending if ticker not in returned and checkpoints[ticker]]
+        if empty:
+            stopped.update(empty)
+            logger.warning(
+                f"backfill {interval} {', '.join(empty)}: no candles {window_start:%Y-%m-%d} - {window_end:%Y-%m-%d}, run it again to retry"
+            )
+        logger.info(f"backfill {interval} {pending[0]}..{pending[-1]}: {window_start:%Y-%m-%d} - {window_end:%Y-%m-%d} done")
+
+    return rows
+
+
+def backfill(tickers, interval="1d", start=None, end=None):
+    """
+    load the history of many tickers between start and end (default: now).
+    resumable: running it again with the same start skips the windows already loaded.
+    a derived interval (configuration.json "timeframes") downloads the interval it is built from,
+    the resample listeners build its candles. returns the number of candles written
+    """
+    interval = IntervalHelper.to_yahoo_format(download_interval(interval))
+    now = datetime.now(timezone.utc)
+    start = datetime.fromtimestamp(DateHelper.to_epoch(start), timezone.utc) if start else now - timedelta(days=365)
+    end = datetime.fromtimestamp(DateHelper.to_epoch(end), timezone.utc) if end else now
+
+    max_days = MAX_LOOKBACK_DAYS.get(interval)
+    if max_days and start < now - timedelta(days=max_days):
+        logger.warning(
+            f"backfill {interval}: the provider serves {max_days} days, starting at {now - timedelta(days=max_days):%Y-%m-%d}"
+        )
+        start = now - timedelta(days=max_days)
+
+    tickers = list(dict.fromkeys(tickers))
+    chunk_size = max(1, settings.refresh_chunk_size)
+    chunks = [tickers[i : i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+
+    rows = 0
+    with ThreadPoolExecutor(max_workers=max(1, settings.refresh_max_workers)) as pool:
+        for chunk, future in [(chunk, pool.submit(_backfill_chunk, chunk, interval, start, end)) for chunk in chunks]:
+            try:
+                rows += future.result()
+            except Exception as e:
+                logger.error(f"backfill {interval}: chunk {chunk[0]}..{chunk[-1]} failed, run it again to resume: {e}")
+
+    logger.info(f"backfill {len(tickers)} tickers {interval}: {rows} candles written")
+    return rows
+
+
+# ---------------------------------------------------------
+# Command line
+# > python -m app.tasks.backfill --interval 1d --start 2015-01-01 BTC-USD ETH-USD
+# ---------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the history of tickers into the database")
+    parser.add_argument("tickers", nargs="+")
+    parser.add_argument("--interval", default="1d")
+    parser.add_argument("--start", required=True, help="ISO date or epoch seconds")
+    parser.add_argument("--end", default=None, help="ISO date or epoch seconds (default: now)")
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    resample_initialize()
+    indicators_initialize()
+    print(f"{backfill(args.tickers, args.interval, args.start, args.end)} candles written")
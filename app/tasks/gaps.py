@@ -0,0 +1,261 @@
+import time
+
+from app.config import config
+from app.database import db
+from app.lib.lazy import lazy_import
+from app.lib.metrics import Metrics
+from app.lib.providers import get_provider
+from app.lib.utils import IntervalHelper
+from app.settings import logger, settings
+from app.tasks.refresh_ticker import MAX_LOOKBACK_DAYS
+from app.tasks.resample import base_interval, download_interval
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+gap_missing_candles = Metrics.gauge(
+    "gap_missing_candles", "candles the calendar expects but are not stored", ["ticker", "interval"]
+)
+gap_fetches = Metrics.counter("gap_fetches_total", "provider fetches of missing windows", ["interval", "outcome"])
+
+# ---------------------------------------------------------
+# Calendars: the candles a series should have. "24/7" (crypto),
+# "24/5" (forex: Sunday 22:00 to Friday 22:00 UTC), or the regular
+# session of an exchange (holidays are learned: see `empty`)
+# ---------------------------------------------------------
+
+# calendar: (time zone, open, close) in exchange local time, Monday to Friday
+SESSIONS = {
+    "XNYS": ("America/New_York", "09:30", "16:00"),  # NYSE, Nasdaq
+    "XLON": ("Europe/London", "08:00", "16:30"),
+    "XETR": ("Europe/Berlin", "09:00", "17:30"),
+    "XTKS": ("Asia/Tokyo", "09:00", "15:30"),
+}
+CALENDARS = ["24/7", "24/5", *SESSIONS]
+
+# 1970-01-05, the first Monday after the epoch
+MONDAY = 4 * 86400
+WEEK = 7 * 86400
+
+
+def calendar_of(ticker):
+    calendars = config.calendars if config else {}
+    return calendars.get(ticker, settings.gap_default_calendar)
+
+
+def _minutes(value):
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def candle_seconds(interval, calendar):
+    """
+    duration of a candle of `interval`; ValueError for the intervals and calendars gaps cannot be scanned for
+    """
+    seconds = IntervalHelper.to_seconds(interval)
+    if not seconds or seconds > 86400:
+        raise ValueError(f"gaps are scanned for intraday and daily candles, not {interval}")
+    if calendar not in CALENDARS:
+        raise ValueError(f"unknown calendar '{calendar}', available: {', '.join(CALENDARS)}")
+    return seconds
+
+
+def expected_dates(calendar, interval, start, end):
+    """
+    open times (epoch, int64 array) of the candles of `interval` the calendar expects with start <= date < end.
+    intraday candles are expected when they overlap the session, daily ones on weekdays
+    """
+    seconds = candle_seconds(interval, calendar)
+    dates = np.arange(-(-int(start) // seconds) * seconds, int(end), seconds, dtype="int64")
+    if calendar == "24/7":
+        return dates
+
+    weekday = (dates - MONDAY) // 86400 % 7
+    if seconds == 86400:
+        return dates[weekday < 5]
+
+    if calendar == "24/5":
+        week = (dates - MONDAY) % WEEK
+        return dates[(week < 4 * 86400 + 22 * 3600) | (week + seconds > 6 * 86400 + 22 * 3600)]
+
+    timezone, session_open, session_close = SESSIONS[calendar]
+    local = pd.to_datetime(dates, unit="s", utc=True).tz_convert(timezone)
+    minutes = local.hour.to_numpy() * 60 + local.minute.to_numpy()
+    in_session = (
+        (local.weekday.to_numpy() < 5) & (minutes < _minutes(session_close)) & (minutes + seconds // 60 > _minutes(session_open))
+    )
+    return dates[in_session]
+
+
+# ---------------------------------------------------------
+# Scan: stored dates against the calendar, in numpy
+# ---------------------------------------------------------
+
+
+def in_windows(dates, windows):
+    """
+    boolean mask of the sorted `dates` falling in any [start, end) window
+    """
+    if not windows or len(dates) == 0:
+        return np.zeros(len(dates), dtype=bool)
+    bounds = np.asarray([window[:2] for window in windows], dtype="int64")
+    marks = np.zeros(len(dates) + 1, dtype="int64")
+    np.add.at(marks, np.searchsorted(dates, bounds[:, 0]), 1)
+    np.add.at(marks, np.searchsorted(dates, bounds[:, 1]), -1)
+    return np.cumsum(marks[:-1]) > 0
+
+
+def gap_runs(missing, expected, seconds):
+    """
+    [[start, end, candles]] of the missing candles, consecutive in the calendar (end exclusive):
+    a gap over a weekend or a night is one window
+    """
+    if len(missing) == 0:
+        return []
+    positions = np.searchsorted(expected, missing)
+    breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+    firsts, lasts = np.r_[0, breaks], np.r_[breaks, len(missing)] - 1
+    return [[int(missing[first]), int(missing[last]) + seconds, int(last - first + 1)] for first, last in zip(firsts, lasts)]
+
+
+def _merge_windows(windows):
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def scan_coverage(ticker, interval, now=None, attempted=None, retry_empty=False, save=True):
+    """
+    compare the stored candles of a series (from its first candle) with its calendar and save the
+    coverage row (save, and only for a series with candles). attempted: windows just fetched again, what
+    is still missing in them is recorded as empty (holiday, halt, no trades) so it is neither reported nor fetched again
+    """
+    interval = IntervalHelper.normalize(interval)
+    calendar = calendar_of(ticker)
+    seconds = candle_seconds(interval, calendar)
+    scanned_until = int(now or time.time()) // seconds * seconds
+
+    previous = None if retry_empty else db.coverage.get(ticker, interval)
+    empty = previous["empty"] if previous else []
+
+    dates = db.ohlc.dates(ticker, interval)
+    expected = expected_dates(calendar, interval, dates[0], scanned_until) if len(dates) else np.empty(0, dtype="int64")
+    expected = expected[~in_windows(expected, empty)]
+    missing = expected[~np.isin(expected, dates, assume_unique=True)]
+
+    if attempted:
+        still_missing = in_windows(missing, attempted)
+        empty = _merge_windows(empty + [run[:2] for run in gap_runs(missing[still_missing], expected, seconds)])
+        expected, missing = expected[~in_windows(expected, empty)], missing[~still_missing]
+
+    coverage = {
+        "calendar": calendar,
+        "first_date": int(dates[0]) if len(dates) else None,
+        "last_date": int(dates[-1]) if len(dates) else None,
+        "expected": len(expected),
+        "missing": len(missing),
+        "scanned_until": scanned_until,
+        "scanned_at": time.time(),
+        "gaps": gap_runs(missing, expected, seconds),
+        "empty": empty,
+    }
+    if save and len(dates):
+        db.coverage.set(ticker, interval, **coverage)
+        gap_missing_candles.set(len(missing), ticker=ticker, interval=interval)
+    return {"ticker": ticker, "interval": interval, **coverage}
+
+
+def get_coverage(ticker, interval, scan=False):
+    """
+    the coverage index row of a series, or computed without being saved when it has none yet (or scan):
+    the index is written by the fills (cron, POST), not by reads
+    """
+    interval = IntervalHelper.normalize(interval)
+    coverage = None if scan else db.coverage.get(ticker, interval)
+    return coverage if coverage is not None else scan_coverage(ticker, interval, save=False)
+
+
+# ---------------------------------------------------------
+# Fill: one provider fetch per missing window, instead of
+# downloading the whole history again
+# ---------------------------------------------------------
+
+
+def fillable_since(interval, now):
+    """
+    epoch of the oldest candle the provider still serves for `interval`
+    """
+    max_days = MAX_LOOKBACK_DAYS.get(IntervalHelper.to_yahoo_format(interval))
+    return int(now) - max_days * 86400 if max_days else 0
+
+
+def fill_gaps(ticker, interval, now=None, max_fetches=None, retry_empty=False):
+    """
+    fetch the missing windows of a series (derived intervals: the windows of the downloaded interval,
+    the resample listener rebuilds them), then scan again. returns the fetch stats and the coverage
+    """
+    interval = IntervalHelper.normalize(interval)
+    now = int(now or time.time())
+    max_fetches = settings.gap_max_fetches if max_fetches is None else max_fetches
+    fetch_interval = download_interval(interval)
+    since = fillable_since(fetch_interval, now)
+
+    coverage = scan_coverage(ticker, interval, now, retry_empty=retry_empty)
+    stats = {"fetches": 0, "candles": 0, "unfillable": 0}
+    attempted = []
+    for start, end, candles in coverage["gaps"]:
+        if end <= since:
+            stats["unfillable"] += candles
+            continue
+        if stats["fetches"] >= max_fetches:
+            break
+
+        start = max(start, since)
+        try:
+            fetched = get_provider().fetch([ticker], fetch_interval, start, end)
+        except Exception as e:
+            gap_fetches.inc(interval=interval, outcome="failed")
+            logger.warning(f"gaps {ticker} {interval}: fetch {start}..{end} failed: {e}")
+            continue
+
+        stats["fetches"] += 1
+        attempted.append([start, end])
+        gap_fetches.inc(interval=interval, outcome="filled" if len(fetched) else "empty")
+        if len(fetched):
+            db.ohlc.upsert(fetched)
+            stats["candles"] += len(fetched)
+
+    if attempted:
+        coverage = scan_coverage(ticker, interval, now, attempted=attempted)
+        logger.info(
+            f"gaps {ticker} {interval}: {stats['fetches']} windows fetched, {stats['candles']} candles, {coverage['missing']} still missing"
+        )
+    return {**stats, "coverage": coverage}
+
+
+def gap_intervals():
+    """
+    the downloaded intervals of the refresh cronjobs (gaps of derived ones are closed by filling these)
+    """
+    return [interval for interval in (IntervalHelper.h1, IntervalHelper.d1) if base_interval(interval) is None]
+
+
+def fill_all_gaps(tickers, intervals=None, now=None):
+    """
+    {interval: {ticker: candles written}} of the series that had fillable gaps
+    """
+    summary = {}
+    for interval in intervals or gap_intervals():
+        for ticker in tickers:
+            try:
+                result = fill_gaps(ticker, interval, now)
+            except Exception as e:
+                logger.error(f"gaps {ticker} {interval}: {e}")
+                continue
+            if result["fetches"]:
+                summary.setdefault(interval, {})[ticker] = result["candles"]
+    return summary
@@ -0,0 +1,146 @@
+import json
+
+from app.config import config
+from app.database import db
+from app.lib.lazy import lazy_import
+from app.lib.utils import IntervalHelper
+from app.settings import logger
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# ---------------------------------------------------------
+# Indicators: vectorized over a block of candles, optionally
+# continuing from the state saved after the previous block
+# ---------------------------------------------------------
+
+
+def _ewm(values, alpha, seed=None):
+    """
+    y[t] = y[t-1] + alpha * (x[t] - y[t-1]), starting from seed (or from the first value)
+    """
+    if seed is not None:
+        values = np.concatenate([[seed], values])
+    result = pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return result[1:] if seed is not None else result
+
+
+def _previous_close(candles, state):
+    close = candles["close"].to_numpy()
+    first = state["close"] if state else close[0]
+    return np.concatenate([[first], close[:-1]])
+
+
+def ema(candles, period, state=None):
+    ema_values = _ewm(candles["close"].to_numpy(), 2 / (period + 1), state and state["ema"])
+    return ema_values, {"ema": ema_values}
+
+
+def rsi(candles, period, state=None):
+    close = candles["close"].to_numpy()
+    delta = close - _previous_close(candles, state)
+    avg_gain = _ewm(np.clip(delta, 0, None), 1 / period, state and state["avg_gain"])
+    avg_loss = _ewm(np.clip(-delta, 0, None), 1 / period, state and state["avg_loss"])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.where(avg_loss == 0, np.where(avg_gain == 0, 50.0, 100.0), 100 - 100 / (1 + avg_gain / avg_loss))
+    return values, {"avg_gain": avg_gain, "avg_loss": avg_loss, "close": close}
+
+
+def atr(candles, period, state=None):
+    high, low, close = candles["high"].to_numpy(), candles["low"].to_numpy(), candles["close"].to_numpy()
+    previous_close = _previous_close(candles, state)
+    true_range = np.maximum(high - low, np.maximum(np.abs(high - previous_close), np.abs(low - previous_close)))
+    values = _ewm(true_range, 1 / period, state and state["atr"])
+    return values, {"atr": values, "close": close}
+
+
+def vwap(candles, period=None, state=None):
+    """
+    session VWAP, reset every day at 00:00 UTC
+    """
+    day = candles["date"].to_numpy() // 86400
+    volume = candles["volume"].to_numpy()
+    typical_price = (candles["high"].to_numpy() + candles["low"].to_numpy() + candles["close"].to_numpy()) / 3
+
+    frame = pd.DataFrame({"day": day, "pv": typical_price * volume, "v": volume})
+    cumulative = frame.groupby("day")[["pv", "v"]].cumsum()
+    pv, v = cumulative["pv"].to_numpy(), cumulative["v"].to_numpy()
+    if state:
+        same_session = day == state["day"]
+        pv, v = pv + same_session * state["pv"], v + same_session * state["v"]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.where(v > 0, pv / v, typical_price)
+    return values, {"day": day, "pv": pv, "v": v}
+
+
+INDICATORS = {"ema": ema, "rsi": rsi, "atr": atr, "vwap": vwap}
+
+
+def indicator_name(spec):
+    return spec.name if spec.name == "vwap" else f"{spec.name}{spec.period}"
+
+
+def configured_indicators(ticker, interval):
+    specs = {IntervalHelper.normalize(key): value for key, value in (config.indicators if config else {}).items()}
+    return [spec for spec in specs.get(IntervalHelper.normalize(interval), []) if not spec.tickers or ticker in spec.tickers]
+
+
+# ---------------------------------------------------------
+# Engine
+# ---------------------------------------------------------
+
+
+def _candles(ticker, interval, start=None):
+    candles = db.ohlc.get_all(ticker=ticker, interval=interval, start=start).reset_index(drop=True)
+    candles["date"] = candles["date"].to_numpy().astype("datetime64[s]").astype("int64")
+    return candles
+
+
+def update_indicator(ticker, interval, spec, start):
+    """
+    bring one indicator up to date after the candles from `start` were written.
+    the state is checkpointed at the last closed candle (the one before the last),
+    so refreshing the open candle only recomputes that candle: O(new candles).
+    candles rewritten before the checkpoint trigger a full (vectorized) recompute
+    """
+    name = indicator_name(spec)
+    compute = INDICATORS[spec.name]
+    checkpoint = db.indicators.get_state(ticker, interval, name)
+
+    if checkpoint and start > checkpoint[0]:
+        state = json.loads(checkpoint[1])
+        candles = _candles(ticker, interval, start=checkpoint[0] + 1)
+    else:
+        state = None
+        candles = _candles(ticker, interval)
+
+    if len(candles) == 0:
+        return 0
+
+    values, states = compute(candles, spec.period, state)
+    db.indicators.upsert(ticker, interval, name, candles["date"].tolist(), values.tolist())
+
+    if len(candles) >= 2:
+        state = {key: column[-2].item() for key, column in states.items()}
+        db.indicators.set_state(ticker, interval, name, int(candles["date"].iloc[-2]), json.dumps(state))
+
+    return len(candles)
+
+
+def update_indicators(ticker, interval, start, end=None):
+    for spec in configured_indicators(ticker, interval):
+        if spec.name not in INDICATORS:
+            logger.warning(f"indicator '{spec.name}' is not supported")
+            continue
+        count = update_indicator(ticker, interval, spec, start)
+        logger.debug(f"indicator {ticker} {interval} {indicator_name(spec)}: {count} candles computed")
+
+
+def indicators_initialize():
+    """
+    keep the configured indicators up to date whenever candles are written
+    """
+    if config and config.indicators:
+        db.ohlc.on_upsert(update_indicators)
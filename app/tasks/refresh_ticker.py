@@ -1,51 +1,178 @@
-from datetime import datetime, timedelta
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 from app.database import db
-from app.lib.utils import IntervalHelper, Providers
+from app.lib.lazy import lazy_import
+from app.lib.metrics import Metrics
+from app.lib.providers import CANDLE_COLUMNS, get_provider
+from app.lib.utils import IntervalHelper
+from app.settings import logger, settings
+from app.tasks.resample import download_interval
+
+pd = lazy_import("pandas")
+
+refresh_last_success = Metrics.gauge(
+    "refresh_last_success_timestamp_seconds", "last refresh that returned candles", ["ticker", "interval"]
+)
+
+# number of already stored candles fetched again, so the last (still open) candle gets updated
+OVERLAP_CANDLES = 3
+
+# how far back yahoo serves each interval
+MAX_LOOKBACK_DAYS = {"1m": 7, "2m": 59, "5m": 59, "15m": 59, "30m": 59, "60m": 729, "90m": 59, "1h": 729}
+
+
+def refresh_start(ticker, interval):
+    """
+    where to start fetching: the last stored candle minus a small overlap,
+    or a default lookback when the series is empty
+    """
+    yahoo_interval = IntervalHelper.to_yahoo_format(interval)
+    now = datetime.now(timezone.utc)
+    last_date = db.ohlc.last_date(ticker, IntervalHelper.normalize(interval))
+
+    if last_date is None:
+        if yahoo_interval in ["1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h"]:
+            return now - timedelta(days=2)
+        elif yahoo_interval in ["1d"]:
+            return now - timedelta(days=7)
+        elif yahoo_interval in ["5d"]:
+            return now - timedelta(days=15)
+        return now - timedelta(days=100)
+
+    seconds = IntervalHelper.to_seconds(interval) or 86400
+    start = datetime.fromtimestamp(last_date - OVERLAP_CANDLES * seconds, timezone.utc)
+
+    max_days = MAX_LOOKBACK_DAYS.get(yahoo_interval)
+    if max_days and start < now - timedelta(days=max_days):
+        logger.warning(f"{ticker} {interval}: last candle is older than the provider lookback, the series will have a gap")
+        start = now - timedelta(days=max_days)
+
+    return start
+
+
+def diff_candles(candles):
+    """
+    compare a candles frame (single series) with the stored candles,
+    returns the new or changed candles and the {"inserted", "updated", "skipped"} stats
+    """
+    stats = {"inserted": 0, "updated": 0, "skipped": 0}
+    if len(candles) == 0:
+        return candles, stats
+
+    ticker = candles["ticker"].iloc[0]
+    interval = candles["interval"].iloc[0]
+    stored = db.ohlc.get_all(ticker=ticker, interval=interval, start=int(candles["date"].min()))
+    stored_dates = stored["date"].to_numpy().astype("datetime64[s]").astype("int64")
+    stored = pd.DataFrame(stored[CANDLE_COLUMNS].to_numpy(), index=stored_dates, columns=CANDLE_COLUMNS)
+
+    merged = candles.join(stored, on="date", rsuffix="_stored")
+    is_new = merged["close_stored"].isna()
+    is_changed = ~is_new & (merged[CANDLE_COLUMNS].to_numpy() != merged[[f"{c}_stored" for c in CANDLE_COLUMNS]].to_numpy()).any(
+        axis=1
+    )
+
+    stats["inserted"] = int(is_new.sum())
+    stats["updated"] = int(is_changed.sum())
+    stats["skipped"] = len(candles) - stats["inserted"] - stats["updated"]
+
+    return candles[is_new | is_changed], stats
+
+
+def upsert_candles(candles):
+    """
+    upsert only new or changed candles, returns {"inserted", "updated", "skipped"}
+    """
+    changed, stats = diff_candles(candles)
+    if len(changed) > 0:
+        db.ohlc.upsert(changed)
+
+    return stats
 
 
 def refresh_ticker_by_interval(ticker="BTC-USD", interval="1h", return_dataframe=True):
-    provider = "yahoo"
-    interval = IntervalHelper.to_yahoo_format(interval)
-
-    if interval in ["1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h"]:
-        start = datetime.now() - timedelta(days=2)
-    elif interval in ["1d"]:
-        start = datetime.now() - timedelta(days=7)
-    elif interval in ["5d"]:
-        start = datetime.now() - timedelta(days=15)
-    else:
-        start = datetime.now() - timedelta(days=100)
-
-    ticker_name = ticker
-    ticker_interval = interval
-    ticker_start = start.strftime("%Y-%m-%d")
-
-    if provider == "yahoo":
-        ticker_data = Providers.yahoofinance(ticker_name, ticker_start, interval=ticker_interval)
-
-    records = []
-
-    if len(ticker_data) > 0:
-        # update last 10 candles
-        candles = []
-        for _, row in ticker_data.iloc[-10:].iterrows():
-            candles.append(
-                {
-                    "ticker": ticker_name,
-                    "interval": IntervalHelper.normalize(ticker_interval),
-                    "date": datetime.strptime(row["date"].strftime("%Y-%m-%d %H:%M:00"), "%Y-%m-%d %H:%M:%S"),
-                    "open": str(row["open"]),
-                    "high": str(row["high"]),
-                    "low": str(row["low"]),
-                    "close": str(row["close"]),
-                }
-            )
-        db.ohlc.upsert(candles)
-        records = candles
-        records = sorted(records, key=lambda row: row["date"], reverse=True)
+    """
+    fetch the candles after the last stored one and upsert only new or changed ones,
+    returns the fetched candles, or the {"inserted", "updated", "skipped"} stats if return_dataframe=False
+    """
+    interval = IntervalHelper.to_yahoo_format(download_interval(interval))
+    start = refresh_start(ticker, interval)
+    candles = get_provider().fetch([ticker], interval, start)
+
+    stats = {"inserted": 0, "updated": 0, "skipped": 0}
+    if len(candles) > 0:
+        stats = upsert_candles(candles)
+        refresh_last_success.set(time.time(), ticker=ticker, interval=IntervalHelper.normalize(interval))
+
+    logger.info(
+        f"refresh {ticker} {interval}: {stats['inserted']} inserted, {stats['updated']} updated, {stats['skipped']} skipped"
+    )
 
     if return_dataframe:
-        return ticker_data
+        candles = candles[["date", *CANDLE_COLUMNS]].copy()
+        candles["date"] = pd.to_datetime(candles["date"], unit="s")
+        return candles
+
+    return stats
+
+
+def _refresh_chunk(tickers, interval):
+    """
+    one batched provider download for a chunk of tickers, diffed per ticker (nothing is written here)
+    """
+    start = min(refresh_start(ticker, interval) for ticker in tickers)
+    fetched = get_provider().fetch(tickers, interval, start)
+    candles_by_ticker = dict(tuple(fetched.groupby("ticker", sort=False)))
+
+    changes, results = [], {}
+    for ticker in tickers:
+        candles = candles_by_ticker.get(ticker)
+        if candles is None:
+            logger.warning(f"refresh {ticker} {interval}: no data returned by the provider")
+            results[ticker] = {"inserted": 0, "updated": 0, "skipped": 0, "close": None}
+            continue
+
+        changed, stats = diff_candles(candles)
+        changes.append(changed)
+        results[ticker] = {**stats, "close": float(candles["close"].iloc[-1]) if len(candles) > 0 else None}
+
+    return changes, results
+
+
+def refresh_tickers_by_interval(tickers, interval="1h"):
+    """
+    refresh many tickers: batched provider downloads (refresh_chunk_size tickers per call)
+    run on refresh_max_workers threads, then every change is written in one transaction.
+    returns {ticker: {"inserted", "updated", "skipped", "close"}}
+    """
+    interval = IntervalHelper.to_yahoo_format(download_interval(interval))
+    tickers = list(dict.fromkeys(tickers))
+    chunk_size = max(1, settings.refresh_chunk_size)
+    chunks = [tickers[i : i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+
+    changes, results = [], {}
+    with ThreadPoolExecutor(max_workers=max(1, settings.refresh_max_workers)) as pool:
+        for chunk, future in [(chunk, pool.submit(_refresh_chunk, chunk, interval)) for chunk in chunks]:
+            try:
+                chunk_changes, chunk_results = future.result()
+                changes.extend(chunk_changes)
+                results.update(chunk_results)
+            except Exception as e:
+                logger.error(f"refresh {interval}: chunk {chunk[0]}..{chunk[-1]} failed: {e}")
+
+    changes = [frame for frame in changes if len(frame) > 0]
+    if changes:
+        db.ohlc.upsert(pd.concat(changes))
+
+    now = time.time()
+    for ticker, result in results.items():
+        if result["close"] is not None:
+            refresh_last_success.set(now, ticker=ticker, interval=IntervalHelper.normalize(interval))
+
+    total = {key: sum(result[key] for result in results.values()) for key in ["inserted", "updated", "skipped"]}
+    logger.info(
+        f"refresh {len(tickers)} tickers {interval}: {total['inserted']} inserted, {total['updated']} updated, {total['skipped']} skipped"
+    )
 
-    return ticker_data
+    return results
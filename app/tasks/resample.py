@@ -0,0 +1,131 @@
+from app.config import config
+from app.database import db
+from app.lib.lazy import lazy_import
+from app.lib.utils import IntervalHelper
+from app.settings import logger
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# ---------------------------------------------------------
+# Resampling: build higher timeframes from stored candles
+# ---------------------------------------------------------
+
+
+def bucket_start(dates, interval):
+    """
+    open time of the `interval` candle each date belongs to (epoch seconds in, epoch seconds out).
+    weeks start on monday, months on the first day
+    """
+    dates = np.asarray(dates, dtype="int64")
+    interval = IntervalHelper.normalize(interval)
+
+    if interval == IntervalHelper.w1:
+        days = dates // 86400
+        return (days - (days + 3) % 7) * 86400  # 1970-01-01 was a thursday
+
+    if interval == IntervalHelper.mn1:
+        months = dates.astype("datetime64[s]").astype("datetime64[M]")
+        return months.astype("datetime64[s]").astype("int64")
+
+    seconds = IntervalHelper.to_seconds(interval)
+    if not seconds:
+        raise ValueError(f"cannot resample to '{interval}'")
+    return dates // seconds * seconds
+
+
+def resample_candles(candles, interval):
+    """
+    aggregate a candles frame (single series, epoch dates) into `interval` candles
+    """
+    candles = candles.sort_values("date")
+    buckets = bucket_start(candles["date"].to_numpy(), interval)
+
+    # candles are sorted, so every bucket is a contiguous run: reduce each run in place
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(buckets)) + 1]) if len(buckets) else np.empty(0, dtype="int64")
+    ends = np.concatenate([starts[1:], [len(buckets)]]) - 1
+
+    return pd.DataFrame(
+        {
+            "ticker": candles["ticker"].iloc[0] if len(candles) else None,
+            "interval": IntervalHelper.normalize(interval),
+            "date": buckets[starts],
+            "open": candles["open"].to_numpy()[starts],
+            "high": np.maximum.reduceat(candles["high"].to_numpy(), starts) if len(starts) else [],
+            "low": np.minimum.reduceat(candles["low"].to_numpy(), starts) if len(starts) else [],
+            "close": candles["close"].to_numpy()[ends],
+            "volume": np.add.reduceat(candles["volume"].to_numpy(), starts) if len(starts) else [],
+        }
+    )
+
+
+def derived_intervals(interval):
+    """
+    timeframes materialized from `interval` (configuration.json "timeframes")
+    """
+    timeframes = {IntervalHelper.normalize(base): targets for base, targets in (config.timeframes if config else {}).items()}
+    return [IntervalHelper.normalize(target) for target in timeframes.get(IntervalHelper.normalize(interval), [])]
+
+
+def base_interval(interval):
+    """
+    the stored interval `interval` is built from, or None if it is downloaded
+    """
+    interval = IntervalHelper.normalize(interval)
+    for base, targets in (config.timeframes if config else {}).items():
+        if interval in [IntervalHelper.normalize(target) for target in targets]:
+            return IntervalHelper.normalize(base)
+    return None
+
+
+def download_interval(interval):
+    """
+    the interval to download so that `interval` gets updated (follows h4 -> h1, w1 -> d1 -> h1).
+    ValueError when the provider does not serve it and it is not built from another one ("timeframes")
+    """
+    interval = IntervalHelper.normalize(interval)
+    while (base := base_interval(interval)) is not None:
+        interval = base
+    if IntervalHelper.to_yahoo_format(interval) not in IntervalHelper.downloadable:
+        raise ValueError(
+            f"{interval} is not served by the provider: build it from a stored interval with configuration.json "
+            f'"timeframes", e.g. {{"h1": ["{interval}"]}}'
+        )
+    return interval
+
+
+def update_timeframes(ticker, interval, start, end=None):
+    """
+    rebuild the derived candles touched by base candles written between start and end.
+    only the affected buckets are recomputed; the upsert of the derived candles updates
+    the timeframes derived from them in turn (e.g. h1 -> d1 -> w1).
+    the bucket the base history starts in is left out: it would only hold its last base candles
+    """
+    interval = IntervalHelper.normalize(interval)
+    for target in derived_intervals(interval):
+        first_bucket = int(bucket_start([start], target)[0])
+        base = db.ohlc.get_all(ticker=ticker, interval=interval, start=first_bucket)
+        if len(base) == 0:
+            continue
+
+        base["date"] = base["date"].to_numpy().astype("datetime64[s]").astype("int64")
+        candles = resample_candles(base.reset_index(drop=True), target)
+
+        first = db.ohlc.first_date(ticker, interval)
+        partial = int(bucket_start([first], target)[0])
+        if first > partial and candles["date"].iloc[0] == partial:
+            candles = candles.iloc[1:]
+            db.ohlc.delete_range(ticker, target, partial, partial)  # written before the leading bucket was left out
+        if len(candles) == 0:
+            continue
+
+        db.ohlc.upsert(candles)
+        logger.info(f"resample {ticker} {interval} -> {target}: {len(candles)} candles updated")
+
+
+def resample_initialize():
+    """
+    keep the derived timeframes up to date whenever base candles are written
+    """
+    if config and config.timeframes:
+        db.ohlc.on_upsert(update_timeframes)
@@ -0,0 +1,74 @@
+import time
+
+from app.config import config
+from app.database import db, vacuum_db
+from app.lib.archive import Archive
+from app.lib.lazy import lazy_import
+from app.lib.metrics import Metrics
+from app.lib.utils import IntervalHelper
+from app.settings import logger, settings
+from app.tasks.resample import bucket_start, resample_candles
+
+pd = lazy_import("pandas")
+
+retention_candles = Metrics.counter("retention_candles_total", "candles moved out of the table", ["interval", "action"])
+
+# ---------------------------------------------------------
+# Retention: candles older than keep_days are archived to
+# parquet, downsampled or dropped, then the file is compacted
+# ---------------------------------------------------------
+
+
+def retention_cutoff(interval, policy, now):
+    """
+    epoch before which candles leave the table: a day boundary, or a bucket boundary of the
+    downsample target (a bucket is never split between the table and its downsampled candle)
+    """
+    cutoff = int(now) - policy.keep_days * 86400
+    if policy.action == "downsample":
+        return int(bucket_start([cutoff], policy.to)[0])
+    return cutoff // 86400 * 86400
+
+
+def apply_retention_policy(interval, policy, now=None):
+    """
+    returns {ticker: candles moved out of the table}
+    """
+    interval = IntervalHelper.normalize(interval)
+    if policy.action not in ("archive", "downsample", "drop"):
+        logger.warning(f"retention {interval}: unknown action '{policy.action}'")
+        return {}
+    if policy.action == "downsample" and not policy.to:
+        logger.warning(f"retention {interval}: downsample without a target interval ('to')")
+        return {}
+    if policy.action == "archive" and not Archive.available():
+        return {}
+
+    cutoff = retention_cutoff(interval, policy, now or time.time())
+    moved = {}
+    for ticker in db.ohlc.cold_tickers(interval, cutoff):
+        candles = db.ohlc.cold_candles(ticker, interval, cutoff)
+        if len(candles) == 0:
+            continue
+
+        if policy.action == "archive":
+            Archive.write(ticker, interval, {name: candles[name] for name in candles.dtype.names})
+        elif policy.action == "downsample":
+            frame = pd.DataFrame({name: candles[name] for name in candles.dtype.names})
+            db.ohlc.upsert(resample_candles(frame, policy.to))
+
+        # only the range handled above: candles written meanwhile after it stay in the table
+        moved[ticker] = db.ohlc.delete_range(ticker, interval, int(candles["date"][0]), int(candles["date"][-1]))
+        retention_candles.inc(moved[ticker], interval=interval, action=policy.action)
+        logger.info(f"retention {ticker} {interval}: {moved[ticker]} candles before {cutoff} ({policy.action})")
+    return moved
+
+
+def apply_retention(now=None):
+    """
+    every configured policy, then the freed pages are returned to the file system
+    """
+    policies = config.retention if config else {}
+    summary = {interval: apply_retention_policy(interval, policy, now) for interval, policy in policies.items()}
+    summary = {interval: moved for interval, moved in summary.items() if moved}
+    return {"moved": summary, "vacuumed_pages": vacuum_db(settings.retention_vacuum_pages)}
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from app.database import db
+from app.lib.executor import Executor
+from app.lib.formats import OHLCFormats
+from app.lib.metrics import Metrics
+from app.lib.pubsub import PubSub
+from app.settings import logger, settings
+
+# ---------------------------------------------------------
+# Stream: every write of a series is pushed to the clients
+# subscribed to it (websocket / server-sent events)
+# ---------------------------------------------------------
+
+# topics: (ticker, interval)
+candle_bus = PubSub("candles", queue_size=settings.stream_queue_size)
+Metrics.on_collect(candle_bus.stats)
+
+
+def candles_message(ticker, interval, start, end, candles, truncated):
+    """
+    {"event": "candles", ticker, interval, start, end, truncated, candles: [records as in GET /ohlc]}
+    """
+    return (
+        f'{{"event":"candles","ticker":{json.dumps(ticker)},"interval":{json.dumps(interval)},"start":{json.dumps(start)},'
+        f'"end":{json.dumps(end)},"truncated":{json.dumps(truncated)},"candles":{"".join(OHLCFormats.json([candles]))}}}'
+    )
+
+
+def publish_candles(ticker, interval, start, end=None):
+    """
+    upsert listener: the written candles (the last stream_max_candles of them) are read back once,
+    encoded once and shared by every subscriber of the series
+    """
+    if not candle_bus.has_subscribers((ticker, interval)):
+        return
+
+    limit = settings.stream_max_candles
+    candles = db.ohlc.latest(ticker, interval, start, end, limit + 1)
+    truncated = len(candles) > limit
+    message = candles_message(ticker, interval, start, end, candles[-limit:], truncated)
+    candle_bus.publish((ticker, interval), message)
+
+
+_poller = None
+
+
+async def poll_changes():
+    """
+    the candles written by another process (the scheduler leader) reach the subscribers of this one
+    through the change log, read every stream_poll_interval seconds while someone is subscribed
+    """
+    while True:
+        await asyncio.sleep(settings.stream_poll_interval)
+        if candle_bus.stats()["subscribers"]:
+            try:
+                await Executor.run_io(db.changes.sync)
+            except Exception as e:
+                logger.error(f"stream: change log sync failed: {e}")
+
+
+def stream_initialize():
+    global _poller
+    db.ohlc.on_upsert(publish_candles)
+    db.changes.on_remote_upsert(publish_candles)
+    # the first sync only marks where this process starts reading the change log
+    db.changes.sync()
+    if _poller is None:
+        _poller = asyncio.get_running_loop().create_task(poll_changes(), name="stream-poll-changes")
+
+
+async def stream_shutdown():
+    global _poller
+    if _poller is not None:
+        _poller.cancel()
+        await asyncio.gather(_poller, return_exceptions=True)
+        _poller = None
@@ -0,0 +1,351 @@
+"""
+Benchmarks for the ingestion, storage and API hot paths.
+
+Runs offline: a temporary database and a synthetic provider replace the real ones.
+
+> python -m benchmarks.bench                                   # run, print JSON
+> python -m benchmarks.bench --save benchmarks/baseline.json   # run and save as baseline
+> python -m benchmarks.bench --compare benchmarks/baseline.json --threshold 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# the app reads its settings at import time: point it to a throwaway database first
+_tmpdir = tempfile.mkdtemp(prefix="templatebot-bench-")
+os.environ["DATABASE_PATH"] = f"sqlite:///{_tmpdir}/bench.db"
+os.environ["ENABLED_CRON"] = "0"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_FILE", "benchmark.log")
+os.environ["NOTIFIER_TELEGRAM_TOKEN"] = ""
+os.environ["MARKET_DATA_PROVIDER"] = "synthetic"
+os.environ["PROVIDER_CACHE_ENABLED"] = "0"
+os.environ["SCHEDULER_JITTER"] = "0"
+os.environ["NOTIFIER_DISCORD_WEBHOOK_URL"] = ""
+
+import numpy as np
+import pandas as pd
+
+from app.database import create_db_and_tables, db, ohlc_cache
+from app.lib.providers import BaseProvider, register_provider
+from app.lib.utils import IntervalHelper
+
+# ---------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------
+
+START = 1_600_000_000 // 3600 * 3600
+
+
+def synthetic_candles(ticker, interval, count, start=START, step=3600, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(size=count))
+    return pd.DataFrame(
+        {
+            "ticker": ticker,
+            "interval": interval,
+            "date": start + step * np.arange(count, dtype="int64"),
+            "open": close - 0.2,
+            "high": close + 1.0,
+            "low": close - 1.0,
+            "close": close,
+            "volume": rng.uniform(1, 100, count),
+        }
+    )
+
+
+class SyntheticProvider(BaseProvider):
+    """
+    hourly candles from start to end (default: now), a random walk per ticker
+    """
+
+    name = "synthetic"
+
+    def fetch(self, tickers, interval, start, end=None):
+        end = pd.Timestamp.now(tz="UTC") if end is None else pd.Timestamp(end)
+        start = pd.Timestamp(start)
+        start = start.tz_localize("UTC") if start.tzinfo is None else start
+        end = end.tz_localize("UTC") if end.tzinfo is None else end
+        first = int(start.ceil("h").timestamp())
+        count = max(0, (int(end.timestamp()) - first) // 3600 + 1)
+        return pd.concat(
+            [
+                synthetic_candles(ticker, IntervalHelper.normalize(interval), count, start=first, seed=i)
+                for i, ticker in enumerate(tickers)
+            ],
+            ignore_index=True,
+        )
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+
+
+def measure(fn, repeat=5, setup=None):
+    """
+    median wall time (seconds) of fn over `repeat` runs
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q))
+
+
+# ---------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------
+
+
+def bench_upsert(results, sizes):
+    for size in sizes:
+        candles = synthetic_candles(f"UPSERT{size}", "h1", size)
+        seconds = measure(lambda candles=candles: db.ohlc.upsert(candles), repeat=3)
+        results[f"upsert.rows_per_s.{size}"] = {"value": size / seconds, "unit": "rows/s", "better": "higher"}
+
+
+def bench_read(results, sizes):
+    for size in sizes:
+        ticker = f"READ{size}"
+        db.ohlc.upsert(synthetic_candles(ticker, "h1", size))
+
+        cold = measure(lambda ticker=ticker: db.ohlc.get_all(ticker=ticker, interval="h1"), setup=ohlc_cache.clear)
+        warm = measure(lambda ticker=ticker: db.ohlc.get_all(ticker=ticker, interval="h1"))
+        results[f"read.get_all_ms.{size}"] = {"value": cold * 1000, "unit": "ms", "better": "lower"}
+        results[f"read.get_all_cached_ms.{size}"] = {"value": warm * 1000, "unit": "ms", "better": "lower"}
+
+        candles = synthetic_candles(ticker, "h1", size)
+        data = np.rec.fromarrays([candles[column].to_numpy() for column in candles.columns], names=list(candles.columns))
+        seconds = measure(lambda data=data: db.ohlc.to_dataframe(data))
+        results[f"read.dataframe_build_ms.{size}"] = {"value": seconds * 1000, "unit": "ms", "better": "lower"}
+
+
+def bench_panel(results, tickers=10, size=10_000):
+    """
+    a close matrix of `tickers` series: one panel query against one get_all per ticker joined on date
+    """
+    names = [f"PANEL{i}" for i in range(tickers)]
+    for i, ticker in enumerate(names):
+        db.ohlc.upsert(synthetic_candles(ticker, "h1", size, seed=i))
+
+    def per_ticker():
+        pd.concat({ticker: db.ohlc.get_all(ticker=ticker, interval="h1")["close"] for ticker in names}, axis=1)
+
+    panel = measure(lambda: db.ohlc.get_panel(names, "h1"), setup=ohlc_cache.clear)
+    joined = measure(per_ticker, setup=ohlc_cache.clear)
+    results[f"panel.get_panel_ms.{tickers}x{size}"] = {"value": panel * 1000, "unit": "ms", "better": "lower"}
+    results[f"panel.per_ticker_join_ms.{tickers}x{size}"] = {"value": joined * 1000, "unit": "ms", "better": "lower"}
+
+
+def bench_alerts(results, rules=10_000, tickers=1_000):
+    """
+    one evaluation of `rules` alert rules over `tickers` series: the numpy pass alone, and with the reads and the state writes
+    """
+    from sqlmodel import Session
+
+    from app.database import AlertRule, engine
+    from app.tasks import alerts
+
+    names = [f"ALERT{i}" for i in range(tickers)]
+    db.ohlc.upsert(pd.concat([synthetic_candles(ticker, "h1", 100, seed=i) for i, ticker in enumerate(names)], ignore_index=True))
+    rng = np.random.default_rng(0)
+    with Session(engine) as session:
+        for i in range(rules):
+            condition = alerts.CONDITIONS[i % len(alerts.CONDITIONS)]
+            value = float(rng.normal(0, 2) if condition == "pct_change" else rng.normal(100, 5))
+            rule = {"ticker": names[i % tickers], "interval": "h1", "condition": condition, "value": value, "period": 1 + i % 24}
+            session.add(AlertRule(**rule, cooldown=0, created_at=time.time(), updated_at=time.time()))
+        session.commit()
+
+    rule_array = alerts.enabled_rules("h1")
+    matrix = alerts.series_matrix(rule_array, "h1")
+    evaluate = measure(lambda: alerts.evaluate_rules(rule_array, *matrix[:3]))
+    total = measure(lambda: alerts.evaluate_alerts("h1"))
+    results[f"alerts.rules_pass_ms.{rules}"] = {"value": evaluate * 1000, "unit": "ms", "better": "lower"}
+    results[f"alerts.evaluate_ms.{rules}"] = {"value": total * 1000, "unit": "ms", "better": "lower"}
+
+
+def bench_api(results, sizes, requests=20):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        for size in sizes:
+            ticker = f"READ{size}"
+            for label, url in [("ohlc", f"/ohlc/{ticker}/h1"), ("ohlc_page", f"/ohlc/{ticker}/h1?limit=500")]:
+                timings = []
+                for _ in range(requests):
+                    ohlc_cache.clear()
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    response.read()
+                    timings.append(time.perf_counter() - started)
+                results[f"api.{label}_p50_ms.{size}"] = {"value": percentile(timings, 50) * 1000, "unit": "ms", "better": "lower"}
+                results[f"api.{label}_p95_ms.{size}"] = {"value": percentile(timings, 95) * 1000, "unit": "ms", "better": "lower"}
+
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            client.get("/health")
+            timings.append(time.perf_counter() - started)
+        results["api.health_p50_ms"] = {"value": percentile(timings, 50) * 1000, "unit": "ms", "better": "lower"}
+
+
+def bench_read_during_upsert(results, requests=20, writer_rows=50_000):
+    """
+    /ohlc latency while another thread keeps upserting a large series (a cronjob or a backfill writing)
+    """
+    import threading
+
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    candles = synthetic_candles("WRITER", "h1", writer_rows)
+    stop, writes, writer_seconds = threading.Event(), [], []
+
+    def writer():
+        started = time.perf_counter()
+        while not stop.is_set():
+            db.ohlc.upsert(candles)
+            writes.append(1)
+        writer_seconds.append(time.perf_counter() - started)
+
+    with TestClient(app) as client:
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            timings = []
+            for _ in range(requests):
+                ohlc_cache.clear()
+                started = time.perf_counter()
+                client.get("/ohlc/READ1000/h1").read()
+                timings.append(time.perf_counter() - started)
+        finally:
+            stop.set()
+            thread.join()
+
+    results["contention.ohlc_p50_ms.1000"] = {"value": percentile(timings, 50) * 1000, "unit": "ms", "better": "lower"}
+    results["contention.ohlc_p95_ms.1000"] = {"value": percentile(timings, 95) * 1000, "unit": "ms", "better": "lower"}
+    results["contention.writer_rows_per_s"] = {
+        "value": len(writes) * writer_rows / writer_seconds[0],
+        "unit": "rows/s",
+        "better": "higher",
+    }
+
+
+def bench_startup(results, runs=3):
+    """
+    cold start: a fresh interpreter importing the app (what a machine scaled to zero pays first)
+    """
+    code = "import time; started = time.perf_counter(); import app.main; print(time.perf_counter() - started)"
+    timings = [
+        float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+        for _ in range(runs)
+    ]
+    results["startup.import_s"] = {"value": statistics.median(timings), "unit": "s", "better": "lower"}
+
+
+def bench_cron(results, ticker_counts):
+    from app import cronjob
+    from app.config import config
+
+    for count in ticker_counts:
+        config.cronjob.refresh_tickers = [f"CRON{count}-{i}" for i in range(count)]
+        started = time.perf_counter()
+        asyncio.run(cronjob.cron_h1())
+        results[f"cron.h1_first_run_s.{count}"] = {"value": time.perf_counter() - started, "unit": "s", "better": "lower"}
+
+        started = time.perf_counter()
+        asyncio.run(cronjob.cron_h1())
+        results[f"cron.h1_incremental_s.{count}"] = {"value": time.perf_counter() - started, "unit": "s", "better": "lower"}
+
+
+# ---------------------------------------------------------
+# Baseline
+# ---------------------------------------------------------
+
+
+def compare(results, baseline, threshold):
+    """
+    prints the change against the baseline, returns the names of the regressions
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous["value"]:
+            print(f"{name:45} {result['value']:14.3f} {result['unit']:7} (new)")
+            continue
+
+        change = (result["value"] - previous["value"]) / previous["value"]
+        worse = change > threshold if result["better"] == "lower" else change < -threshold
+        regressions += [name] if worse else []
+        print(f"{name:45} {result['value']:14.3f} {result['unit']:7} {change:+8.1%} {'REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for ingestion, storage and API hot paths")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes")
+    parser.add_argument("--save", help="write the results to this file (e.g. benchmarks/baseline.json)")
+    parser.add_argument("--compare", help="compare with a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change reported as a regression")
+    args = parser.parse_args()
+
+    sizes = [1_000, 10_000] if args.quick else [1_000, 10_000, 100_000]
+    ticker_counts = [10] if args.quick else [10, 100]
+
+    create_db_and_tables()
+    register_provider("synthetic", SyntheticProvider())
+
+    results = {}
+    bench_upsert(results, sizes)
+    bench_read(results, sizes)
+    bench_panel(results)
+    bench_alerts(results, rules=1_000 if args.quick else 10_000)
+    bench_api(results, sizes)
+    bench_read_during_upsert(results)
+    bench_cron(results, ticker_counts)
+    bench_startup(results)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+
+import pytest
+
+# settings are read when the app is imported: point them at a scratch directory first
+_directory = tempfile.mkdtemp(prefix="templatebot-tests-")
+os.environ["DATABASE_PATH"] = f"sqlite:///{_directory}/test.db"
+os.environ["ARCHIVE_DIR"] = f"{_directory}/archive"
+os.environ["PROVIDER_CACHE_ENABLED"] = "0"
+os.environ["ENABLED_CRON"] = "0"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    from app.database import create_db_and_tables
+
+    create_db_and_tables()
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def timeframes(monkeypatch):
+    """
+    set configuration.json "timeframes" for one test, e.g. timeframes({"h1": ["d1"]})
+    """
+    from app.config import config
+
+    def set_timeframes(value):
+        monkeypatch.setattr(config._get(), "timeframes", value)
+
+    return set_timeframes
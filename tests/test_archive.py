@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from app.database import db
+from app.lib import archive
+from app.lib.archive import Archive
+
+START = 1672531200  # 2023-01-01
+HOUR = 3600
+
+
+def candles(dates):
+    dates = np.asarray(dates, dtype="int64")
+    return {
+        "date": dates,
+        "open": dates / 1e6,
+        "high": dates / 1e6,
+        "low": dates / 1e6,
+        "close": dates / 1e6,
+        "volume": dates / 1e9,
+    }
+
+
+@pytest.fixture(scope="module")
+def series():
+    """
+    a series split between the archive (two yearly files, several row groups each) and the table;
+    the archive also holds a stale copy of the first candle of the table, which the table wins
+    """
+    if not Archive.available():
+        pytest.skip("pyarrow is not installed")
+    ticker, interval = "ARCHIVE-STREAM", "h1"
+    archived = START + HOUR * np.arange(12000)  # 2023-01-01 to 2024-05-15
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(archive, "ARCHIVE_ROW_GROUP_SIZE", 1000)
+        Archive.write(ticker, interval, candles(np.append(archived, archived[-1] + HOUR)))
+
+    table = candles(archived[-1] + HOUR * np.arange(1, 500))
+    table["volume"] = table["volume"] * 2
+    db.ohlc.upsert(
+        [
+            {"ticker": ticker, "interval": interval, **{column: values[i].item() for column, values in table.items()}}
+            for i in range(len(table["date"]))
+        ]
+    )
+    return ticker, interval, np.append(archived, table["date"])
+
+
+def test_iter_batches_streams_archive_then_table(series):
+    ticker, interval, dates = series
+    batches = list(db.ohlc.iter_batches(ticker, interval, batch_size=700))
+    assert all(len(batch) <= 700 for batch in batches)
+    streamed = np.concatenate(batches)
+    assert streamed["date"].tolist() == dates.tolist()
+    # the candle in both the archive and the table comes from the table
+    assert streamed["volume"][12000] == pytest.approx(dates[12000] / 1e9 * 2)
+    assert list(db.ohlc.get_all(ticker, interval)["close"]) == pytest.approx(list(streamed["close"]))
+
+
+@pytest.mark.parametrize("limit", [700, 999, 5000, 11999, 12000, 12001, 12498, 12499, 20000])
+def test_pages_follow_the_cursor(series, limit):
+    ticker, interval, dates = series
+    pages, after = [], None
+    while True:
+        page = np.concatenate(list(db.ohlc.iter_batches(ticker, interval, after=after, limit=limit, batch_size=700)))
+        assert len(page) <= limit
+        pages.append(page["date"])
+        after = db.ohlc.next_cursor(ticker, interval, after=after, limit=limit)
+        if after is None:
+            break
+        assert after == page["date"][-1]
+    assert np.concatenate(pages).tolist() == dates.tolist()
+
+
+def test_range_filters_archived_batches(series):
+    ticker, interval, dates = series
+    start, end = int(dates[8000]), int(dates[12100])
+    streamed = np.concatenate(list(db.ohlc.iter_batches(ticker, interval, start=start, end=end, batch_size=700)))
+    assert streamed["date"].tolist() == dates[8000:12101].tolist()
@@ -0,0 +1,49 @@
+import time
+
+import pandas as pd
+
+from app.database import db, ohlc_methods
+from app.tasks import backfill
+from app.tasks.resample import update_timeframes
+
+DAY = 86400
+START = (int(time.time()) // DAY - 14) * DAY  # within the lookback the provider serves for 1h
+HOUR = 3600
+
+
+class Provider:
+    """
+    serves hourly candles (close: hours since START), records the requested intervals
+    """
+
+    def __init__(self):
+        self.intervals = []
+
+    def fetch(self, tickers, interval, start, end=None):
+        self.intervals.append(interval)
+        hours = range(int((start.timestamp() - START) // HOUR), int((end.timestamp() - START) // HOUR))
+        return pd.DataFrame(
+            [
+                {"ticker": ticker, "interval": "h1", "date": START + hour * HOUR, "open": hour, "high": hour + 0.5}
+                | {"low": hour - 0.5, "close": hour, "volume": 1.0}
+                for ticker in tickers
+                for hour in hours
+                if hour >= 0
+            ]
+        )
+
+
+def test_backfill_of_a_derived_interval_downloads_its_base(monkeypatch, timeframes):
+    timeframes({"h1": ["h4"]})
+    provider = Provider()
+    monkeypatch.setattr(backfill, "get_provider", lambda: provider)
+    monkeypatch.setattr(ohlc_methods, "_listeners", [update_timeframes])
+
+    rows = backfill.backfill(["BACKFILL-H4"], "h4", START, START + 2 * DAY)
+    assert rows == 48
+    assert set(provider.intervals) == {"1h"}
+
+    h4 = db.ohlc.get_all("BACKFILL-H4", "h4", return_dataframe=False)
+    assert [candle.date for candle in h4] == [START + i * 4 * HOUR for i in range(12)]
+    assert [candle.close for candle in h4] == [4 * i + 3 for i in range(12)]
+    assert [candle.volume for candle in h4] == [4.0] * 12
@@ -0,0 +1,51 @@
+import json
+import os
+import socket
+
+import pytest
+
+from app import database
+from app.settings import settings
+
+
+def test_writer_pool_is_a_single_connection_with_wal(monkeypatch):
+    monkeypatch.setattr(settings, "sqlite_wal", True)
+    engine = database._create_engine()
+    assert (engine.pool.size(), engine.pool._max_overflow) == (1, 0)
+    engine.dispose()
+
+
+def test_writer_pool_serves_the_reads_without_wal(monkeypatch):
+    monkeypatch.setattr(settings, "sqlite_wal", False)
+    engine = database._create_engine()
+    assert engine.pool.size() > 1
+    assert engine.pool._max_overflow > 0
+    engine.dispose()
+
+
+def test_read_pool(monkeypatch):
+    monkeypatch.setattr(settings, "sqlite_read_pool_size", 3)
+    engine = database._create_engine(read_only=True)
+    assert (engine.pool.size(), engine.pool._max_overflow) == (3, 0)
+    engine.dispose()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork is not available")
+@pytest.mark.filterwarnings("ignore:This process .* is multi-threaded")  # the child only reads the writer state
+def test_forked_worker_is_another_writer():
+    database.db.settings.get("fork-test")  # the parent has synced: it holds a change log connection
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        state = {"writer": database.change_methods.writer, "connection": database.change_methods._connection is None}
+        os.write(write, json.dumps(state).encode())
+        os._exit(0)
+
+    os.close(write)
+    with os.fdopen(read) as pipe:
+        state = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+    assert state["writer"] == f"{socket.gethostname()}:{pid}"
+    assert state["writer"] != database.change_methods.writer
+    assert state["connection"]
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from app.lib.providers import frame_to_candles
+
+
+def tokyo_frame(dates):
+    dates = pd.DatetimeIndex(dates).tz_localize("Asia/Tokyo")
+    return pd.DataFrame({"date": dates, "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 10.0})
+
+
+def epoch(value):
+    return int(pd.Timestamp(value, tz="UTC").timestamp())
+
+
+def test_daily_candles_keep_the_exchange_calendar_date():
+    # the tokyo session of 2024-01-05 opens at 2024-01-04 15:00 UTC
+    candles = frame_to_candles(tokyo_frame(["2024-01-04", "2024-01-05", "2024-01-05 14:30"]), "7203.T", "1d")
+    assert candles["date"].tolist() == [epoch("2024-01-04"), epoch("2024-01-05")]
+    assert candles["interval"].tolist() == ["d1", "d1"]
+
+
+def test_weekly_candles_keep_the_exchange_calendar_date():
+    candles = frame_to_candles(tokyo_frame(["2024-01-08"]), "7203.T", "1wk")
+    assert candles["date"].tolist() == [epoch("2024-01-08")]
+
+
+def test_intraday_candles_are_floored_in_utc():
+    candles = frame_to_candles(tokyo_frame(["2024-01-05 09:00", "2024-01-05 10:00", "2024-01-05 10:42"]), "7203.T", "1h")
+    assert candles["date"].tolist() == [epoch("2024-01-05 00:00"), epoch("2024-01-05 01:00")]
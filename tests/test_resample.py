@@ -0,0 +1,31 @@
+import pytest
+
+from app.tasks.resample import download_interval
+
+
+def test_download_interval_of_a_native_interval():
+    assert download_interval("1h") == "h1"
+    assert download_interval("d1") == "d1"
+
+
+def test_download_interval_follows_the_timeframes(timeframes):
+    timeframes({"h1": ["h4", "d1"], "d1": ["w1"]})
+    assert download_interval("h4") == "h1"
+    assert download_interval("w1") == "h1"
+
+
+def test_download_interval_rejects_an_interval_the_provider_does_not_serve():
+    with pytest.raises(ValueError, match="timeframes"):
+        download_interval("h4")
+
+
+def test_refresh_h4_with_the_shipped_configuration(client, monkeypatch):
+    from app.tasks import refresh_ticker
+
+    def fetch(*args, **kwargs):
+        raise AssertionError("h4 is not downloaded")
+
+    monkeypatch.setattr(refresh_ticker, "get_provider", lambda: type("Provider", (), {"fetch": staticmethod(fetch)})())
+    response = client.get("/ohlc/BTC-USD/h4/refresh")
+    assert response.status_code == 400
+    assert "timeframes" in response.json()["detail"]